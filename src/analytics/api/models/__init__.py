@@ -1,6 +1,7 @@
 from .collection import Collection
 from .site import SiteModel
 from .events import EventsModel
+from .chart_rollups import ChartRollupModel
 from .exceedance import ExceedanceModel
 from .data_export import (
     DataExportModel,
@@ -1,20 +1,41 @@
 from flask import Flask, request, jsonify
 from datetime import datetime
-import numpy as np
 import logging
 from api.utils.pollutants.report import (
     fetch_air_quality_data,
     query_bigquery,
     results_to_dataframe,
+    to_records,
     PManalysis,
 )
+from main import cache
 
 # Configure logging
 logging.basicConfig(filename="report_log.log", level=logging.INFO, filemode="w")
 
 
-def air_quality_data():
-    data = request.get_json()
+@cache.memoize()
+def grid_report(grid_id, start_time, end_time, site_ids):
+    """
+    Computes every report rollup for a grid and period. Reports are cached per
+    (grid_id, period) and shared by the report and diurnal endpoints; None is
+    returned, and not cached, when there is no data.
+    """
+    results = query_bigquery(site_ids, start_time, end_time)
+    if results is None:
+        return None
+
+    processed_data = results_to_dataframe(results)
+    report = {
+        name: to_records(rollup)
+        for name, rollup in PManalysis.compute_rollups(processed_data).items()
+    }
+    report["grid_name"] = PManalysis.gridname(processed_data)
+    return report
+
+
+def air_quality_data(data=None):
+    data = data or request.get_json()
     grid_id = data.get("grid_id", "")
     start_time_str = data.get("start_time", "")
     end_time_str = data.get("end_time", "")
@@ -36,96 +57,31 @@ def air_quality_data():
 
     site_ids = fetch_air_quality_data(grid_id, start_time, end_time)
 
-    if site_ids:
-        results = query_bigquery(site_ids, start_time, end_time)
-        if results is not None:
-            processed_data = results_to_dataframe(results)
-            daily_mean_pm2_5 = PManalysis.mean_daily_pm2_5(processed_data)
-            datetime_mean_pm2_5 = PManalysis.datetime_pm2_5(processed_data)
-            site_mean_pm2_5 = PManalysis.mean_pm2_5_by_site_name(processed_data)
-            hour_mean_pm2_5 = PManalysis.mean_pm2_5_by_hour(processed_data)
-            pm2_5_by_month = PManalysis.mean_pm2_5_by_month(processed_data)
-            pm2_5_by_month_name = PManalysis.mean_pm2_5_by_month_name(processed_data)
-            pm2_5_by_month_year = PManalysis.mean_pm2_5_by_month_year(processed_data)
-            monthly_mean_pm_by_site_name = PManalysis.monthly_mean_pm_site_name(
-                processed_data
-            )
-            mean_pm2_5_year = PManalysis.mean_pm2_5_by_year(processed_data)
-            mean_pm_by_city = PManalysis.pm_by_city(processed_data)
-            mean_pm_by_country = PManalysis.pm_by_country(processed_data)
-            mean_pm_by_region = PManalysis.pm_by_region(processed_data)
-            mean_pm_by_day_of_week = PManalysis.pm_day_name(processed_data)
-            mean_pm_by_day_hour = PManalysis.pm_day_hour_name(processed_data)
-            mean_pm_by_site_year = PManalysis.annual_mean_pm_site_name(processed_data)
-            grid_name = PManalysis.gridname(processed_data)
-            # Convert timestamps to the desired format
-            daily_mean_pm2_5["date"] = daily_mean_pm2_5["date"].dt.strftime("%Y-%m-%d")
-            datetime_mean_pm2_5["timestamp"] = datetime_mean_pm2_5[
-                "timestamp"
-            ].dt.strftime("%Y-%m-%d %H:%M %Z")
-            #            daily_mean_pm_dict = daily_mean_pm2_5.to_dict(orient='records')
-            # Log some information for debugging or monitoring
-            logging.info(
-                "Successfully processed air quality data for grid_id %s", grid_id
-            )
-            # Prepare the response data in a structured format
-            response_data = {
-                "airquality": {
-                    "status": "success",
-                    "grid_id": grid_id,
-                    "sites": {
-                        "site_ids": site_ids,
-                        "number_of_sites": len(site_ids),
-                        "grid name": grid_name,
-                    },
-                    "period": {
-                        "startTime": start_time.isoformat(),
-                        "endTime": end_time.isoformat(),
-                    },
-                    "daily_mean_pm": daily_mean_pm2_5.to_dict(orient="records"),
-                    "datetime_mean_pm": datetime_mean_pm2_5.to_dict(orient="records"),
-                    "diurnal": hour_mean_pm2_5.to_dict(orient="records"),
-                    "annual_pm": mean_pm2_5_year.to_dict(orient="records"),
-                    "monthly_pm": pm2_5_by_month.to_dict(orient="records"),
-                    "pm_by_month_year": pm2_5_by_month_year.to_dict(orient="records"),
-                    "pm_by_month_name": pm2_5_by_month_name.to_dict(orient="records"),
-                    "site_monthly_mean_pm": monthly_mean_pm_by_site_name.to_dict(
-                        orient="records"
-                    ),
-                    "site_annual_mean_pm": mean_pm_by_site_year.to_dict(
-                        orient="records"
-                    ),
-                    "site_mean_pm": site_mean_pm2_5.to_dict(orient="records"),
-                    "mean_pm_by_city": mean_pm_by_city.to_dict(orient="records"),
-                    "mean_pm_by_country": mean_pm_by_country.to_dict(orient="records"),
-                    "mean_pm_by_region": mean_pm_by_region.to_dict(orient="records"),
-                    "mean_pm_by_day_of_week": mean_pm_by_day_of_week.to_dict(
-                        orient="records"
-                    ),
-                    "mean_pm_by_day_hour": mean_pm_by_day_hour.to_dict(
-                        orient="records"
-                    ),
-                }
-            }
+    if not site_ids:
+        return jsonify({"message": "No site IDs found for the given parameters."}), 404
 
-            def replace_nan_with_null(obj):
-                if isinstance(obj, list):
-                    return [replace_nan_with_null(item) for item in obj]
-                elif isinstance(obj, dict):
-                    return {
-                        key: replace_nan_with_null(value) for key, value in obj.items()
-                    }
-                elif isinstance(obj, float) and np.isnan(obj):
-                    return None
-                else:
-                    return obj
+    report = grid_report(grid_id, start_time, end_time, site_ids)
+    if report is None:
+        return (
+            jsonify({"message": "No data available for the given time frame."}),
+            404,
+        )
 
-            response_data = replace_nan_with_null(response_data)
-            return jsonify(response_data)
-        else:
-            return (
-                jsonify({"message": "No data available for the given time frame."}),
-                404,
-            )
-    else:
-        return jsonify({"message": "No site IDs found for the given parameters."}), 404
+    logging.info("Successfully processed air quality data for grid_id %s", grid_id)
+    response_data = {
+        "airquality": {
+            "status": "success",
+            "grid_id": grid_id,
+            "sites": {
+                "site_ids": site_ids,
+                "number_of_sites": len(site_ids),
+                "grid name": report["grid_name"],
+            },
+            "period": {
+                "startTime": start_time.isoformat(),
+                "endTime": end_time.isoformat(),
+            },
+            **{name: value for name, value in report.items() if name != "grid_name"},
+        }
+    }
+    return jsonify(response_data)
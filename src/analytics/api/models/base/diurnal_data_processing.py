@@ -1,13 +1,8 @@
 from flask import Flask, request, jsonify
 from datetime import datetime
 import logging
-import numpy as np
-from api.utils.pollutants.report import (
-    fetch_air_quality_data,
-    query_bigquery,
-    results_to_dataframe,
-    PManalysis,
-)
+from api.models.base.data_processing import grid_report
+from api.utils.pollutants.report import fetch_air_quality_data
 
 # Configure logging
 logging.basicConfig(filename="report_log.log", level=logging.INFO, filemode="w")
@@ -36,65 +31,32 @@ def air_quality_data_diurnal():
 
     site_ids = fetch_air_quality_data(grid_id, start_time, end_time)
 
-    if site_ids:
-        results = query_bigquery(site_ids, start_time, end_time)
-        if results is not None:
-            processed_data = results_to_dataframe(results)
-            daily_mean_pm2_5 = PManalysis.mean_daily_pm2_5(processed_data)
-            datetime_mean_pm2_5 = PManalysis.datetime_pm2_5(processed_data)
-            hour_mean_pm2_5 = PManalysis.mean_pm2_5_by_hour(processed_data)
-            mean_pm_by_day_hour = PManalysis.pm_day_hour_name(processed_data)
-            grid_name = PManalysis.gridname(processed_data)
-
-            # Convert timestamps to the desired format
-            daily_mean_pm2_5["date"] = daily_mean_pm2_5["date"].dt.strftime("%Y-%m-%d")
-            datetime_mean_pm2_5["timestamp"] = datetime_mean_pm2_5[
-                "timestamp"
-            ].dt.strftime("%Y-%m-%d %H:%M %Z")
-            #            daily_mean_pm_dict = daily_mean_pm2_5.to_dict(orient='records')
-            # Log some information for debugging or monitoring
-            logging.info(
-                "Successfully processed air quality data for grid_id %s", grid_id
-            )
-            # Prepare the response data in a structured format
-            response_data = {
-                "airquality": {
-                    "status": "success",
-                    "grid_id": grid_id,
-                    "sites": {
-                        "site_ids": site_ids,
-                        "number_of_sites": len(site_ids),
-                        "grid name": grid_name,
-                    },
-                    "period": {
-                        "startTime": start_time.isoformat(),
-                        "endTime": end_time.isoformat(),
-                    },
-                    "diurnal": hour_mean_pm2_5.to_dict(orient="records"),
-                    "mean_pm_by_day_hour": mean_pm_by_day_hour.to_dict(
-                        orient="records"
-                    ),
-                }
-            }
-
-            def replace_nan_with_null(obj):
-                if isinstance(obj, list):
-                    return [replace_nan_with_null(item) for item in obj]
-                elif isinstance(obj, dict):
-                    return {
-                        key: replace_nan_with_null(value) for key, value in obj.items()
-                    }
-                elif isinstance(obj, float) and np.isnan(obj):
-                    return None
-                else:
-                    return obj
-
-            response_data = replace_nan_with_null(response_data)
-            return jsonify(response_data)
-        else:
-            return (
-                jsonify({"message": "No data available for the given time frame."}),
-                404,
-            )
-    else:
+    if not site_ids:
         return jsonify({"message": "No site IDs found for the given parameters."}), 404
+
+    report = grid_report(grid_id, start_time, end_time, site_ids)
+    if report is None:
+        return (
+            jsonify({"message": "No data available for the given time frame."}),
+            404,
+        )
+
+    logging.info("Successfully processed air quality data for grid_id %s", grid_id)
+    response_data = {
+        "airquality": {
+            "status": "success",
+            "grid_id": grid_id,
+            "sites": {
+                "site_ids": site_ids,
+                "number_of_sites": len(site_ids),
+                "grid name": report["grid_name"],
+            },
+            "period": {
+                "startTime": start_time.isoformat(),
+                "endTime": end_time.isoformat(),
+            },
+            "diurnal": report["diurnal"],
+            "mean_pm_by_day_hour": report["mean_pm_by_day_hour"],
+        }
+    }
+    return jsonify(response_data)
@@ -254,13 +254,20 @@ class ChainableMongoOperations(BaseMongoOperations):
             # self.add_stages([{"$in": [f'${field}', value]}])
         return self
 
-    def _aggregate_exec(self, projections):
+    def pipeline(self):
+        """
+        Returns the aggregation stages chained so far, starting with the $match stage of the filters
+        """
         stages = (
             [{"$match": self.match_stage}]
             if self.match_stage.get(self.init_match_expr)
             else []
         )
         stages.extend(self.stages)
+        return stages
+
+    def _aggregate_exec(self, projections):
+        stages = self.pipeline()
 
         if projections:
             mongo_db_project_operator = projections
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+from api.models.base.base_model import BasePyMongoModel
+
+# Margin taken on the late values watermark, for the clocks of the services writing the events.
+LATE_VALUES_MARGIN = timedelta(minutes=5)
+
+
+def floor_hour(date):
+    return date.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(date):
+    hour = floor_hour(date)
+    return hour if hour == date else hour + timedelta(hours=1)
+
+
+class ChartRollupModel(BasePyMongoModel):
+    """
+    Hourly per site sums and counts of the raw pollutant values in the events collection.
+
+    Documents are keyed by `{"site_id": ..., "time": ...}` with `time` the UTC start of the hour, and hold a
+    `{"sum": ..., "count": ...}` document per pollutant so that any coarser (Africa/Kampala) bucket can be
+    averaged exactly from them. The rolled up period is tracked in the state collection so that charts are only
+    served from the rollups when they fully cover the requested period, along with the watermark of the last scan
+    for values written late into already rolled up hours.
+    """
+
+    COLLECTION_NAME = "hourly_chart_rollups"
+    STATE_COLLECTION_NAME = "chart_rollups_state"
+    LATE_VALUES_STATE_ID = "late_values"
+
+    def __init__(self, tenant):
+        super().__init__(tenant, collection_name=self.COLLECTION_NAME)
+        self.state_collection = self.db[self.STATE_COLLECTION_NAME]
+
+    def ensure_indexes(self):
+        self.collection.create_index([("site_id", ASCENDING), ("time", ASCENDING)])
+
+    def get_coverage(self):
+        return self.state_collection.find_one({"_id": self.COLLECTION_NAME})
+
+    def covers(self, start, end):
+        coverage = self.get_coverage()
+        return bool(coverage and coverage["start"] <= start and end <= coverage["end"])
+
+    def update_coverage(self, start, end):
+        """
+        Extends the rolled up period with [start, end). A period that does not overlap or touch the current one
+        replaces it only when it is more recent, since the rollups are kept current from the latest hours.
+        """
+        coverage = self.get_coverage()
+        if coverage and start <= coverage["end"] and coverage["start"] <= end:
+            start = min(start, coverage["start"])
+            end = max(end, coverage["end"])
+        elif coverage and end < coverage["start"]:
+            return
+
+        self.state_collection.replace_one(
+            {"_id": self.COLLECTION_NAME},
+            {"start": start, "end": end, "updated_at": datetime.utcnow()},
+            upsert=True,
+        )
+
+    def get_late_values_watermark(self):
+        state = self.state_collection.find_one({"_id": self.LATE_VALUES_STATE_ID})
+        return state and state["scanned_at"] - LATE_VALUES_MARGIN
+
+    def set_late_values_watermark(self, scanned_at):
+        self.state_collection.replace_one(
+            {"_id": self.LATE_VALUES_STATE_ID},
+            {"scanned_at": scanned_at},
+            upsert=True,
+        )
+
+    def chart_values(self, sites, start, end, pollutant, time_format):
+        """
+        Chains the stages grouping the rolled up hours of the sites between the whole hours start and end into
+        `time_format` buckets, yielding `{"site_id", "time", "sum", "count"}` documents.
+        """
+        return (
+            self.in_filter_by(site_id=list(self.to_object_ids(sites)))
+            .filter_by(time={"$gte": start, "$lt": end})
+            .project(
+                _id=0,
+                site_id={"$toString": "$site_id"},
+                time={
+                    "$dateToString": {
+                        "format": time_format,
+                        "date": "$time",
+                        "timezone": "Africa/Kampala",
+                    }
+                },
+                sum=f"${pollutant}.sum",
+                count=f"${pollutant}.count",
+            )
+            .group(
+                _id={"site_id": "$site_id", "time": "$time"},
+                site_id={"$first": "$site_id"},
+                time={"$first": "$time"},
+                sum={"$sum": "$sum"},
+                count={"$sum": "$count"},
+            )
+            .match(count={"$gt": 0})
+        )
+
+    @staticmethod
+    def lookback_period(hours, now=None):
+        end = floor_hour(now or datetime.utcnow()) + timedelta(hours=1)
+        return end - timedelta(hours=hours + 1), end
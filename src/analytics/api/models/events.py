@@ -1,18 +1,29 @@
-from datetime import datetime
+import hashlib
+from datetime import datetime, timedelta
+from typing import Iterator, Tuple
 
 import numpy as np
 import pandas as pd
 import pytz
+from bson import ObjectId
 from google.cloud import bigquery
 
 from api.models.base.base_model import BasePyMongoModel
-from api.utils.dates import date_to_str
+from api.models.chart_rollups import ChartRollupModel, ceil_hour, floor_hour
+from api.utils.cache import TwoTierCache
+from api.utils.dates import date_to_str, str_to_date
 from api.utils.pollutants.pm_25 import (
     BIGQUERY_FREQUENCY_MAPPER,
     WEATHER_FIELDS_MAPPER,
 )
 from main import cache, CONFIGURATIONS
 
+chart_cache = TwoTierCache(
+    cache,
+    maxsize=CONFIGURATIONS.CHART_LOCAL_CACHE_SIZE,
+    local_timeout=CONFIGURATIONS.CHART_LOCAL_CACHE_TIMEOUT,
+)
+
 
 class EventsModel(BasePyMongoModel):
     BIGQUERY_AIRQLOUDS_SITES = f"`{CONFIGURATIONS.BIGQUERY_AIRQLOUDS_SITES}`"
@@ -27,6 +38,8 @@ class EventsModel(BasePyMongoModel):
 
     BIGQUERY_EVENTS = CONFIGURATIONS.BIGQUERY_EVENTS
     DATA_EXPORT_LIMIT = CONFIGURATIONS.DATA_EXPORT_LIMIT
+    DATA_EXPORT_STREAM_LIMIT = CONFIGURATIONS.DATA_EXPORT_STREAM_LIMIT
+    DATA_EXPORT_PAGE_SIZE = CONFIGURATIONS.DATA_EXPORT_PAGE_SIZE
     BIGQUERY_MOBILE_EVENTS = CONFIGURATIONS.BIGQUERY_MOBILE_EVENTS
 
     BIGQUERY_RAW_DATA = f"`{CONFIGURATIONS.BIGQUERY_RAW_DATA}`"
@@ -41,8 +54,7 @@ class EventsModel(BasePyMongoModel):
         super().__init__(tenant, collection_name="events")
 
     @classmethod
-    @cache.memoize()
-    def download_from_bigquery(
+    def download_query(
         cls,
         devices,
         sites,
@@ -52,7 +64,12 @@ class EventsModel(BasePyMongoModel):
         frequency,
         pollutants,
         weather_fields,
-    ) -> pd.DataFrame:
+        limit,
+    ) -> str:
+        """
+        Builds the data download query. Duplicate (datetime, device_name) rows are
+        removed and the rows sorted in the query so that results can be streamed.
+        """
         decimal_places = cls.DATA_EXPORT_DECIMAL_PLACES
 
         # Data sources
@@ -75,10 +92,12 @@ class EventsModel(BasePyMongoModel):
         pollutant_columns = []
         bam_pollutant_columns = []
         weather_columns = []
+        value_columns = []
         for pollutant in pollutants:
             pollutant_mapping = BIGQUERY_FREQUENCY_MAPPER.get(frequency).get(
                 pollutant, []
             )
+            value_columns.extend(pollutant_mapping)
             pollutant_columns.extend(
                 [
                     f"ROUND({data_table}.{mapping}, {decimal_places}) AS {mapping}"
@@ -102,6 +121,7 @@ class EventsModel(BasePyMongoModel):
         if weather_fields is not None:
             for field in weather_fields:
                 weather_mapping = WEATHER_FIELDS_MAPPER.get(field, None)
+                value_columns.append(weather_mapping)
                 weather_columns.extend(
                     [
                         f"ROUND({data_table}.{weather_mapping}, {decimal_places}) AS {weather_mapping}"
@@ -250,28 +270,95 @@ class EventsModel(BasePyMongoModel):
                 f" ORDER BY {data_table}.timestamp "
             )
 
+        # of the duplicate rows, the one with the most values is kept, then the first of the rest by content so
+        # that the same row is kept on every run
+        non_null_values = " + ".join(
+            f"IF({column} IS NULL, 0, 1)" for column in sorted(set(value_columns))
+        )
+        dedup_order = (
+            f"{non_null_values} DESC, TO_JSON_STRING(data)"
+            if non_null_values
+            else "TO_JSON_STRING(data)"
+        )
+
+        return (
+            f" SELECT * EXCEPT (row_num), '{frequency}' AS frequency FROM ( "
+            f" SELECT *, ROW_NUMBER() OVER (PARTITION BY datetime, device_name ORDER BY {dedup_order}) AS row_num "
+            f" FROM (SELECT DISTINCT * FROM ({query})) data "
+            f" ) WHERE row_num = 1 "
+            f" ORDER BY {', '.join(f'{col} NULLS LAST' for col in sorting_cols)} "
+            f" LIMIT {limit}"
+        )
+
+    @classmethod
+    @cache.memoize()
+    def download_from_bigquery(
+        cls,
+        devices,
+        sites,
+        airqlouds,
+        start_date,
+        end_date,
+        frequency,
+        pollutants,
+        weather_fields,
+    ) -> pd.DataFrame:
+        query = cls.download_query(
+            devices=devices,
+            sites=sites,
+            airqlouds=airqlouds,
+            start_date=start_date,
+            end_date=end_date,
+            frequency=frequency,
+            pollutants=pollutants,
+            weather_fields=weather_fields,
+            limit=cls.DATA_EXPORT_LIMIT,
+        )
+
         job_config = bigquery.QueryJobConfig()
         job_config.use_query_cache = True
-        dataframe = (
-            bigquery.Client()
-            .query(
-                f"select distinct * from ({query}) limit {cls.DATA_EXPORT_LIMIT}",
-                job_config,
-            )
-            .result()
-            .to_dataframe()
-        )
+        dataframe = bigquery.Client().query(query, job_config).result().to_dataframe()
 
-        if len(dataframe) == 0:
-            return dataframe
+        return dataframe.replace(np.nan, None)
 
-        dataframe.drop_duplicates(
-            subset=["datetime", "device_name"], inplace=True, keep="first"
+    @classmethod
+    def stream_from_bigquery(
+        cls,
+        devices,
+        sites,
+        airqlouds,
+        start_date,
+        end_date,
+        frequency,
+        pollutants,
+        weather_fields,
+    ) -> Tuple[int, Iterator[pd.DataFrame]]:
+        """
+        Runs the data download query and returns the total number of rows together
+        with an iterator over the result pages, so that only one page of
+        `DATA_EXPORT_PAGE_SIZE` rows is held in memory at a time.
+        """
+        query = cls.download_query(
+            devices=devices,
+            sites=sites,
+            airqlouds=airqlouds,
+            start_date=start_date,
+            end_date=end_date,
+            frequency=frequency,
+            pollutants=pollutants,
+            weather_fields=weather_fields,
+            limit=cls.DATA_EXPORT_STREAM_LIMIT,
+        )
+
+        job_config = bigquery.QueryJobConfig()
+        job_config.use_query_cache = True
+        rows = (
+            bigquery.Client()
+            .query(query, job_config)
+            .result(page_size=cls.DATA_EXPORT_PAGE_SIZE)
         )
-        dataframe.sort_values(sorting_cols, ascending=True, inplace=True)
-        dataframe["frequency"] = frequency
-        dataframe = dataframe.replace(np.nan, None)
-        return dataframe
+
+        return rows.total_rows, rows.to_dataframe_iterable()
 
     @classmethod
     def data_export_query(
@@ -884,49 +971,304 @@ class EventsModel(BasePyMongoModel):
 
         return dataframe
 
-    @cache.memoize()
-    def get_chart_events(self, sites, start_date, end_date, pollutant, frequency):
-        time_format_mapper = {
-            "raw": "%Y-%m-%dT%H:%M:%S%z",
-            "hourly": "%Y-%m-%d %H:00",
-            "daily": "%Y-%m-%d",
-            "monthly": "%Y-%m-01",
+    @staticmethod
+    def chart_cache_key(
+        name, tenant, sites, start_date, end_date, pollutant, frequency
+    ):
+        """
+        Builds a cache key that is the same for equivalent chart requests, whatever the order or repetition of
+        the sites and the precision of the dates.
+        """
+        sites_digest = hashlib.sha1(
+            ",".join(sorted(set(sites))).encode("utf-8")
+        ).hexdigest()
+        start = str_to_date(start_date).isoformat()
+        end = end_date and str_to_date(end_date).isoformat()
+        return f"{name}:{tenant}:{pollutant}:{frequency}:{start}:{end}:{sites_digest}"
+
+    def ensure_chart_indexes(self):
+        self.collection.create_index(
+            [
+                ("values.site_id", self.ASCENDING),
+                ("values.time", self.ASCENDING),
+                ("values.frequency", self.ASCENDING),
+            ]
+        )
+        self.collection.create_index([("updatedAt", self.ASCENDING)])
+        ChartRollupModel(self.tenant).ensure_indexes()
+
+    def roll_up_chart_events(self, start, end, sites=None):
+        """
+        Rolls the raw values between start and end up into hourly per site sums and counts of each pollutant,
+        replacing the rolled up hours in the chart rollups collection. Values outside the pollutant limits are
+        left out, as they are from the charts.
+
+        Args:
+            start (datetime): the start of the period, floored to the hour
+            end (datetime): the end of the period, ceiled to the hour
+            sites (list): the ObjectIds of the sites to roll up, all of them by default. The covered period is
+                only extended when all the sites are rolled up.
+        """
+        rollup_model = ChartRollupModel(self.tenant)
+        start = floor_hour(start)
+        end = ceil_hour(end)
+        period = {
+            "values.time": {"$gte": start, "$lt": end},
+            "values.frequency": "raw",
         }
+        if sites is not None:
+            period["values.site_id"] = {"$in": list(sites)}
 
-        return (
-            self.project(
-                **{"values.time": 1, "values.site_id": 1, f"values.{pollutant}": 1}
+        sums = {}
+        for pollutant, limit in self.limit_mapper.items():
+            value = f"$values.{pollutant}.value"
+            is_valid = {"$and": [{"$gte": [value, 0]}, {"$lte": [value, limit]}]}
+            sums[f"{pollutant}_sum"] = {"$sum": {"$cond": [is_valid, value, 0]}}
+            sums[f"{pollutant}_count"] = {"$sum": {"$cond": [is_valid, 1, 0]}}
+
+        self.aggregate(
+            [
+                {"$match": period},
+                {
+                    "$project": {
+                        "values.time": 1,
+                        "values.site_id": 1,
+                        "values.frequency": 1,
+                        **{
+                            f"values.{pollutant}.value": 1
+                            for pollutant in self.limit_mapper
+                        },
+                    }
+                },
+                {"$unwind": "$values"},
+                {"$match": period},
+                {
+                    "$group": {
+                        "_id": {
+                            "site_id": "$values.site_id",
+                            "time": {
+                                "$dateFromParts": {
+                                    "year": {"$year": "$values.time"},
+                                    "month": {"$month": "$values.time"},
+                                    "day": {"$dayOfMonth": "$values.time"},
+                                    "hour": {"$hour": "$values.time"},
+                                }
+                            },
+                        },
+                        **sums,
+                    }
+                },
+                {
+                    "$project": {
+                        "site_id": "$_id.site_id",
+                        "time": "$_id.time",
+                        **{
+                            pollutant: {
+                                "sum": f"${pollutant}_sum",
+                                "count": f"${pollutant}_count",
+                            }
+                            for pollutant in self.limit_mapper
+                        },
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": rollup_model.COLLECTION_NAME,
+                        "on": "_id",
+                        "whenMatched": "replace",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ]
+        )
+        if sites is None:
+            rollup_model.update_coverage(start, end)
+
+    def roll_up_late_chart_events(self, before):
+        """
+        Rolls up again the hours before `before` that received values since the last scan, such as the values
+        of devices syncing after being offline or of backfills, which the periodic roll up of the latest hours
+        misses. Late values are thus served in the charts within a roll up interval. The values written since
+        the last scan are told apart by the creation time of their ObjectId, all the values of the events
+        updated since then being rolled up again when they have none. The first scan only records its
+        watermark, older hours being rolled up by the backfill script.
+        """
+        rollup_model = ChartRollupModel(self.tenant)
+        scanned_at = datetime.utcnow()
+        since = rollup_model.get_late_values_watermark()
+
+        if since is not None:
+            late_periods = self.aggregate(
+                [
+                    {
+                        "$match": {
+                            "updatedAt": {"$gte": since},
+                            "first": {"$lt": before},
+                        }
+                    },
+                    {"$project": {"site_id": 1, "values.time": 1, "values._id": 1}},
+                    {"$unwind": "$values"},
+                    {
+                        "$match": {
+                            "values.time": {"$lt": before},
+                            "$or": [
+                                {"values._id": {"$gte": ObjectId.from_datetime(since)}},
+                                {"values._id": {"$exists": False}},
+                            ],
+                        }
+                    },
+                    {
+                        "$group": {
+                            "_id": "$site_id",
+                            "start": {"$min": "$values.time"},
+                            "end": {"$max": "$values.time"},
+                        }
+                    },
+                ]
             )
-            .date_range("values.time", start_date=start_date, end_date=end_date)
+            for late_period in late_periods:
+                self.roll_up_chart_events(
+                    late_period["start"],
+                    late_period["end"] + timedelta(microseconds=1),
+                    sites=[late_period["_id"]],
+                )
+
+        rollup_model.set_late_values_watermark(scanned_at)
+
+    def raw_chart_values(self, sites, start, end, pollutant, time_format):
+        """
+        Chains the stages grouping the raw values of the sites into `time_format` buckets, yielding
+        `{"site_id", "time", "sum", "count"}` documents. The site, time and frequency predicates are applied
+        before unwinding, where they can use the compound index on the values, and again on the unwound values
+        since a matching document can hold values of other sites and times.
+        """
+        site_ids = list(self.to_object_ids(sites))
+        predicates = {
+            "values.site_id": {"$in": site_ids},
+            "values.time": {"$gte": start, "$lt": end},
+            "values.frequency": "raw",
+        }
+
+        return (
+            self.in_filter_by(**{"values.site_id": site_ids})
+            .filter_by(**{"values.time": predicates["values.time"]})
             .filter_by(**{"values.frequency": "raw"})
+            .project(
+                **{"values.time": 1, "values.site_id": 1, "values.frequency": 1},
+                **{f"values.{pollutant}": 1},
+            )
             .unwind("values")
+            .match(**predicates)
             .replace_root("values")
+            .remove_outliers(pollutant)
             .project(
                 _id=0,
+                site_id={"$toString": "$site_id"},
                 time={
                     "$dateToString": {
-                        "format": time_format_mapper.get(frequency)
-                        or time_format_mapper.get("hourly"),
+                        "format": time_format,
                         "date": "$time",
                         "timezone": "Africa/Kampala",
                     }
                 },
-                **{f"{pollutant}.value": 1},
-                site_id={"$toString": "$site_id"},
+                value=f"${pollutant}.value",
             )
-            .remove_outliers(pollutant)
-            .match_in(site_id=sites)
             .group(
                 _id={"site_id": "$site_id", "time": "$time"},
+                site_id={"$first": "$site_id"},
                 time={"$first": "$time"},
-                value={"$avg": f"${pollutant}.value"},
+                sum={"$sum": "$value"},
+                count={"$sum": 1},
+            )
+        )
+
+    def chart_values(
+        self, sites, start_date, end_date, pollutant, frequency, time_format
+    ):
+        """
+        Chains the stages yielding the `{"site_id", "time", "sum", "count"}` buckets of a chart. The whole hours
+        of the period are read from the hourly rollups when they cover them, and the partial hours at its ends
+        from the raw values, so that the buckets hold exactly the values of the period. Raw frequency charts and
+        periods that the rollups do not cover read the raw values only.
+        """
+        start = str_to_date(start_date)
+        end = end_date and str_to_date(end_date) or datetime.now()
+        hours_start, hours_end = ceil_hour(start), floor_hour(end)
+
+        rollup_model = ChartRollupModel(self.tenant)
+        if (
+            frequency == "raw"
+            or hours_start >= hours_end
+            or not rollup_model.covers(hours_start, hours_end)
+        ):
+            return self.raw_chart_values(sites, start, end, pollutant, time_format)
+
+        rollup_model.chart_values(sites, hours_start, hours_end, pollutant, time_format)
+        partial_hours = [(start, hours_start), (hours_end, end)]
+        for partial_start, partial_end in partial_hours:
+            if partial_start < partial_end:
+                raw_values = EventsModel(self.tenant).raw_chart_values(
+                    sites, partial_start, partial_end, pollutant, time_format
+                )
+                rollup_model.add_stages(
+                    [
+                        {
+                            "$unionWith": {
+                                "coll": self.collection_name,
+                                "pipeline": raw_values.pipeline(),
+                            }
+                        }
+                    ]
+                )
+
+        return rollup_model.group(
+            _id={"site_id": "$site_id", "time": "$time"},
+            site_id={"$first": "$site_id"},
+            time={"$first": "$time"},
+            sum={"$sum": "$sum"},
+            count={"$sum": "$count"},
+        )
+
+    def get_chart_events(self, sites, start_date, end_date, pollutant, frequency):
+        key = self.chart_cache_key(
+            "chart_events",
+            self.tenant,
+            sites,
+            start_date,
+            end_date,
+            pollutant,
+            frequency,
+        )
+        return chart_cache.get_or_set(
+            key,
+            lambda: self._get_chart_events(
+                sites, start_date, end_date, pollutant, frequency
+            ),
+        )
+
+    def _get_chart_events(self, sites, start_date, end_date, pollutant, frequency):
+        time_format_mapper = {
+            "raw": "%Y-%m-%dT%H:%M:%S%z",
+            "hourly": "%Y-%m-%d %H:00",
+            "daily": "%Y-%m-%d",
+            "monthly": "%Y-%m-01",
+        }
+
+        return (
+            self.chart_values(
+                sites,
+                start_date,
+                end_date,
+                pollutant,
+                frequency,
+                time_format_mapper.get(frequency) or time_format_mapper.get("hourly"),
             )
             .group(
-                _id="$_id.site_id",
+                _id="$site_id",
                 values={
                     "$push": {
                         "time": "$time",
-                        "value": {"$round": ["$value", 2]},
+                        "value": {"$round": [{"$divide": ["$sum", "$count"]}, 2]},
                     }
                 },
             )
@@ -942,8 +1284,24 @@ class EventsModel(BasePyMongoModel):
             .exec()
         )
 
-    @cache.memoize()
     def get_d3_chart_events(self, sites, start_date, end_date, pollutant, frequency):
+        key = self.chart_cache_key(
+            "d3_chart_events",
+            self.tenant,
+            sites,
+            start_date,
+            end_date,
+            pollutant,
+            frequency,
+        )
+        return chart_cache.get_or_set(
+            key,
+            lambda: self._get_d3_chart_events(
+                sites, start_date, end_date, pollutant, frequency
+            ),
+        )
+
+    def _get_d3_chart_events(self, sites, start_date, end_date, pollutant, frequency):
         diurnal_end_date = datetime.strptime(end_date, "%Y-%m-%dT%H:%M:%S.%fZ").replace(
             tzinfo=pytz.utc
         )
@@ -959,36 +1317,21 @@ class EventsModel(BasePyMongoModel):
         }
 
         return (
-            self.project(
-                **{"values.time": 1, "values.site_id": 1, f"values.{pollutant}": 1}
+            self.chart_values(
+                sites,
+                start_date,
+                end_date,
+                pollutant,
+                frequency,
+                time_format_mapper.get(frequency) or time_format_mapper.get("hourly"),
             )
-            .date_range("values.time", start_date=start_date, end_date=end_date)
-            .match_in(**{"values.site_id": self.to_object_ids(sites)})
-            .filter_by(**{"values.frequency": "raw"})
-            .unwind("values")
-            .replace_root("values")
+            .sort(time=self.ASCENDING)
             .project(
                 _id=0,
-                time={
-                    "$dateToString": {
-                        "format": time_format_mapper.get(frequency)
-                        or time_format_mapper.get("hourly"),
-                        "date": "$time",
-                        "timezone": "Africa/Kampala",
-                    }
-                },
-                **{f"{pollutant}.value": 1},
-                site_id={"$toString": "$site_id"},
-            )
-            .remove_outliers(pollutant)
-            .group(
-                _id={"site_id": "$site_id", "time": "$time"},
-                time={"$first": "$time"},
-                site_id={"$first": "$site_id"},
-                value={"$avg": f"${pollutant}.value"},
+                site_id={"$toObjectId": "$site_id"},
+                time=1,
+                value={"$divide": ["$sum", "$count"]},
             )
-            .sort(time=self.ASCENDING)
-            .project(_id=0, site_id={"$toObjectId": "$site_id"}, time=1, value=1)
             .lookup("sites", local_field="site_id", foreign_field="_id", col_as="site")
             .project(
                 _id=0,
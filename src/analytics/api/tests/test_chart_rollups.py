@@ -0,0 +1,240 @@
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from bson import ObjectId
+
+from api.models.chart_rollups import ChartRollupModel, ceil_hour, floor_hour
+from api.utils.cache import TwoTierCache
+
+with patch("google.cloud.bigquery.Client"):
+    from api.models.events import EventsModel
+
+
+class SharedCache:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.values[key] = value
+
+
+@pytest.fixture
+def rollup_model():
+    model = ChartRollupModel.__new__(ChartRollupModel)
+    model.state_collection = MagicMock()
+    return model
+
+
+def test_two_tier_cache():
+    shared_cache = SharedCache()
+    cache = TwoTierCache(shared_cache, maxsize=2)
+    compute = MagicMock(side_effect=lambda: ["chart"])
+
+    assert cache.get_or_set("a", compute) == ["chart"]
+    assert cache.get_or_set("a", compute) == ["chart"]
+    assert compute.call_count == 1
+    assert shared_cache.values == {"a": ["chart"]}
+
+    # another worker finds the value in the shared tier
+    other_cache = TwoTierCache(shared_cache)
+    assert other_cache.get_or_set("a", compute) == ["chart"]
+    assert compute.call_count == 1
+
+
+def test_two_tier_cache_local_eviction():
+    shared_cache = SharedCache()
+    cache = TwoTierCache(shared_cache, maxsize=2, local_timeout=60)
+
+    with patch("api.utils.cache.time.monotonic", return_value=0):
+        for key in ["a", "b", "c"]:
+            cache.get_or_set(key, lambda: key)
+        assert list(cache._entries) == ["b", "c"]
+
+    shared_cache.values["c"] = "updated"
+    with patch("api.utils.cache.time.monotonic", return_value=30):
+        assert cache.get_or_set("c", lambda: "computed") == "c"
+    with patch("api.utils.cache.time.monotonic", return_value=61):
+        assert cache.get_or_set("c", lambda: "computed") == "updated"
+
+    cache.clear_local()
+    assert not cache._entries
+
+
+def test_chart_cache_key():
+    key = EventsModel.chart_cache_key(
+        "chart_events",
+        "airqo",
+        ["site_2", "site_1", "site_2"],
+        "2024-01-01T00:00:00.000Z",
+        "2024-01-02T00:00:00.000Z",
+        "pm2_5",
+        "hourly",
+    )
+
+    assert key == EventsModel.chart_cache_key(
+        "chart_events",
+        "airqo",
+        ["site_1", "site_2"],
+        "2024-01-01T00:00:00.000000Z",
+        "2024-01-02T00:00:00.000000Z",
+        "pm2_5",
+        "hourly",
+    )
+    assert key != EventsModel.chart_cache_key(
+        "chart_events",
+        "airqo",
+        ["site_1", "site_2"],
+        "2024-01-01T00:00:00.000Z",
+        "2024-01-02T00:00:00.000Z",
+        "pm2_5",
+        "daily",
+    )
+
+
+def test_floor_and_ceil_hour():
+    assert floor_hour(datetime(2024, 1, 1, 10, 30)) == datetime(2024, 1, 1, 10)
+    assert ceil_hour(datetime(2024, 1, 1, 10, 30)) == datetime(2024, 1, 1, 11)
+    assert ceil_hour(datetime(2024, 1, 1, 10)) == datetime(2024, 1, 1, 10)
+
+
+def test_covers(rollup_model):
+    rollup_model.state_collection.find_one.return_value = {
+        "start": datetime(2024, 1, 1),
+        "end": datetime(2024, 1, 10),
+    }
+
+    assert rollup_model.covers(datetime(2024, 1, 1), datetime(2024, 1, 10))
+    assert rollup_model.covers(datetime(2024, 1, 2), datetime(2024, 1, 5))
+    assert not rollup_model.covers(datetime(2023, 12, 31, 23), datetime(2024, 1, 5))
+    assert not rollup_model.covers(datetime(2024, 1, 2), datetime(2024, 1, 10, 1))
+
+    rollup_model.state_collection.find_one.return_value = None
+    assert not rollup_model.covers(datetime(2024, 1, 2), datetime(2024, 1, 5))
+
+
+@pytest.mark.parametrize(
+    "coverage, start, end, expected",
+    [
+        # first roll up
+        (None, datetime(2024, 1, 5), datetime(2024, 1, 6), (5, 6)),
+        # overlapping and touching periods are merged
+        ((5, 8), datetime(2024, 1, 7), datetime(2024, 1, 9), (5, 9)),
+        ((5, 8), datetime(2024, 1, 3), datetime(2024, 1, 5), (3, 8)),
+        # a more recent period replaces the covered one
+        ((5, 8), datetime(2024, 1, 9), datetime(2024, 1, 10), (9, 10)),
+        # an older one is ignored
+        ((5, 8), datetime(2024, 1, 1), datetime(2024, 1, 2), None),
+    ],
+)
+def test_update_coverage(rollup_model, coverage, start, end, expected):
+    rollup_model.state_collection.find_one.return_value = coverage and {
+        "start": datetime(2024, 1, coverage[0]),
+        "end": datetime(2024, 1, coverage[1]),
+    }
+
+    rollup_model.update_coverage(start, end)
+
+    if expected is None:
+        rollup_model.state_collection.replace_one.assert_not_called()
+    else:
+        state = rollup_model.state_collection.replace_one.call_args.args[1]
+        assert (state["start"], state["end"]) == (
+            datetime(2024, 1, expected[0]),
+            datetime(2024, 1, expected[1]),
+        )
+
+
+@patch("api.models.base.base_model.MongoClient", MagicMock())
+@patch.object(ChartRollupModel, "covers", return_value=True)
+def test_chart_values_reads_partial_hours_from_raw_values(covers):
+    site_id = str(ObjectId())
+    stages = (
+        EventsModel("airqo")
+        .chart_values(
+            [site_id],
+            "2024-01-01T10:30:00.000Z",
+            "2024-01-01T15:15:00.000Z",
+            "pm2_5",
+            "daily",
+            "%Y-%m-%d",
+        )
+        .pipeline()
+    )
+
+    covers.assert_called_once_with(datetime(2024, 1, 1, 11), datetime(2024, 1, 1, 15))
+    assert stages[0]["$match"]["$and"][1] == {
+        "time": {"$gte": datetime(2024, 1, 1, 11), "$lt": datetime(2024, 1, 1, 15)}
+    }
+    unions = [stage["$unionWith"] for stage in stages if "$unionWith" in stage]
+    assert [
+        union["pipeline"][0]["$match"]["$and"][1]["values.time"] for union in unions
+    ] == [
+        {"$gte": datetime(2024, 1, 1, 10, 30), "$lt": datetime(2024, 1, 1, 11)},
+        {"$gte": datetime(2024, 1, 1, 15), "$lt": datetime(2024, 1, 1, 15, 15)},
+    ]
+    assert "$group" in stages[-1]
+
+
+@patch("api.models.base.base_model.MongoClient", MagicMock())
+@patch.object(ChartRollupModel, "covers", return_value=True)
+def test_chart_values_reads_raw_values_within_an_hour(covers):
+    stages = (
+        EventsModel("airqo")
+        .chart_values(
+            [str(ObjectId())],
+            "2024-01-01T10:15:00.000Z",
+            "2024-01-01T10:45:00.000Z",
+            "pm2_5",
+            "hourly",
+            "%Y-%m-%d %H:00",
+        )
+        .pipeline()
+    )
+
+    covers.assert_not_called()
+    assert not any("$unionWith" in stage for stage in stages)
+
+
+@patch("api.models.base.base_model.MongoClient", MagicMock())
+@patch.object(ChartRollupModel, "set_late_values_watermark")
+@patch.object(
+    ChartRollupModel,
+    "get_late_values_watermark",
+    return_value=datetime(2024, 1, 10, 11, 55),
+)
+def test_roll_up_late_chart_events(get_watermark, set_watermark):
+    site_id = ObjectId()
+    events_model = EventsModel("airqo")
+    events_model.aggregate = MagicMock(
+        return_value=[
+            {
+                "_id": site_id,
+                "start": datetime(2024, 1, 3, 8, 10),
+                "end": datetime(2024, 1, 3, 17, 40),
+            }
+        ]
+    )
+    events_model.roll_up_chart_events = MagicMock()
+
+    events_model.roll_up_late_chart_events(before=datetime(2024, 1, 10, 9))
+
+    stages = events_model.aggregate.call_args.args[0]
+    assert stages[0]["$match"] == {
+        "updatedAt": {"$gte": datetime(2024, 1, 10, 11, 55)},
+        "first": {"$lt": datetime(2024, 1, 10, 9)},
+    }
+    # only the values written since the watermark
+    assert stages[3]["$match"]["$or"][0] == {
+        "values._id": {"$gte": ObjectId.from_datetime(datetime(2024, 1, 10, 11, 55))}
+    }
+    start, end = events_model.roll_up_chart_events.call_args.args
+    assert (floor_hour(start), ceil_hour(end)) == (
+        datetime(2024, 1, 3, 8),
+        datetime(2024, 1, 3, 18),
+    )
+    assert events_model.roll_up_chart_events.call_args.kwargs == {"sites": [site_id]}
+    set_watermark.assert_called_once()
@@ -0,0 +1,171 @@
+import json
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+from api.utils.data_formatters import format_export_chunks
+
+with patch("google.cloud.bigquery.Client"):
+    from api.models import EventsModel
+    from api.views.data import DataExportResource
+
+
+@pytest.fixture
+def pages():
+    return [
+        pd.DataFrame({"device_name": ["aq_1", "aq_2"], "pm2_5": [10.5, 12.0]}),
+        pd.DataFrame(columns=["device_name", "pm2_5"]),
+        pd.DataFrame({"device_name": ["aq_3"], "pm2_5": [8.25]}),
+    ]
+
+
+def test_format_export_chunks_csv(pages):
+    chunks = list(
+        format_export_chunks(
+            iter(pages),
+            download_type="csv",
+            output_format="airqo-standard",
+            frequency="hourly",
+            pollutants=["pm2_5"],
+        )
+    )
+
+    assert chunks == ["device_name,pm2_5\naq_1,10.5\naq_2,12.0\n", "aq_3,8.25\n"]
+
+
+def test_format_export_chunks_json(pages):
+    chunks = list(
+        format_export_chunks(
+            iter(pages),
+            download_type="json",
+            output_format="airqo-standard",
+            frequency="hourly",
+            pollutants=["pm2_5"],
+        )
+    )
+
+    assert len(chunks) == 2
+    assert all(chunk.endswith("\n") for chunk in chunks)
+    assert [json.loads(line) for line in "".join(chunks).splitlines()] == [
+        {"device_name": "aq_1", "pm2_5": 10.5},
+        {"device_name": "aq_2", "pm2_5": 12.0},
+        {"device_name": "aq_3", "pm2_5": 8.25},
+    ]
+
+
+def test_format_export_chunks_aqcsv(pages):
+    with patch(
+        "api.utils.data_formatters.format_to_aqcsv",
+        side_effect=lambda data, pollutants, frequency: [
+            {"site_id": row["device_name"], "value": row["pm2_5"]} for row in data
+        ],
+    ) as mock_format_to_aqcsv:
+        chunks = list(
+            format_export_chunks(
+                iter(pages),
+                download_type="csv",
+                output_format="aqcsv",
+                frequency="hourly",
+                pollutants=["pm2_5"],
+            )
+        )
+
+    assert mock_format_to_aqcsv.call_count == 2
+    assert chunks == ["site_id,value\naq_1,10.5\naq_2,12.0\n", "aq_3,8.25\n"]
+
+
+def stream_download(total_rows, pages, download_type="csv"):
+    with patch(
+        "api.views.data.EventsModel.stream_from_bigquery",
+        return_value=(total_rows, iter(pages)),
+    ):
+        return DataExportResource.stream(
+            sites=["site_1"],
+            devices=[],
+            airqlouds=[],
+            start_date="2024-01-01T00:00:00.000000Z",
+            end_date="2024-01-02T00:00:00.000000Z",
+            frequency="hourly",
+            pollutants=["pm2_5"],
+            weather_fields=[],
+            download_type=download_type,
+            output_format="airqo-standard",
+            file_name="hourly-air-quality-data",
+        )
+
+
+def test_stream_download(pages):
+    with Flask(__name__).test_request_context():
+        response = stream_download(3, pages)
+        body = response.get_data(as_text=True)
+
+    assert response.mimetype == "text/csv"
+    assert response.headers["X-Total-Rows"] == "3"
+    assert response.headers["Content-Disposition"] == (
+        "attachment; filename=hourly-air-quality-data.csv"
+    )
+    assert body == "device_name,pm2_5\naq_1,10.5\naq_2,12.0\naq_3,8.25\n"
+
+
+def test_stream_download_json(pages):
+    with Flask(__name__).test_request_context():
+        response = stream_download(3, pages, download_type="json")
+        body = response.get_data(as_text=True)
+
+    assert response.mimetype == "application/x-ndjson"
+    assert len(body.splitlines()) == 3
+
+
+def test_stream_download_no_data():
+    with Flask(__name__).test_request_context():
+        response, status = stream_download(0, [])
+
+    assert status == 404
+    assert response["message"] == "No data found"
+
+
+@pytest.mark.parametrize("stream, streamed", [(True, True), ("false", False)])
+def test_download_stream_flag(stream, streamed):
+    with Flask(__name__).test_request_context(
+        method="POST",
+        json={
+            "startDateTime": "2024-01-01T00:00:00.000000Z",
+            "endDateTime": "2024-01-02T00:00:00.000000Z",
+            "sites": ["site_1"],
+            "downloadType": "json",
+            "stream": stream,
+        },
+    ), patch(
+        "api.views.data.filter_non_private_entities",
+        side_effect=lambda entities, entity_type: entities,
+    ), patch.object(
+        DataExportResource, "stream", return_value="streamed"
+    ), patch(
+        "api.views.data.EventsModel.download_from_bigquery",
+        return_value=pd.DataFrame(),
+    ):
+        response = DataExportResource().post()
+
+    assert (response == "streamed") is streamed
+
+
+def test_download_query_keeps_one_row_per_device_and_time():
+    query = EventsModel.download_query(
+        devices=[],
+        sites=["site_1"],
+        airqlouds=[],
+        start_date="2024-01-01T00:00:00.000000Z",
+        end_date="2024-01-02T00:00:00.000000Z",
+        frequency="hourly",
+        pollutants=["pm2_5"],
+        weather_fields=None,
+        limit=100,
+    )
+
+    assert (
+        "ROW_NUMBER() OVER (PARTITION BY datetime, device_name ORDER BY "
+        "IF(pm2_5_calibrated_value IS NULL, 0, 1) + IF(pm2_5_raw_value IS NULL, 0, 1) DESC, "
+        "TO_JSON_STRING(data))"
+    ) in query
@@ -1,14 +1,20 @@
 # TODO: Setup code coverage for tests
 from unittest.mock import patch
 
+import numpy as np
+import pandas as pd
 import pytest
 
-from api.utils.data_formatters import format_to_aqcsv
+from api.utils.data_formatters import (
+    compute_airqloud_summary,
+    compute_devices_summary,
+    format_to_aqcsv,
+)
 from conftest import mock_dataframe, mock_aqcsv_globals
 
 
 # TODO: Review this test
-@pytest.mark.parametrize("pollutant", ["pm2_5", "pm10"])
+@pytest.mark.parametrize("pollutants", [["pm2_5"], ["pm10"]])
 @pytest.mark.parametrize("frequency", ["hourly", "daily", "raw"])
 @pytest.mark.xfail
 def test_format_to_aqcsv(
@@ -51,3 +57,71 @@ def test_format_to_aqcsv(
             assert "value_pm2_5" in result[0].keys()
             assert "unit_pm2_5" in result[0].keys()
             assert "data_status_pm2_5" in result[0].keys()
+
+
+@pytest.fixture
+def hourly_data():
+    timestamps = pd.date_range("2024-01-01 20:00", periods=8, freq="H")
+    return pd.DataFrame(
+        {
+            "device": ["aq_1"] * 8 + ["aq_2"] * 3,
+            "site_id": ["site_1"] * 8 + ["site_2"] * 3,
+            "timestamp": list(timestamps) + list(timestamps[:3]),
+            "pm2_5_calibrated_value": [10.0, np.nan, 12.0, 13.0, np.nan, 15.0]
+            + [16.0, 17.0, np.nan, 20.0, np.nan],
+        }
+    )
+
+
+def test_compute_devices_summary(hourly_data):
+    # a duplicate hourly record is counted once
+    data = pd.concat([hourly_data, hourly_data.iloc[[0]]], ignore_index=True)
+
+    summary = compute_devices_summary(data)
+
+    assert summary[["timestamp", "device", "site_id"]].values.tolist() == [
+        [pd.Timestamp("2024-01-01"), "aq_1", "site_1"],
+        [pd.Timestamp("2024-01-02"), "aq_1", "site_1"],
+        [pd.Timestamp("2024-01-01"), "aq_2", "site_2"],
+    ]
+    assert summary["hourly_records"].tolist() == [4, 4, 3]
+    assert summary["calibrated_records"].tolist() == [3, 3, 1]
+    assert summary["uncalibrated_records"].tolist() == [1, 1, 2]
+    assert summary["calibrated_percentage"].tolist() == pytest.approx(
+        [75.0, 75.0, 100 / 3]
+    )
+    assert summary["uncalibrated_percentage"].tolist() == pytest.approx(
+        [25.0, 25.0, 200 / 3]
+    )
+
+
+@pytest.mark.parametrize("entity", ["cohort", "grid", "airqloud"])
+def test_compute_airqloud_summary(hourly_data, entity):
+    data = compute_devices_summary(hourly_data)
+    data["site_name"] = data["site_id"].str.replace("site_", "Site ")
+    data[entity] = f"{entity} name"
+    data[f"{entity}_id"] = f"{entity}_id"
+
+    summary = compute_airqloud_summary(data, "2024-01-01", "2024-01-03")
+
+    assert summary[entity] == f"{entity} name"
+    assert summary[f"{entity}_id"] == f"{entity}_id"
+    assert summary["hourly_records"] == 11
+    assert summary["calibrated_records"] == 7
+    assert summary["uncalibrated_records"] == 4
+    assert summary["calibrated_percentage"] == pytest.approx(700 / 11)
+    assert summary["start_date_time"] == "2024-01-01"
+    assert summary["end_date_time"] == "2024-01-03"
+    assert [site["hourly_records"] for site in summary["sites"]] == [8, 3]
+    assert [
+        site["calibrated_percentage"] for site in summary["sites"]
+    ] == pytest.approx([75.0, 100 / 3])
+    assert [device["device"] for device in summary["devices"]] == [
+        "aq_1",
+        "aq_1",
+        "aq_2",
+    ]
+
+
+def test_compute_airqloud_summary_without_data():
+    assert compute_airqloud_summary(pd.DataFrame(), "2024-01-01", "2024-01-03") == {}
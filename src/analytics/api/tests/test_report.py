@@ -0,0 +1,87 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The report module creates its BigQuery client on import.
+with patch("google.cloud.bigquery.Client"):
+    from api.utils.pollutants.report import (
+        PManalysis,
+        REPORT_ROLLUPS,
+        results_to_dataframe,
+        to_records,
+    )
+
+
+@pytest.fixture
+def report_data():
+    rng = np.random.default_rng(0)
+    size = 500
+    values = rng.uniform(5, 80, size=(size, 4))
+    values[rng.random(size=(size, 4)) < 0.1] = np.nan
+    results = pd.DataFrame(
+        {
+            "timestamp": pd.date_range("2024-01-30", periods=size, freq="3H"),
+            "site_name": rng.choice(["Site A", "Site B", "Site C"], size),
+            "city": rng.choice(["Kampala", "Wakiso", None], size),
+            "country": "Uganda",
+            "region": rng.choice(["Central", "Eastern"], size),
+            "site_latitude": rng.uniform(0.2, 0.4, size),
+            "site_longitude": rng.uniform(32.5, 32.7, size),
+            "pm2_5_raw_value": values[:, 0],
+            "pm2_5_calibrated_value": values[:, 1],
+            "pm10_raw_value": values[:, 2],
+            "pm10_calibrated_value": values[:, 3],
+        }
+    )
+    return results_to_dataframe(results)
+
+
+@pytest.mark.parametrize(
+    "name, groupby",
+    [
+        ("daily_mean_pm", PManalysis.mean_daily_pm2_5),
+        ("datetime_mean_pm", PManalysis.datetime_pm2_5),
+        ("diurnal", PManalysis.mean_pm2_5_by_hour),
+        ("monthly_pm", PManalysis.mean_pm2_5_by_month),
+        ("pm_by_month_year", PManalysis.mean_pm2_5_by_month_year),
+        ("site_monthly_mean_pm", PManalysis.monthly_mean_pm_site_name),
+        ("site_mean_pm", PManalysis.mean_pm2_5_by_site_name),
+        ("mean_pm_by_city", PManalysis.pm_by_city),
+        ("mean_pm_by_country", PManalysis.pm_by_country),
+        ("mean_pm_by_day_hour", PManalysis.pm_day_hour_name),
+    ],
+)
+def test_compute_rollups_matches_groupby(report_data, name, groupby):
+    rollup = PManalysis.compute_rollups(report_data)[name]
+    expected = groupby(report_data)
+    if name == "daily_mean_pm":
+        expected["date"] = expected["date"].dt.strftime("%Y-%m-%d")
+    if name == "datetime_mean_pm":
+        expected["timestamp"] = expected["timestamp"].dt.strftime("%Y-%m-%d %H:%M %Z")
+
+    pd.testing.assert_frame_equal(
+        rollup.reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+        check_exact=False,
+    )
+
+
+def test_compute_rollups_selection(report_data):
+    rollups = PManalysis.compute_rollups(report_data, ["diurnal"])
+    assert list(rollups) == ["diurnal"]
+
+    assert set(PManalysis.compute_rollups(report_data)) == set(REPORT_ROLLUPS)
+
+
+def test_to_records():
+    dataframe = pd.DataFrame(
+        {"site_name": ["Site A", None], "pm2_5_calibrated_value": [10.5, np.nan]}
+    )
+
+    assert to_records(dataframe) == [
+        {"site_name": "Site A", "pm2_5_calibrated_value": 10.5},
+        {"site_name": None, "pm2_5_calibrated_value": None},
+    ]
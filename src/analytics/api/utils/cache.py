@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TwoTierCache:
+    """
+    An in-process LRU cache in front of a shared Flask-Caching backend (Redis).
+
+    Hits on the local tier avoid a Redis round trip and the unpickling of large results, while the shared tier
+    lets the workers reuse each other's results. Local entries expire after `local_timeout` seconds so that a
+    worker never serves a result for much longer than the shared tier would.
+    """
+
+    def __init__(self, shared_cache, maxsize=256, local_timeout=300, timeout=None):
+        self.shared_cache = shared_cache
+        self.maxsize = maxsize
+        self.local_timeout = local_timeout
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.local_timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, compute):
+        """
+        Returns the cached value of `key`, looking in the local tier then the shared tier, and otherwise
+        computes it with `compute()` and stores it in both tiers.
+        """
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        value = self.shared_cache.get(key)
+        if value is None:
+            value = compute()
+            self.shared_cache.set(key, value, timeout=self.timeout)
+
+        self._set_local(key, value)
+        return value
+
+    def clear_local(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Any
+from typing import Any, Iterator
 
 import pandas as pd
 import requests
@@ -21,49 +21,57 @@ class Entity(Enum):
     SITES = "sites"
 
 
+def add_records_percentages(summary: pd.DataFrame) -> pd.DataFrame:
+    summary["calibrated_percentage"] = (
+        summary["calibrated_records"] / summary["hourly_records"]
+    ) * 100
+    summary["uncalibrated_percentage"] = (
+        summary["uncalibrated_records"] / summary["hourly_records"]
+    ) * 100
+    return summary
+
+
+def summarise_records(data: pd.DataFrame, by: list) -> pd.DataFrame:
+    """Sums the records counts of a devices summary over the `by` columns"""
+    summary = data.groupby(by, as_index=False, dropna=False).agg(
+        hourly_records=("hourly_records", "sum"),
+        calibrated_records=("calibrated_records", "sum"),
+        uncalibrated_records=("uncalibrated_records", "sum"),
+    )
+    return add_records_percentages(summary)
+
+
 def compute_devices_summary(data: pd.DataFrame) -> pd.DataFrame:
-    devices_summary = pd.DataFrame()
+    """
+    Summarises the hourly records of each device per day, as one row per device, site and day.
+    """
     data["timestamp"] = pd.to_datetime(data["timestamp"])
     data.drop_duplicates(subset=["device", "timestamp"], inplace=True)
-    data.index = data["timestamp"]
+    data["timestamp"] = data["timestamp"].dt.normalize()
 
-    for _, by_device in data.groupby("device"):
-        for _, by_timestamp in by_device.groupby(pd.Grouper(key="timestamp", freq="D")):
-            device_data = pd.DataFrame(by_timestamp)
-            device_data["timestamp"] = pd.to_datetime(
-                device_data["timestamp"].dt.strftime("%Y-%m-%d")
-            )
-            device_data["hourly_records"] = int(len(device_data.index))
-            device_data["calibrated_records"] = int(
-                device_data.pm2_5_calibrated_value.count()
-            )
-            device_data["uncalibrated_records"] = int(
-                device_data.pm2_5_calibrated_value.isna().sum()
-            )
-            device_data["calibrated_percentage"] = (
-                device_data["calibrated_records"] / device_data["hourly_records"]
-            ) * 100
-            device_data["uncalibrated_percentage"] = (
-                device_data["uncalibrated_records"] / device_data["hourly_records"]
-            ) * 100
-            device_data = device_data[
-                [
-                    "timestamp",
-                    "device",
-                    "site_id",
-                    "hourly_records",
-                    "calibrated_records",
-                    "uncalibrated_records",
-                    "calibrated_percentage",
-                    "uncalibrated_percentage",
-                ]
-            ]
-            device_data["hourly_records"] = device_data["hourly_records"].astype(int)
-            devices_summary = pd.concat(
-                [devices_summary, device_data], ignore_index=True
-            )
+    devices_summary = data.groupby(
+        ["device", "site_id", "timestamp"], as_index=False, dropna=False
+    ).agg(
+        hourly_records=("timestamp", "size"),
+        calibrated_records=("pm2_5_calibrated_value", "count"),
+    )
+    devices_summary["uncalibrated_records"] = (
+        devices_summary["hourly_records"] - devices_summary["calibrated_records"]
+    )
+    devices_summary = add_records_percentages(devices_summary)
 
-    return devices_summary
+    return devices_summary[
+        [
+            "timestamp",
+            "device",
+            "site_id",
+            "hourly_records",
+            "calibrated_records",
+            "uncalibrated_records",
+            "calibrated_percentage",
+            "uncalibrated_percentage",
+        ]
+    ]
 
 
 def compute_airqloud_summary(
@@ -84,112 +92,30 @@ def compute_airqloud_summary(
     ]
     devices = devices.to_dict("records")
 
-    if "cohort" in data.columns:
-        sites_hourly_records = data.groupby(["site_id", "site_name"], as_index=False)[
-            "hourly_records"
-        ].sum()
-        sites_calibrated_records = data.groupby(
-            ["site_id", "site_name"], as_index=False
-        )["calibrated_records"].sum()
-        sites_uncalibrated_records = data.groupby(
-            ["site_id", "site_name"], as_index=False
-        )["uncalibrated_records"].sum()
-
-        sites = pd.merge(
-            sites_hourly_records, sites_calibrated_records, on=["site_id", "site_name"]
-        ).merge(sites_uncalibrated_records, on=["site_id", "site_name"])
-
-        sites["calibrated_percentage"] = (
-            sites["calibrated_records"] / sites["hourly_records"]
-        ) * 100
-        sites["uncalibrated_percentage"] = (
-            sites["uncalibrated_records"] / sites["hourly_records"]
-        ) * 100
-
-        sites = sites.to_dict("records")
-
-        hourly_records = int(data["hourly_records"].sum())
-        calibrated_records = int(data["calibrated_records"].sum())
-        un_calibrated_records = int(data["uncalibrated_records"].sum())
-
-        cohort = data.iloc[0]["cohort"]
-        cohort_id = data.iloc[0]["cohort_id"]
-        return {
-            "cohort": cohort,
-            "cohort_id": cohort_id,
-            "hourly_records": hourly_records,
-            "calibrated_records": calibrated_records,
-            "uncalibrated_records": un_calibrated_records,
-            "calibrated_percentage": (calibrated_records / hourly_records) * 100,
-            "uncalibrated_percentage": (un_calibrated_records / hourly_records) * 100,
-            "start_date_time": start_date_time,
-            "end_date_time": end_date_time,
-            "sites": sites,
-            "devices": devices,
-        }
-
-    else:
-        sites_hourly_records = data.groupby(["site_id", "site_name"], as_index=False)[
-            "hourly_records"
-        ].sum()
-        sites_calibrated_records = data.groupby(
-            ["site_id", "site_name"], as_index=False
-        )["calibrated_records"].sum()
-        sites_uncalibrated_records = data.groupby(
-            ["site_id", "site_name"], as_index=False
-        )["uncalibrated_records"].sum()
-
-        sites = pd.merge(
-            sites_hourly_records, sites_calibrated_records, on=["site_id", "site_name"]
-        ).merge(sites_uncalibrated_records, on=["site_id", "site_name"])
-
-        sites["calibrated_percentage"] = (
-            sites["calibrated_records"] / sites["hourly_records"]
-        ) * 100
-        sites["uncalibrated_percentage"] = (
-            sites["uncalibrated_records"] / sites["hourly_records"]
-        ) * 100
-
-        sites = sites.to_dict("records")
-
-        hourly_records = int(data["hourly_records"].sum())
-        calibrated_records = int(data["calibrated_records"].sum())
-        un_calibrated_records = int(data["uncalibrated_records"].sum())
-
-        if "grid" in data.columns:
-            grid = data.iloc[0]["grid"]
-            grid_id = data.iloc[0]["grid_id"]
-            return {
-                "grid": grid,
-                "grid_id": grid_id,
-                "hourly_records": hourly_records,
-                "calibrated_records": calibrated_records,
-                "uncalibrated_records": un_calibrated_records,
-                "calibrated_percentage": (calibrated_records / hourly_records) * 100,
-                "uncalibrated_percentage": (un_calibrated_records / hourly_records)
-                * 100,
-                "start_date_time": start_date_time,
-                "end_date_time": end_date_time,
-                "sites": sites,
-                "devices": devices,
-            }
-
-        elif "airqloud" in data.columns:
-            airqloud = data.iloc[0]["airqloud"]
-            airqloud_id = data.iloc[0]["airqloud_id"]
+    sites = summarise_records(data, ["site_id", "site_name"]).to_dict("records")
+
+    hourly_records = int(data["hourly_records"].sum())
+    calibrated_records = int(data["calibrated_records"].sum())
+    un_calibrated_records = int(data["uncalibrated_records"].sum())
+
+    summary = {
+        "hourly_records": hourly_records,
+        "calibrated_records": calibrated_records,
+        "uncalibrated_records": un_calibrated_records,
+        "calibrated_percentage": (calibrated_records / hourly_records) * 100,
+        "uncalibrated_percentage": (un_calibrated_records / hourly_records) * 100,
+        "start_date_time": start_date_time,
+        "end_date_time": end_date_time,
+        "sites": sites,
+        "devices": devices,
+    }
+
+    for entity in ["cohort", "grid", "airqloud"]:
+        if entity in data.columns:
             return {
-                "airqloud": airqloud,
-                "airqloud_id": airqloud_id,
-                "hourly_records": hourly_records,
-                "calibrated_records": calibrated_records,
-                "uncalibrated_records": un_calibrated_records,
-                "calibrated_percentage": (calibrated_records / hourly_records) * 100,
-                "uncalibrated_percentage": (un_calibrated_records / hourly_records)
-                * 100,
-                "start_date_time": start_date_time,
-                "end_date_time": end_date_time,
-                "sites": sites,
-                "devices": devices,
+                entity: data.iloc[0][entity],
+                f"{entity}_id": data.iloc[0][f"{entity}_id"],
+                **summary,
             }
 
 
@@ -312,3 +238,38 @@ def filter_non_private_entities(entities: list, entity_type: Entity) -> list:
         print(f"Error while filtering non private entities {ex}")
     # TODO: Remove once @Martin updates endpoint to support other ID format
     return entities
+
+
+def format_export_chunks(
+    pages: Iterator[pd.DataFrame],
+    download_type: str,
+    output_format: str,
+    frequency: str,
+    pollutants: list,
+) -> Iterator[str]:
+    """
+    Encodes data download result pages as CSV (with the header in the first chunk)
+    or newline delimited JSON chunks.
+    """
+    header = True
+    for page in pages:
+        if page.empty:
+            continue
+
+        if output_format == "aqcsv":
+            page = pd.DataFrame(
+                format_to_aqcsv(
+                    data=page.to_dict("records"),
+                    frequency=frequency,
+                    pollutants=pollutants,
+                )
+            )
+
+        if download_type == "json":
+            # Older pandas versions do not terminate the last line.
+            yield page.to_json(orient="records", lines=True, date_format="iso").rstrip(
+                "\n"
+            ) + "\n"
+        else:
+            yield page.to_csv(index=False, header=header)
+        header = False
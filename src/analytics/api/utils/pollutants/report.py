@@ -12,17 +12,28 @@ import pytz
 
 def convert_utc_to_local(timestamps, site_latitude, site_longitude):
     tf = TimezoneFinder()
-    local_times = []
+    timestamps = pd.to_datetime(pd.Series(timestamps), utc=True)
+    coordinates = list(zip(site_latitude, site_longitude))
 
-    for timestamp, latitude, longitude in zip(
-        timestamps, site_latitude, site_longitude
-    ):
-        timezone_str = tf.timezone_at(lat=latitude, lng=longitude)
-        timezone = pytz.timezone(timezone_str)
-        local_time = timestamp.astimezone(timezone)
-        local_times.append(local_time)
+    # Look up the timezone once per site rather than once per row.
+    site_timezones = {
+        (latitude, longitude): tf.timezone_at(lat=latitude, lng=longitude)
+        for latitude, longitude in set(coordinates)
+    }
+    timezones = pd.Series(
+        [site_timezones[coordinate] for coordinate in coordinates],
+        index=timestamps.index,
+    )
 
-    return local_times
+    if timezones.nunique(dropna=False) == 1:
+        return timestamps.dt.tz_convert(pytz.timezone(timezones.iloc[0]))
+
+    local_times = pd.Series(index=timestamps.index, dtype=object)
+    for timezone_str, group in timestamps.groupby(timezones, dropna=False):
+        local_times[group.index] = list(
+            group.dt.tz_convert(pytz.timezone(timezone_str))
+        )
+    return local_times.tolist()
 
 
 def fetch_air_quality_data(grid_id, start_time, end_time) -> list:
@@ -128,6 +139,34 @@ PM_COLUMNS = [
 ]
 PM_COLUMNS_CORD = PM_COLUMNS + ["site_latitude", "site_longitude"]
 
+# Report rollups: name -> (group by columns, aggregated columns, decimals)
+REPORT_ROLLUPS = {
+    "daily_mean_pm": (["date"], PM_COLUMNS, 4),
+    "datetime_mean_pm": (["timestamp"], PM_COLUMNS, 4),
+    "diurnal": (["hour"], PM_COLUMNS, 4),
+    "annual_pm": (["year"], PM_COLUMNS, 4),
+    "monthly_pm": (["month"], PM_COLUMNS, 2),
+    "pm_by_month_year": (["month", "year"], PM_COLUMNS, 4),
+    "pm_by_month_name": (["month_name"], PM_COLUMNS, 4),
+    "site_monthly_mean_pm": (["site_name", "month", "year"], PM_COLUMNS_CORD, 4),
+    "site_annual_mean_pm": (["site_name", "year"], PM_COLUMNS_CORD, 4),
+    "site_mean_pm": (["site_name"], PM_COLUMNS_CORD, 4),
+    "mean_pm_by_city": (["city", "month", "year"], PM_COLUMNS, 4),
+    "mean_pm_by_country": (["country"], PM_COLUMNS, 2),
+    "mean_pm_by_region": (["region"], PM_COLUMNS, 4),
+    "mean_pm_by_day_of_week": (["day"], PM_COLUMNS, 4),
+    "mean_pm_by_day_hour": (["day", "hour"], PM_COLUMNS, 4),
+}
+
+
+def to_records(dataframe: pd.DataFrame) -> list:
+    """Converts a dataframe to a list of records with NaN values replaced by None."""
+    return (
+        dataframe.astype(object)
+        .where(dataframe.notna(), None)
+        .to_dict(orient="records")
+    )
+
 
 class PManalysis:
     @staticmethod
@@ -223,6 +262,92 @@ class PManalysis:
             dataframe.groupby(["day", "hour"])[PM_COLUMNS].mean().round(4).reset_index()
         )
 
+    @staticmethod
+    def encode(dataframe):
+        """
+        Factorizes every rollup key column once and splits the PM values into NaN-free
+        sums and non-null counts, so that rollups are computed with `np.bincount`
+        instead of hashing the raw rows for every groupby.
+        """
+        keys = {key for keys, _, _ in REPORT_ROLLUPS.values() for key in keys}
+        values = dataframe[PM_COLUMNS_CORD].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        return {
+            "codes": {key: pd.factorize(dataframe[key], sort=True) for key in keys},
+            # Column major so that each column is a contiguous array.
+            "values": np.where(valid, values, 0.0).T.copy(),
+            "counts": valid.T.astype(float),
+        }
+
+    @staticmethod
+    def rollup(encoded, keys, columns, decimals):
+        """
+        Computes the mean of `columns` grouped by `keys` from encoded report data.
+        Rows with a missing key are dropped and groups are sorted by key, as with
+        `DataFrame.groupby`.
+        """
+        shape = tuple(len(encoded["codes"][key][1]) for key in keys)
+        size = int(np.prod(shape))
+
+        # Rows with a missing key (code -1) are counted in an extra cell that is discarded.
+        cells = np.zeros(len(encoded["values"][0]), dtype=np.int64)
+        missing = np.zeros(len(cells), dtype=bool)
+        for key, stride in zip(keys, np.cumprod((1,) + shape[:0:-1])[::-1]):
+            codes = encoded["codes"][key][0]
+            cells += codes * stride
+            missing |= codes < 0
+        cells[missing] = size
+        occupied = np.flatnonzero(np.bincount(cells, minlength=size + 1)[:size])
+
+        sums, counts = [], []
+        for column in columns:
+            index = PM_COLUMNS_CORD.index(column)
+            sums.append(np.bincount(cells, weights=encoded["values"][index])[occupied])
+            counts.append(
+                np.bincount(cells, weights=encoded["counts"][index])[occupied]
+            )
+        with np.errstate(invalid="ignore"):
+            means = np.column_stack(sums) / np.column_stack(counts)
+
+        result = pd.DataFrame(
+            {
+                key: encoded["codes"][key][1].take(codes)
+                for key, codes in zip(keys, np.unravel_index(occupied, shape))
+            }
+        )
+        result[columns] = np.round(means, decimals)
+        return result
+
+    @staticmethod
+    def compute_rollups(dataframe, rollups=None):
+        """
+        Computes the requested report rollups (see `REPORT_ROLLUPS`) from a single
+        encoding pass over the raw rows.
+
+        Returns a dict of rollup name to dataframe.
+        """
+        rollups = rollups or list(REPORT_ROLLUPS.keys())
+        encoded = PManalysis.encode(dataframe)
+
+        results = {}
+        for name in rollups:
+            keys, columns, decimals = REPORT_ROLLUPS[name]
+            results[name] = PManalysis.rollup(encoded, keys, columns, decimals)
+
+        if "site_mean_pm" in results:
+            results["site_mean_pm"] = results["site_mean_pm"].sort_values(
+                by="pm2_5_calibrated_value", ascending=False
+            )
+        if "daily_mean_pm" in results:
+            results["daily_mean_pm"]["date"] = results["daily_mean_pm"][
+                "date"
+            ].dt.strftime("%Y-%m-%d")
+        if "datetime_mean_pm" in results:
+            results["datetime_mean_pm"]["timestamp"] = results["datetime_mean_pm"][
+                "timestamp"
+            ].dt.strftime("%Y-%m-%d %H:%M %Z")
+        return results
+
     @staticmethod
     def gridname(dataframe):
         unique_cities = dataframe["city"].unique().tolist()
@@ -4,7 +4,7 @@ import traceback
 import flask_excel as excel
 import pandas as pd
 from flasgger import swag_from
-from flask import request
+from flask import request, Response, stream_with_context
 from flask_restx import Resource
 
 from api.models import (
@@ -22,12 +22,17 @@ from api.utils.data_formatters import filter_non_private_entities, Entity
 # Middlewares
 from api.utils.data_formatters import (
     format_to_aqcsv,
+    format_export_chunks,
     compute_airqloud_summary,
 )
 from api.utils.dates import str_to_date, date_to_str
 from api.utils.exceptions import ExportRequestNotFound
 from api.utils.http import create_response, Status
-from api.utils.request_validators import validate_request_json, validate_request_params
+from api.utils.request_validators import (
+    validate_request_json,
+    validate_request_params,
+    Validator,
+)
 from main import rest_api_v2
 
 
@@ -53,6 +58,7 @@ class DataExportResource(Resource):
         "sites|optional:list",
         "devices|optional:list",
         "airqlouds|optional:list",
+        "stream|optional:bool",
     )
     def post(self):
         valid_pollutants = ["pm2_5", "pm10", "no2"]
@@ -80,6 +86,7 @@ class DataExportResource(Resource):
         output_format = (
             f"{json_data.get('outputFormat', valid_output_formats[0])}".lower()
         )
+        stream = Validator.str_to_bool(json_data.get("stream", False))
 
         if sum([len(sites) == 0, len(devices) == 0, len(airqlouds) == 0]) == 3:
             return (
@@ -138,6 +145,21 @@ class DataExportResource(Resource):
 
         postfix = "-" if output_format == "airqo-standard" else "-aqcsv-"
 
+        if stream:
+            return self.stream(
+                sites=sites,
+                devices=devices,
+                airqlouds=airqlouds,
+                start_date=start_date,
+                end_date=end_date,
+                frequency=frequency,
+                pollutants=pollutants,
+                weather_fields=weather_fields,
+                download_type=download_type,
+                output_format=output_format,
+                file_name=f"{frequency}-air-quality{postfix}data",
+            )
+
         try:
             data_frame = EventsModel.download_from_bigquery(
                 sites=sites,
@@ -185,6 +207,75 @@ class DataExportResource(Resource):
                 Status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @staticmethod
+    def stream(
+        sites,
+        devices,
+        airqlouds,
+        start_date,
+        end_date,
+        frequency,
+        pollutants,
+        weather_fields,
+        download_type,
+        output_format,
+        file_name,
+    ):
+        """
+        Streams the download as CSV or newline delimited JSON chunks, one BigQuery
+        result page at a time. The total number of rows is sent in the
+        `X-Total-Rows` header so that clients can report progress.
+        """
+        try:
+            total_rows, pages = EventsModel.stream_from_bigquery(
+                sites=sites,
+                devices=devices,
+                airqlouds=airqlouds,
+                start_date=start_date,
+                end_date=end_date,
+                frequency=frequency,
+                pollutants=pollutants,
+                weather_fields=weather_fields,
+            )
+        except Exception as ex:
+            print(ex)
+            traceback.print_exc()
+            return (
+                create_response(
+                    f"An Error occurred while processing your request. Please contact support",
+                    success=False,
+                ),
+                Status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        if total_rows == 0:
+            return (
+                create_response("No data found", data=[]),
+                Status.HTTP_404_NOT_FOUND,
+            )
+
+        mimetype, extension = (
+            ("application/x-ndjson", "ndjson")
+            if download_type == "json"
+            else ("text/csv", "csv")
+        )
+        return Response(
+            stream_with_context(
+                format_export_chunks(
+                    pages,
+                    download_type=download_type,
+                    output_format=output_format,
+                    frequency=frequency,
+                    pollutants=pollutants,
+                )
+            ),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename={file_name}.{extension}",
+                "X-Total-Rows": str(total_rows),
+            },
+        )
+
 
 @rest_api_v2.route("/data-export")
 class DataExportV2Resource(Resource):
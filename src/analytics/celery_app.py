@@ -10,7 +10,13 @@ from flask_pymongo import PyMongo
 from celery import Celery
 
 from config import Config, CONFIGURATIONS
-from api.models import DataExportModel, DataExportStatus, DataExportRequest, EventsModel
+from api.models import (
+    ChartRollupModel,
+    DataExportModel,
+    DataExportStatus,
+    DataExportRequest,
+    EventsModel,
+)
 
 celery_logger = get_task_logger(__name__)
 _logger = logging.getLogger(__name__)
@@ -37,7 +43,11 @@ def make_celery():
             "data_export_periodic_task": {
                 "task": "data_export_periodic_task",
                 "schedule": timedelta(seconds=5),
-            }
+            },
+            "chart_rollup_periodic_task": {
+                "task": "chart_rollup_periodic_task",
+                "schedule": timedelta(seconds=Config.CHART_ROLLUP_INTERVAL),
+            },
         },
         "app_name": "data_export",
     }
@@ -116,5 +126,17 @@ def data_export_task():
         )
 
 
+@celery.task(name="chart_rollup_periodic_task")
+def chart_rollup_task():
+    start, end = ChartRollupModel.lookback_period(Config.CHART_ROLLUP_LOOKBACK_HOURS)
+
+    for tenant in Config.CHART_ROLLUP_TENANTS:
+        celery_logger.info(f"Rolling up {tenant} chart events from {start} to {end}")
+        events_model = EventsModel(tenant)
+        events_model.ensure_chart_indexes()
+        events_model.roll_up_chart_events(start, end)
+        events_model.roll_up_late_chart_events(before=start)
+
+
 if __name__ == "__main__":
     data_export_task()
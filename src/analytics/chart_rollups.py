@@ -0,0 +1,29 @@
+import argparse
+from datetime import datetime, timedelta
+
+from api.models import EventsModel
+from api.utils.dates import str_to_date
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backfills the hourly chart rollups a day at a time"
+    )
+    parser.add_argument("--tenant", default="airqo")
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD")
+    parser.add_argument(
+        "--end",
+        default=(datetime.utcnow() + timedelta(days=1)).strftime("%Y-%m-%d"),
+        help="YYYY-MM-DD, defaults to tomorrow so that the backfill joins the periodic rollups",
+    )
+    args = parser.parse_args()
+
+    events_model = EventsModel(args.tenant)
+    events_model.ensure_chart_indexes()
+
+    # rolled up backwards from the end, so that each day extends the covered period
+    day = str_to_date(args.end, format="%Y-%m-%d")
+    start = str_to_date(args.start, format="%Y-%m-%d")
+    while day > start:
+        day_start = max(day - timedelta(days=1), start)
+        events_model.roll_up_chart_events(day_start, day)
+        day = day_start
@@ -48,11 +48,19 @@ class Config:
     BIGQUERY_BAM_DATA = env_var("BIGQUERY_BAM_DATA")
     BIGQUERY_DAILY_DATA = env_var("BIGQUERY_DAILY_DATA")
     DATA_EXPORT_LIMIT = os.getenv("DATA_EXPORT_LIMIT", 2000)
+    DATA_EXPORT_STREAM_LIMIT = os.getenv("DATA_EXPORT_STREAM_LIMIT", 1000000)
+    DATA_EXPORT_PAGE_SIZE = int(os.getenv("DATA_EXPORT_PAGE_SIZE", 10000))
     DATA_SUMMARY_DAYS_INTERVAL = os.getenv("DATA_SUMMARY_DAYS_INTERVAL", 2)
     AIRQO_API_TOKEN = os.getenv("AIRQO_API_TOKEN")
 
     DEVICES_SUMMARY_TABLE = env_var("DEVICES_SUMMARY_TABLE")
 
+    CHART_ROLLUP_TENANTS = os.getenv("CHART_ROLLUP_TENANTS", "airqo").split(",")
+    CHART_ROLLUP_INTERVAL = int(os.getenv("CHART_ROLLUP_INTERVAL", 900))  # seconds
+    CHART_ROLLUP_LOOKBACK_HOURS = int(os.getenv("CHART_ROLLUP_LOOKBACK_HOURS", 3))
+    CHART_LOCAL_CACHE_SIZE = int(os.getenv("CHART_LOCAL_CACHE_SIZE", 256))
+    CHART_LOCAL_CACHE_TIMEOUT = int(os.getenv("CHART_LOCAL_CACHE_TIMEOUT", 300))
+
     DATA_EXPORT_BUCKET = env_var("DATA_EXPORT_BUCKET")
     DATA_EXPORT_DATASET = env_var("DATA_EXPORT_DATASET")
     DATA_EXPORT_GCP_PROJECT = env_var("DATA_EXPORT_GCP_PROJECT")
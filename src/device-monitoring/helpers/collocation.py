@@ -2,7 +2,7 @@ import copy
 import os
 import tempfile
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
@@ -23,6 +23,10 @@ from helpers.collocation_utils import (
     map_data_to_api_format,
     compute_hourly_intra_sensor_correlation,
     compute_data_completeness_using_hourly_records,
+    compute_results_from_state,
+    new_collocation_state,
+    update_collocation_state,
+    STATISTICS_COLUMNS,
 )
 from helpers.exceptions import CollocationBatchNotFound
 from models.base import BaseModel
@@ -38,6 +42,7 @@ from models.collocation import (
     IntraSensorCorrelation,
     BaseResult,
     DeviceStatusSummary,
+    CollocationBatchState,
 )
 
 
@@ -161,6 +166,7 @@ class Collocation(BaseModel):
         self,
     ):
         super().__init__("airqo", "collocation")
+        self.state_collection = self.db["collocation_state"]
 
     @staticmethod
     def compute_batch_results(
@@ -377,9 +383,48 @@ class Collocation(BaseModel):
 
     def compute_and_update_results(self, batches: list[CollocationBatch]):
         for batch in batches:
-            results = self.compute_batch_results(batch)
+            state = self.__update_batch_state(batch)
+            results = compute_results_from_state(collocation_batch=batch, state=state)
             self.__update_batch_results((batch.batch_id, results))
 
+    def __update_batch_state(self, batch: CollocationBatch) -> CollocationBatchState:
+        """
+        Updates the batch's running statistics with the complete hours of data
+        received since they were last updated.
+        """
+        state = self.__query_batch_state(batch)
+        watermark = min(
+            pd.Timestamp(datetime.utcnow()).floor("H").to_pydatetime(),
+            batch.end_date,
+        )
+        if state.watermark >= watermark:
+            return state
+
+        data, data_source = Collocation.get_data(
+            devices=batch.devices,
+            start_date_time=state.watermark,
+            end_date_time=watermark - timedelta(microseconds=1),
+        )
+        state = update_collocation_state(
+            state=state, data=data, watermark=watermark, data_source=data_source
+        )
+
+        filter_set = {"_id": ObjectId(batch.batch_id)}
+        self.state_collection.replace_one(
+            filter_set, {**filter_set, **state.to_dict()}, upsert=True
+        )
+        print(f"updated state for batch {batch.batch_id} to {watermark}")
+        return state
+
+    def __query_batch_state(self, batch: CollocationBatch) -> CollocationBatchState:
+        doc = self.state_collection.find_one({"_id": ObjectId(batch.batch_id)})
+        if doc is not None:
+            state = CollocationBatchState.from_dict(doc)
+            if state.is_valid_for(batch, columns=STATISTICS_COLUMNS):
+                return state
+
+        return new_collocation_state(batch)
+
     def __update_batch_results(
         self, batch_tuple: tuple[str, CollocationBatchResult]
     ) -> CollocationBatch:
@@ -429,6 +474,7 @@ class Collocation(BaseModel):
         filter_set = {"_id": ObjectId(reset_batch.batch_id)}
         update_set = {"$set": reset_batch.to_dict()}
         self.collection.update_one(filter_set, update_set)
+        self.state_collection.delete_one(filter_set)
         reset_batch = self.__query_by_batch_id(reset_batch.batch_id)
         return reset_batch
 
@@ -439,6 +485,7 @@ class Collocation(BaseModel):
             raise CollocationBatchNotFound(batch_id=batch_id)
 
         self.collection.delete_one(filter_set)
+        self.state_collection.delete_one(filter_set)
         print(f"Deleted {batch_id}")
 
     def __query_by_batch_id(self, batch_id: str) -> CollocationBatch:
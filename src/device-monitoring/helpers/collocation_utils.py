@@ -1,5 +1,7 @@
 import copy
+import itertools
 import math
+import warnings
 from datetime import datetime, timedelta
 
 import numpy as np
@@ -14,6 +16,8 @@ from models.collocation import (
     IntraSensorCorrelationResult,
     IntraSensorData,
     CollocationBatch,
+    CollocationBatchResult,
+    CollocationBatchState,
 )
 
 
@@ -36,15 +40,108 @@ def dates_array(start_date_time: datetime, end_date_time: datetime) -> list[date
 
 
 def device_pairs(devices: list[str]) -> list[list[str]]:
-    devices = list(set(devices))
-    pairs = []
-    for device_x in devices:
-        for device_y in devices:
-            if (device_x == device_y) or ([device_y, device_x] in pairs):
-                continue
-            pairs.append([device_x, device_y])
+    devices = list(dict.fromkeys(devices))
+    return [list(pair) for pair in itertools.combinations(devices, 2)]
+
+
+def hourly_device_array(
+    data: dict[str, pd.DataFrame], devices: list[str], columns: list[str]
+) -> np.ndarray:
+    """
+    Aligns the devices' data on one hourly time index.
+
+    Returns a device x hour x parameter array of hourly means, with NaN for hours
+    without data.
+    """
+    frames = []
+    for device in devices:
+        device_data = data.get(device, pd.DataFrame())
+        if device_data.empty or "timestamp" not in device_data.columns:
+            continue
+        device_data = populate_missing_columns(
+            device_data[
+                [col for col in device_data.columns if col in columns + ["timestamp"]]
+            ].copy(),
+            cols=columns,
+        )
+        device_data[columns] = device_data[columns].apply(
+            pd.to_numeric, errors="coerce"
+        )
+        device_data["timestamp"] = pd.to_datetime(device_data["timestamp"]).dt.floor(
+            "H"
+        )
+        device_data["device_name"] = device
+        frames.append(device_data)
+
+    if not frames:
+        return np.full((len(devices), 0, len(columns)), np.nan)
+
+    hourly_data = (
+        pd.concat(frames, ignore_index=True)
+        .groupby(["device_name", "timestamp"])[columns]
+        .mean()
+    )
+    hours = hourly_data.index.get_level_values("timestamp").unique().sort_values()
+    hourly_data = hourly_data.reindex(
+        pd.MultiIndex.from_product([devices, hours], names=["device_name", "timestamp"])
+    )
+    return hourly_data.to_numpy(dtype=float).reshape(
+        len(devices), len(hours), len(columns)
+    )
+
+
+def correlation_from_moments(counts, sum_x, sum_y, squares_x, squares_y, products):
+    """
+    Computes Pearson correlations from the number of observations, sums, sums of
+    squares and sums of products of x and y. Correlations of fewer than two
+    observations or of constant series are NaN, as with `DataFrame.corr`.
+    """
+    counts, sum_x, sum_y = np.asarray(counts), np.asarray(sum_x), np.asarray(sum_y)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        covariance = counts * products - sum_x * sum_y
+        variance_x = counts * squares_x - sum_x**2
+        variance_y = counts * squares_y - sum_y**2
+        correlation = covariance / np.sqrt(variance_x * variance_y)
+
+    # Tolerate the rounding errors of constant series
+    constant = (variance_x <= 1e-10 * counts * squares_x) | (
+        variance_y <= 1e-10 * counts * squares_y
+    )
+    return np.clip(np.where((counts < 2) | constant, np.nan, correlation), -1, 1)
+
+
+def pairwise_moments(values: np.ndarray) -> np.ndarray:
+    """
+    Computes, for every pair of rows of a device x hour matrix, the number of hours
+    where both devices have data and the row's sums, sums of squares and sums of
+    products over those hours.
+
+    Returns a 4 x device x device array of counts, sums, squares and products.
+    """
+    present = (~np.isnan(values)).astype(float)
+    values = np.nan_to_num(values)
+
+    return np.stack(
+        [
+            present @ present.T,
+            values @ present.T,
+            (values**2) @ present.T,
+            values @ values.T,
+        ]
+    )
+
 
-    return pairs
+def correlation_from_pairwise_moments(moments: np.ndarray) -> np.ndarray:
+    counts, sums, squares, products = moments
+    return correlation_from_moments(counts, sums, sums.T, squares, squares.T, products)
+
+
+def pairwise_correlation(values: np.ndarray) -> np.ndarray:
+    """
+    Computes the Pearson correlation between every pair of rows of a device x hour
+    matrix, using the hours where both devices have data, as `DataFrame.corr` does.
+    """
+    return correlation_from_pairwise_moments(pairwise_moments(values))
 
 
 def compute_differences(
@@ -63,43 +160,39 @@ def compute_differences(
             error_devices=[],
         )
 
-    statistics_list = copy.copy(statistics)
-    differences = []
-    # TODO compute base device
-    data: dict[str, dict] = {}
-    for device_statistics in statistics_list:
-        device = device_statistics.pop("device_name")
-        data[device] = device_statistics
+    statistics_df = pd.DataFrame(statistics)
+    statistics_devices = statistics_df.pop("device_name").to_list()
+    columns = statistics_df.columns.to_list()
+    present = np.array(
+        [
+            [col in device_statistics for col in columns]
+            for device_statistics in statistics
+        ]
+    )
+    values = statistics_df.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
 
-    pairs = device_pairs(list(data.keys()))
+    # TODO compute base device
+    differences = []
     passed_devices: list[str] = []
     failed_devices: list[str] = []
-
-    for device_pair in pairs:
-        device_x = device_pair[0]
-        device_y = device_pair[1]
-
-        device_x_data = pd.DataFrame([data.get(device_x)])
-        device_y_data = pd.DataFrame([data.get(device_y)])
-
-        differences_df = abs(device_x_data - device_y_data)
-        differences_df.replace(np.nan, None, inplace=True)
-        results = differences_df.to_dict("records")
-
-        try:
-            results = results[0]
-            passed = (
-                results[f"{parameter}_mean"] <= threshold
-                if results[f"{parameter}_mean"]
-                else False
+    index = {device: i for i, device in enumerate(statistics_devices)}
+    pair_differences = np.abs(values[:, None, :] - values[None, :, :])
+
+    for device_x, device_y in device_pairs(statistics_devices):
+        x, y = index[device_x], index[device_y]
+        results = {
+            col: None if np.isnan(value) else float(value)
+            for col, value, is_present in zip(
+                columns, pair_differences[x, y], present[x] | present[y]
             )
-        except IndexError:
-            results = []
-            passed = False
+            if is_present
+        }
+        parameter_difference = results.get(f"{parameter}_mean", None)
+        passed = parameter_difference <= threshold if parameter_difference else False
 
         differences.append(
             {
-                "devices": device_pair,
+                "devices": [device_x, device_y],
                 "passed": passed,
                 "differences": results,
             }
@@ -133,50 +226,26 @@ def compute_differences(
     )
 
 
-def compute_devices_inter_sensor_correlation(
-    data: dict[str, pd.DataFrame],
+def inter_sensor_correlation_result(
+    correlations: dict[str, float],
     device_x: str,
     device_y: str,
-    correlation_cols: list,
     threshold: float,
     r2_threshold: float,
     parameter: str,
 ) -> dict:
-    device_x_data = data.get(device_x, pd.DataFrame())
-
-    device_x_data = device_x_data[correlation_cols]
-    device_x_data = device_x_data.add_prefix(f"{device_x}_")
-    device_x_data.rename(columns={f"{device_x}_timestamp": "timestamp"}, inplace=True)
-
-    device_y_data = data.get(device_y, pd.DataFrame())
-    device_y_data = device_y_data[correlation_cols]
-    device_y_data = device_y_data.add_prefix(f"{device_y}_")
-    device_y_data.rename(columns={f"{device_y}_timestamp": "timestamp"}, inplace=True)
-
-    device_pair_data = pd.merge(
-        left=device_x_data,
-        right=device_y_data,
-        on=["timestamp"],
-    )
-    device_pair_data = device_pair_data.select_dtypes(include="number")
-
     device_pair_correlation: dict = dict()
-
-    for col in correlation_cols:
-        try:
-            if col == "timestamp":
-                continue
-
-            comp_cols = [f"{device_x}_{col}", f"{device_y}_{col}"]
-
-            device_pair_correlation_data = device_pair_data[comp_cols].corr().round(4)
-            device_pair_correlation_data.replace(np.nan, None, inplace=True)
-            correlation_value = device_pair_correlation_data.iloc[0][comp_cols[1]]
-            device_pair_correlation[f"{col}_pearson"] = correlation_value
-
-            device_pair_correlation[f"{col}_r2_pearson"] = math.sqrt(correlation_value)
-        except Exception:
+    for col, correlation_value in correlations.items():
+        if np.isnan(correlation_value):
+            device_pair_correlation[f"{col}_pearson"] = None
             device_pair_correlation[f"{col}_r2_pearson"] = None
+            continue
+
+        correlation_value = round(float(correlation_value), 4)
+        device_pair_correlation[f"{col}_pearson"] = correlation_value
+        device_pair_correlation[f"{col}_r2_pearson"] = (
+            math.sqrt(correlation_value) if correlation_value >= 0 else None
+        )
 
     parameter_value = device_pair_correlation.get(f"{parameter}_pearson", None)
     parameter_r2_value = device_pair_correlation.get(f"{parameter}_r2_pearson", None)
@@ -194,6 +263,31 @@ def compute_devices_inter_sensor_correlation(
     return device_pair_correlation
 
 
+def compute_devices_inter_sensor_correlation(
+    data: dict[str, pd.DataFrame],
+    device_x: str,
+    device_y: str,
+    correlation_cols: list,
+    threshold: float,
+    r2_threshold: float,
+    parameter: str,
+) -> dict:
+    columns = [col for col in correlation_cols if col != "timestamp"]
+    values = hourly_device_array(data, [device_x, device_y], columns)
+
+    return inter_sensor_correlation_result(
+        correlations={
+            col: pairwise_correlation(values[:, :, i])[0, 1]
+            for i, col in enumerate(columns)
+        },
+        device_x=device_x,
+        device_y=device_y,
+        threshold=threshold,
+        r2_threshold=r2_threshold,
+        parameter=parameter,
+    )
+
+
 def compute_inter_sensor_correlation(
     devices: list[str],
     data: dict[str, pd.DataFrame],
@@ -212,29 +306,67 @@ def compute_inter_sensor_correlation(
             error_devices=[],
         )
 
+    correlation_cols = list(dict.fromkeys([parameter, *other_parameters]))
+    batch_devices = list(dict.fromkeys([*devices, *data.keys(), base_device or ""]))
+
+    # All pairwise correlations are computed at once from the hourly aligned data.
+    values = hourly_device_array(data, batch_devices, correlation_cols)
+
+    return inter_sensor_correlation_results(
+        devices=devices,
+        data_devices=list(data.keys()),
+        correlations={
+            col: (batch_devices, pairwise_correlation(values[:, :, i]))
+            for i, col in enumerate(correlation_cols)
+        },
+        threshold=threshold,
+        r2_threshold=r2_threshold,
+        parameter=parameter,
+        base_device=base_device,
+    )
+
+
+def inter_sensor_correlation_results(
+    devices: list[str],
+    data_devices: list[str],
+    correlations: dict[str, tuple[list[str], np.ndarray]],
+    threshold: float,
+    r2_threshold: float,
+    parameter: str,
+    base_device: str,
+) -> BaseResult:
+    """
+    Builds the inter sensor correlation results from device x device correlation
+    matrices, given per parameter together with the devices of their rows.
+    """
     passed_devices: list[str] = []
     failed_devices: list[str] = []
     results: list[dict] = []
 
-    correlation_cols = ["timestamp", parameter]
-    correlation_cols.extend(other_parameters)
-    correlation_cols = list(set(correlation_cols))
+    indexes = {
+        col: {device: i for i, device in enumerate(matrix_devices)}
+        for col, (matrix_devices, _) in correlations.items()
+    }
+
+    def pair_correlation(device_x: str, device_y: str) -> dict:
+        return inter_sensor_correlation_result(
+            correlations={
+                col: matrix[indexes[col][device_x], indexes[col][device_y]]
+                for col, (_, matrix) in correlations.items()
+            },
+            device_x=device_x,
+            device_y=device_y,
+            threshold=threshold,
+            r2_threshold=r2_threshold,
+            parameter=parameter,
+        )
 
     if base_device is not None and base_device != "":
-        for device in data.keys():
+        for device in data_devices:
             if device == base_device:
                 continue
 
-            device_pair_correlation = compute_devices_inter_sensor_correlation(
-                correlation_cols=correlation_cols,
-                device_x=base_device,
-                device_y=device,
-                data=data,
-                parameter=parameter,
-                threshold=threshold,
-                r2_threshold=r2_threshold,
-            )
-
+            device_pair_correlation = pair_correlation(base_device, device)
             results.append(device_pair_correlation)
 
             if device_pair_correlation["passed"]:
@@ -246,20 +378,8 @@ def compute_inter_sensor_correlation(
         passed_pairs: list[tuple[str, str]] = []
         pairs = device_pairs(devices)
 
-        for device_pair in pairs:
-            device_x = device_pair[0]
-            device_y = device_pair[1]
-
-            device_pair_correlation = compute_devices_inter_sensor_correlation(
-                correlation_cols=correlation_cols,
-                device_x=device_x,
-                device_y=device_y,
-                data=data,
-                parameter=parameter,
-                threshold=threshold,
-                r2_threshold=r2_threshold,
-            )
-
+        for device_x, device_y in pairs:
+            device_pair_correlation = pair_correlation(device_x, device_y)
             results.append(device_pair_correlation)
 
             if device_pair_correlation["passed"]:
@@ -324,37 +444,63 @@ def compute_intra_sensor_correlation(
         pm2_5_pearson = pm2_5_pearson.iloc[0]["s2_pm2_5"]
         pm10_pearson = device_data[["s1_pm10", "s2_pm10"]].corr().round(4)
         pm10_pearson = pm10_pearson.iloc[0]["s2_pm10"]
-        pm2_5_r2 = None
-        pm10_r2 = None
 
-        try:
-            pm2_5_r2 = math.sqrt(pm2_5_pearson)
-            pm10_r2 = math.sqrt(pm10_pearson)
-        except Exception:
-            pass
-
-        pm2_5_pearson = None if pm2_5_pearson is np.NAN else pm2_5_pearson
-        pm10_pearson = None if pm10_pearson is np.NAN else pm10_pearson
-
-        if parameter == "pm10":
-            passed = bool(pm10_pearson >= threshold) if pm10_pearson else False
-            if passed:
-                passed = pm10_r2 >= r2_threshold if pm10_r2 else False
-        else:
-            passed = bool(pm2_5_pearson >= threshold) if pm2_5_pearson else False
-            if passed:
-                passed = pm2_5_r2 >= r2_threshold if pm2_5_r2 else False
-
-        device_correlation = IntraSensorCorrelation(
-            device_name=device,
-            pm2_5_pearson=pm2_5_pearson,
-            pm10_pearson=pm10_pearson,
-            pm2_5_r2=pm2_5_r2,
-            pm10_r2=pm10_r2,
-            passed=passed,
+        correlation.append(
+            device_intra_sensor_correlation(
+                device=device,
+                pm2_5_pearson=pm2_5_pearson,
+                pm10_pearson=pm10_pearson,
+                threshold=threshold,
+                parameter=parameter,
+                r2_threshold=r2_threshold,
+            )
         )
-        correlation.append(device_correlation)
 
+    return intra_sensor_correlation_results(devices=devices, correlation=correlation)
+
+
+def device_intra_sensor_correlation(
+    device: str,
+    pm2_5_pearson: float,
+    pm10_pearson: float,
+    threshold: float,
+    parameter: str,
+    r2_threshold: float,
+) -> IntraSensorCorrelation:
+    pm2_5_r2 = None
+    pm10_r2 = None
+
+    try:
+        pm2_5_r2 = math.sqrt(pm2_5_pearson)
+        pm10_r2 = math.sqrt(pm10_pearson)
+    except Exception:
+        pass
+
+    pm2_5_pearson = None if pm2_5_pearson is np.NAN else pm2_5_pearson
+    pm10_pearson = None if pm10_pearson is np.NAN else pm10_pearson
+
+    if parameter == "pm10":
+        passed = bool(pm10_pearson >= threshold) if pm10_pearson else False
+        if passed:
+            passed = pm10_r2 >= r2_threshold if pm10_r2 else False
+    else:
+        passed = bool(pm2_5_pearson >= threshold) if pm2_5_pearson else False
+        if passed:
+            passed = pm2_5_r2 >= r2_threshold if pm2_5_r2 else False
+
+    return IntraSensorCorrelation(
+        device_name=device,
+        pm2_5_pearson=pm2_5_pearson,
+        pm10_pearson=pm10_pearson,
+        pm2_5_r2=pm2_5_r2,
+        pm10_r2=pm10_r2,
+        passed=passed,
+    )
+
+
+def intra_sensor_correlation_results(
+    devices: list[str], correlation: list[IntraSensorCorrelation]
+) -> IntraSensorCorrelationResult:
     passed_devices = list(filter(lambda x: x.passed is True, correlation))
     passed_devices = [x.device_name for x in passed_devices]
     failed_devices = list(filter(lambda x: x.passed is False, correlation))
@@ -550,15 +696,8 @@ def compute_data_completeness_using_hourly_records(
     data: dict[str, pd.DataFrame],
     collocation_batch: CollocationBatch,
 ) -> DataCompletenessResult:
-    now = datetime.utcnow()
-    end_date_time = (
-        now if now < collocation_batch.end_date else collocation_batch.end_date
-    )
-
     data = data.copy()
-    total_records = (end_date_time - collocation_batch.start_date).days * 24
-    expected_records = int((collocation_batch.data_completeness_threshold / 100) * total_records)
-    completeness: list[DataCompleteness] = []
+    hourly_records: dict[str, int] = {}
 
     for device in collocation_batch.devices:
         try:
@@ -568,10 +707,7 @@ def compute_data_completeness_using_hourly_records(
             )
             actual = len(device_data.index)
 
-            if actual == 0:
-                device_completeness = 0.0
-
-            else:
+            if actual != 0:
                 device_data = device_data.resample("1H", on="timestamp").mean(
                     numeric_only=True
                 )
@@ -583,28 +719,59 @@ def compute_data_completeness_using_hourly_records(
                 )
                 actual = len(device_data.index)
 
-                device_completeness = (
-                    round(actual / total_records, 2) * 100
-                )
-                device_completeness = (
-                    100 if device_completeness > 100 else device_completeness
-                )
-
-            missing = 100 - device_completeness
-            completeness.append(
-                DataCompleteness(
-                    device_name=device,
-                    actual=actual,
-                    expected=expected_records,
-                    completeness=device_completeness,
-                    missing=missing,
-                    passed=device_completeness
-                    >= collocation_batch.data_completeness_threshold,
-                )
-            )
+            hourly_records[device] = actual
         except Exception as ex:
             print(f"Data completeness computation error: {ex}")
 
+    return data_completeness_result(
+        collocation_batch=collocation_batch, hourly_records=hourly_records
+    )
+
+
+def data_completeness_result(
+    collocation_batch: CollocationBatch, hourly_records: dict[str, int]
+) -> DataCompletenessResult:
+    """
+    Builds the data completeness results from the number of hours each device sent
+    data for.
+    """
+    now = datetime.utcnow()
+    end_date_time = (
+        now if now < collocation_batch.end_date else collocation_batch.end_date
+    )
+
+    total_records = (end_date_time - collocation_batch.start_date).days * 24
+    expected_records = int(
+        (collocation_batch.data_completeness_threshold / 100) * total_records
+    )
+    completeness: list[DataCompleteness] = []
+
+    for device in collocation_batch.devices:
+        if device not in hourly_records:
+            continue
+
+        actual = hourly_records[device]
+        if actual == 0:
+            device_completeness = 0.0
+        else:
+            device_completeness = round(actual / total_records, 2) * 100
+            device_completeness = (
+                100 if device_completeness > 100 else device_completeness
+            )
+
+        missing = 100 - device_completeness
+        completeness.append(
+            DataCompleteness(
+                device_name=device,
+                actual=actual,
+                expected=expected_records,
+                completeness=device_completeness,
+                missing=missing,
+                passed=device_completeness
+                >= collocation_batch.data_completeness_threshold,
+            )
+        )
+
     passed_devices = list(filter(lambda x: x.passed is True, completeness))
     passed_devices = [x.device_name for x in passed_devices]
     failed_devices = list(filter(lambda x: x.passed is False, completeness))
@@ -641,3 +808,327 @@ def map_data_to_api_format(data: list) -> dict[str, dict]:
         api_data[device] = data
 
     return api_data
+
+
+STATISTICS_COLUMNS = [
+    "s1_pm2_5",
+    "s2_pm2_5",
+    "s1_pm10",
+    "s2_pm10",
+    "internal_temperature",
+    "internal_humidity",
+    "external_temperature",
+    "external_humidity",
+    "battery_voltage",
+    "pm2_5",
+    "pm10",
+]
+INTRA_SENSOR_COLUMNS = {
+    "pm2_5": ["s1_pm2_5", "s2_pm2_5"],
+    "pm10": ["s1_pm10", "s2_pm10"],
+}
+# Ratio of consecutive sketch buckets, giving percentiles within about 1%.
+SKETCH_GAMMA = 1.02
+
+
+def sketch_keys(values: np.ndarray) -> np.ndarray:
+    return (
+        np.sign(values) * np.ceil(np.log1p(np.abs(values)) / np.log(SKETCH_GAMMA))
+    ).astype(int)
+
+
+def update_sketch(sketch: dict, values: np.ndarray) -> dict:
+    counts = pd.Series(
+        [*sketch["counts"], *np.ones(len(values), dtype=int)],
+        index=[*sketch["keys"], *sketch_keys(values)],
+    )
+    counts = counts.groupby(level=0).sum()
+    return {"keys": counts.index.to_list(), "counts": counts.to_list()}
+
+
+def sketch_percentiles(sketch: dict, percentiles: list[float]) -> list:
+    """Estimates percentiles, interpolated as in `Series.describe`, from a sketch."""
+    if not sketch["keys"]:
+        return [None for _ in percentiles]
+
+    keys = np.asarray(sketch["keys"])
+    values = np.sign(keys) * np.expm1((np.abs(keys) - 0.5) * np.log(SKETCH_GAMMA))
+    values[keys == 0] = 0
+    ranks = np.cumsum(sketch["counts"])
+
+    results = []
+    for percentile in percentiles:
+        position = percentile * (ranks[-1] - 1)
+        lower = values[np.searchsorted(ranks, math.floor(position), side="right")]
+        upper = values[np.searchsorted(ranks, math.ceil(position), side="right")]
+        results.append(
+            float(lower + (upper - lower) * (position - math.floor(position)))
+        )
+    return results
+
+
+def inter_sensor_parameters(collocation_batch: CollocationBatch) -> list[str]:
+    return list(
+        dict.fromkeys(
+            [
+                collocation_batch.inter_correlation_parameter,
+                *collocation_batch.inter_correlation_additional_parameters,
+            ]
+        )
+    )
+
+
+def new_collocation_state(collocation_batch: CollocationBatch) -> CollocationBatchState:
+    devices = collocation_batch.devices
+    empty = np.zeros((len(devices), len(STATISTICS_COLUMNS)))
+    inter_sensor_parameter_names = inter_sensor_parameters(collocation_batch)
+
+    return CollocationBatchState(
+        batch_id=collocation_batch.batch_id,
+        devices=list(devices),
+        columns=list(STATISTICS_COLUMNS),
+        start_date=collocation_batch.start_date,
+        watermark=collocation_batch.start_date,
+        data_completeness_parameter=collocation_batch.data_completeness_parameter,
+        inter_correlation_parameters=inter_sensor_parameter_names,
+        data_source="",
+        moments={
+            "count": empty.tolist(),
+            "sum": empty.tolist(),
+            "squares": empty.tolist(),
+            "min": np.full_like(empty, np.nan).tolist(),
+            "max": np.full_like(empty, np.nan).tolist(),
+        },
+        intra_sensor_moments={
+            pollutant: np.zeros((len(devices), 6)).tolist()
+            for pollutant in INTRA_SENSOR_COLUMNS.keys()
+        },
+        inter_sensor_moments={
+            parameter: np.zeros((4, len(devices), len(devices))).tolist()
+            for parameter in inter_sensor_parameter_names
+        },
+        completeness=["0" for _ in devices],
+        sketches={
+            device: {col: {"keys": [], "counts": []} for col in STATISTICS_COLUMNS}
+            for device in devices
+        },
+    )
+
+
+def update_collocation_state(
+    state: CollocationBatchState,
+    data: dict[str, pd.DataFrame],
+    watermark: datetime,
+    data_source: str,
+) -> CollocationBatchState:
+    """
+    Adds the raw data received since the state's watermark to the running
+    statistics and moves the watermark to `watermark`. `data` must only contain
+    complete hours after the previous watermark.
+    """
+    moments = {
+        key: np.array(value, dtype=float) for key, value in state.moments.items()
+    }
+    intra_sensor_moments = {
+        key: np.array(value, dtype=float)
+        for key, value in state.intra_sensor_moments.items()
+    }
+    start_hour = pd.Timestamp(state.start_date).floor("H")
+
+    for i, device in enumerate(state.devices):
+        device_data = data.get(device, pd.DataFrame())
+        if device_data.empty:
+            continue
+
+        device_data = populate_missing_columns(device_data.copy(), cols=state.columns)
+        values = (
+            device_data[state.columns]
+            .apply(pd.to_numeric, errors="coerce")
+            .to_numpy(dtype=float)
+        )
+        present = ~np.isnan(values)
+
+        moments["count"][i] += present.sum(axis=0)
+        moments["sum"][i] += np.nansum(values, axis=0)
+        moments["squares"][i] += np.nansum(values**2, axis=0)
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            moments["min"][i] = np.fmin(moments["min"][i], np.nanmin(values, axis=0))
+            moments["max"][i] = np.fmax(moments["max"][i], np.nanmax(values, axis=0))
+
+        for j, col in enumerate(state.columns):
+            state.sketches[device][col] = update_sketch(
+                state.sketches[device][col], values[present[:, j], j]
+            )
+
+        for pollutant, (col_x, col_y) in INTRA_SENSOR_COLUMNS.items():
+            x = values[:, state.columns.index(col_x)]
+            y = values[:, state.columns.index(col_y)]
+            both = ~np.isnan(x) & ~np.isnan(y)
+            x, y = x[both], y[both]
+            intra_sensor_moments[pollutant][i] += [
+                len(x),
+                x.sum(),
+                y.sum(),
+                (x**2).sum(),
+                (y**2).sum(),
+                (x * y).sum(),
+            ]
+
+        hours = (
+            pd.to_datetime(
+                device_data.dropna(subset=[state.data_completeness_parameter])[
+                    "timestamp"
+                ],
+                utc=True,
+            )
+            .dt.tz_localize(None)
+            .dt.floor("H")
+        )
+        hour_offsets = (hours - start_hour) // pd.Timedelta(hours=1)
+        bitmap = int(state.completeness[i], 16)
+        for offset in hour_offsets.unique():
+            if offset >= 0:
+                bitmap |= 1 << int(offset)
+        state.completeness[i] = format(bitmap, "x")
+
+    hourly_values = hourly_device_array(
+        data, state.devices, state.inter_correlation_parameters
+    )
+    for i, parameter in enumerate(state.inter_correlation_parameters):
+        state.inter_sensor_moments[parameter] = (
+            np.array(state.inter_sensor_moments[parameter], dtype=float)
+            + pairwise_moments(hourly_values[:, :, i])
+        ).tolist()
+
+    state.moments = {key: value.tolist() for key, value in moments.items()}
+    state.intra_sensor_moments = {
+        key: value.tolist() for key, value in intra_sensor_moments.items()
+    }
+    state.watermark = watermark
+    state.data_source = data_source
+    return state
+
+
+def statistics_from_state(state: CollocationBatchState) -> list[dict]:
+    count, total, squares, minimum, maximum = (
+        np.array(state.moments[key], dtype=float)
+        for key in ["count", "sum", "squares", "min", "max"]
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares - total * mean, 0) / (count - 1))
+    std[count < 2] = np.nan
+
+    def value(x):
+        return None if np.isnan(x) else float(x)
+
+    statistics = []
+    for i, device in enumerate(state.devices):
+        device_statistics = {}
+        for j, col in enumerate(state.columns):
+            percentiles = sketch_percentiles(
+                state.sketches[device][col], [0.25, 0.5, 0.75]
+            )
+            device_statistics = {
+                **device_statistics,
+                **{
+                    f"{col}_mean": value(mean[i, j]),
+                    f"{col}_std": value(std[i, j]),
+                    f"{col}_min": value(minimum[i, j]),
+                    f"{col}_max": value(maximum[i, j]),
+                    f"{col}_25_percentile": percentiles[0],
+                    f"{col}_50_percentile": percentiles[1],
+                    f"{col}_75_percentile": percentiles[2],
+                },
+            }
+        statistics.append({**device_statistics, **{"device_name": device}})
+
+    return statistics
+
+
+def compute_results_from_state(
+    collocation_batch: CollocationBatch, state: CollocationBatchState
+) -> CollocationBatchResult:
+    """
+    Computes the collocation batch results from its running statistics.
+    """
+    data_completeness = data_completeness_result(
+        collocation_batch=collocation_batch,
+        hourly_records={
+            device: bin(int(bitmap, 16)).count("1")
+            for device, bitmap in zip(state.devices, state.completeness)
+        },
+    )
+
+    intra_sensor_pearson = {
+        pollutant: correlation_from_moments(*np.array(moments, dtype=float).T).round(4)
+        for pollutant, moments in state.intra_sensor_moments.items()
+    }
+    correlation = []
+    for i, device in enumerate(state.devices):
+        pm2_5_pearson = intra_sensor_pearson["pm2_5"][i]
+        pm10_pearson = intra_sensor_pearson["pm10"][i]
+        correlation.append(
+            device_intra_sensor_correlation(
+                device=device,
+                pm2_5_pearson=None if np.isnan(pm2_5_pearson) else float(pm2_5_pearson),
+                pm10_pearson=None if np.isnan(pm10_pearson) else float(pm10_pearson),
+                threshold=collocation_batch.intra_correlation_threshold,
+                parameter=collocation_batch.intra_correlation_parameter,
+                r2_threshold=collocation_batch.intra_correlation_r2_threshold,
+            )
+        )
+    intra_sensor_correlation = intra_sensor_correlation_results(
+        devices=collocation_batch.devices, correlation=correlation
+    )
+
+    if len(collocation_batch.devices) < 2:
+        inter_sensor_correlation = BaseResult(
+            results=[],
+            passed_devices=collocation_batch.devices,
+            failed_devices=[],
+            errors=[],
+            error_devices=[],
+        )
+    else:
+        inter_sensor_correlation = inter_sensor_correlation_results(
+            devices=collocation_batch.devices,
+            data_devices=state.devices,
+            correlations={
+                parameter: (
+                    state.devices,
+                    correlation_from_pairwise_moments(np.array(moments, dtype=float)),
+                )
+                for parameter, moments in state.inter_sensor_moments.items()
+            },
+            threshold=collocation_batch.inter_correlation_threshold,
+            r2_threshold=collocation_batch.inter_correlation_r2_threshold,
+            parameter=collocation_batch.inter_correlation_parameter,
+            base_device=collocation_batch.base_device,
+        )
+
+    statistics = statistics_from_state(state)
+    differences = compute_differences(
+        statistics=copy.deepcopy(statistics),
+        base_device=collocation_batch.base_device,
+        devices=collocation_batch.devices,
+        parameter=collocation_batch.differences_parameter,
+        threshold=collocation_batch.differences_threshold,
+    )
+
+    errors = []
+    errors.extend(inter_sensor_correlation.errors)
+    errors.extend(differences.errors)
+    errors.extend(intra_sensor_correlation.errors)
+    errors.extend(data_completeness.errors)
+
+    return CollocationBatchResult(
+        data_completeness=data_completeness,
+        intra_sensor_correlation=intra_sensor_correlation,
+        data_source=state.data_source,
+        statistics=statistics,
+        inter_sensor_correlation=inter_sensor_correlation,
+        differences=differences,
+        errors=errors,
+    )
@@ -0,0 +1,134 @@
+"""
+Compares the set-based uptime computation in calculate_devices_uptime with the
+per-channel queries it replaced.
+
+Bytes scanned are measured with BigQuery dry runs, which are free. Pass --execute
+to also run both versions and time them; the legacy run issues one query per
+device and time period, so it is billed accordingly.
+
+    python -m jobs.benchmark_devices_uptime [--execute]
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import pandas as pd
+from google.cloud import bigquery
+
+from jobs.calculate_devices_uptime import (
+    HOURLY_CHANNEL_DATA_QUERY,
+    TIME_PERIODS,
+    calculate_device_uptime,
+    compute_uptime_records,
+    get_all_devices,
+    get_hourly_channel_data,
+    get_hourly_channel_data_query_config,
+    get_specified_hours,
+)
+
+LEGACY_RAW_CHANNEL_DATA_QUERY = """
+    SELECT SAFE_CAST(TIMESTAMP(created_at) as DATETIME) as time, channel_id,field1 as s1_pm2_5,
+    field2 as s1_pm10, field3 as s2_pm2_5, field4 as s2_pm10, field7 as battery_voltage
+    FROM `airqo-250220.thingspeak.raw_feeds_pms`
+    WHERE channel_id = '{0}' AND CAST(created_at as TIMESTAMP) >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {1} HOUR)
+    ORDER BY time DESC
+"""
+
+
+def legacy_valid_hourly_records_count(client, channel_id, hours):
+    """
+    The per-channel query and pandas resampling previously run for every device and time period
+    """
+    df = client.query(
+        LEGACY_RAW_CHANNEL_DATA_QUERY.format(channel_id, hours)
+    ).to_dataframe()
+    df["time"] = pd.to_datetime(df["time"])
+    for column in [
+        "channel_id",
+        "s1_pm2_5",
+        "s1_pm10",
+        "s2_pm2_5",
+        "s2_pm10",
+        "battery_voltage",
+    ]:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    df["s1_s2_average_pm2_5"] = df[["s1_pm2_5", "s2_pm2_5"]].mean(axis=1).round(2)
+    df["s1_s2_average_pm10"] = df[["s1_pm10", "s2_pm10"]].mean(axis=1).round(2)
+    final_hourly_data = df.set_index("time").resample("H").mean().round(2)
+    # the daily readings were resampled for every period, even though only one kept them
+    final_hourly_data.resample("D").mean().dropna()
+    records_with_valid_values = final_hourly_data[
+        final_hourly_data["s1_s2_average_pm2_5"] > 0
+    ]
+    return records_with_valid_values.dropna().shape[0]
+
+
+def dry_run_bytes(client, query, job_config=None):
+    job_config = job_config or bigquery.QueryJobConfig()
+    job_config.dry_run = True
+    job_config.use_query_cache = False
+    return client.query(query, job_config=job_config).total_bytes_processed
+
+
+def benchmark(execute=False):
+    client = bigquery.Client()
+    devices = get_all_devices()
+    today = datetime.now().date()
+    current_hour = pd.Timestamp.utcnow().tz_localize(None).floor("H")
+    pairs = [
+        (device["channelID"], get_specified_hours(time_period, device, today))
+        for time_period in TIME_PERIODS
+        for device in devices
+    ]
+    start_time = current_hour - pd.Timedelta(
+        hours=max([hours for _, hours in pairs], default=0)
+    )
+    start_time = start_time.tz_localize("UTC").to_pydatetime()
+
+    legacy_bytes = sum(
+        dry_run_bytes(client, LEGACY_RAW_CHANNEL_DATA_QUERY.format(channel_id, hours))
+        for channel_id, hours in pairs
+    )
+    set_based_bytes = dry_run_bytes(
+        client,
+        HOURLY_CHANNEL_DATA_QUERY,
+        get_hourly_channel_data_query_config(
+            [device["channelID"] for device in devices], start_time
+        ),
+    )
+    results = {
+        "devices": len(devices),
+        "legacy_queries": len(pairs),
+        "legacy_bytes_scanned": legacy_bytes,
+        "set_based_queries": 1,
+        "set_based_bytes_scanned": set_based_bytes,
+    }
+
+    if execute:
+        started = time.perf_counter()
+        for channel_id, hours in pairs:
+            calculate_device_uptime(
+                hours, legacy_valid_hourly_records_count(client, channel_id, hours)
+            )
+        results["legacy_seconds"] = round(time.perf_counter() - started, 2)
+
+        started = time.perf_counter()
+        hourly_data = get_hourly_channel_data(
+            [device["channelID"] for device in devices], start_time
+        )
+        compute_uptime_records(devices, TIME_PERIODS, hourly_data, current_hour, today)
+        results["set_based_seconds"] = round(time.perf_counter() - started, 2)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--execute", action="store_true", help="run both versions and time them"
+    )
+    args = parser.parse_args()
+
+    for name, value in benchmark(args.execute).items():
+        print(f"{name}\t{value}")
@@ -75,157 +75,168 @@ def compute_number_of_months_between_two_dates(start_date, end_date):
     return number_of_months
 
 
-def get_raw_channel_data(channel_id: int, hours=24):
-    channel_id = str(channel_id)
-    client = bigquery.Client()
-    sql_query = """ 
-           
-            SELECT SAFE_CAST(TIMESTAMP(created_at) as DATETIME) as time, channel_id,field1 as s1_pm2_5,
-            field2 as s1_pm10, field3 as s2_pm2_5, field4 as s2_pm10, field7 as battery_voltage
-            FROM `airqo-250220.thingspeak.raw_feeds_pms` 
-            WHERE channel_id = {0} AND CAST(created_at as TIMESTAMP) >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {1} HOUR) 
-            ORDER BY time DESC           
-            
-        """
-    xx = "'" + channel_id + "'"
-    sql_query = sql_query.format(xx, hours)
-
-    job_config = bigquery.QueryJobConfig()
-    job_config.use_legacy_sql = False
-
-    df = client.query(sql_query, job_config=job_config).to_dataframe()
-    df['time'] = pd.to_datetime(df['time'])
-    df['time'] = df['time']
-    df['s1_pm2_5'] = pd.to_numeric(df['s1_pm2_5'], errors='coerce')
-    df['channel_id'] = pd.to_numeric(df['channel_id'], errors='coerce')
-    df['s1_pm10'] = pd.to_numeric(df['s1_pm10'], errors='coerce')
-    df['s2_pm2_5'] = pd.to_numeric(df['s2_pm2_5'], errors='coerce')
-    df['s2_pm10'] = pd.to_numeric(df['s2_pm10'], errors='coerce')
-    df['s1_s2_average_pm2_5'] = df[[
-        's1_pm2_5', 's2_pm2_5']].mean(axis=1).round(2)
-    df['s1_s2_average_pm10'] = df[['s1_pm10', 's2_pm10']].mean(axis=1).round(2)
-    df['battery_voltage'] = pd.to_numeric(
-        df['battery_voltage'], errors='coerce')
-    time_indexed_data = df.set_index('time')
-    final_hourly_data = time_indexed_data.resample('H').mean().round(2)
-
-    final_hourly_data_copy = final_hourly_data.resample('D').mean().dropna()
-    sensor_one_pm2_5_readings = final_hourly_data_copy['s1_pm2_5'].tolist()
-    sensor_two_pm2_5_readings = final_hourly_data_copy['s2_pm2_5'].tolist()
-    battery_voltage_readings = final_hourly_data_copy['battery_voltage'].tolist(
+HOURLY_CHANNEL_DATA_COLUMNS = ['s1_pm2_5', 's1_pm10', 's2_pm2_5', 's2_pm10',
+                               's1_s2_average_pm2_5', 's1_s2_average_pm10', 'battery_voltage']
+
+HOURLY_CHANNEL_DATA_QUERY = """
+    WITH raw_feeds AS (
+        SELECT channel_id,
+            DATETIME_TRUNC(SAFE_CAST(TIMESTAMP(created_at) AS DATETIME), HOUR) AS time,
+            SAFE_CAST(field1 AS FLOAT64) AS s1_pm2_5, SAFE_CAST(field2 AS FLOAT64) AS s1_pm10,
+            SAFE_CAST(field3 AS FLOAT64) AS s2_pm2_5, SAFE_CAST(field4 AS FLOAT64) AS s2_pm10,
+            SAFE_CAST(field7 AS FLOAT64) AS battery_voltage
+        FROM `airqo-250220.thingspeak.raw_feeds_pms`
+        WHERE channel_id IN UNNEST(@channel_ids) AND CAST(created_at AS TIMESTAMP) >= @start_time
     )
-    time_readings = final_hourly_data_copy.index.tolist()
+    SELECT channel_id, time,
+        AVG(s1_pm2_5) AS s1_pm2_5, AVG(s1_pm10) AS s1_pm10,
+        AVG(s2_pm2_5) AS s2_pm2_5, AVG(s2_pm10) AS s2_pm10,
+        AVG(ROUND(COALESCE((s1_pm2_5 + s2_pm2_5) / 2, s1_pm2_5, s2_pm2_5), 2)) AS s1_s2_average_pm2_5,
+        AVG(ROUND(COALESCE((s1_pm10 + s2_pm10) / 2, s1_pm10, s2_pm10), 2)) AS s1_s2_average_pm10,
+        AVG(battery_voltage) AS battery_voltage
+    FROM raw_feeds
+    WHERE time IS NOT NULL
+    GROUP BY channel_id, time
+"""
+
+
+def get_hourly_channel_data_query_config(channel_ids, start_time, dry_run=False):
+    return bigquery.QueryJobConfig(
+        use_legacy_sql=False,
+        dry_run=dry_run,
+        query_parameters=[
+            bigquery.ArrayQueryParameter('channel_ids', 'STRING', [
+                                         str(channel_id) for channel_id in channel_ids]),
+            bigquery.ScalarQueryParameter(
+                'start_time', 'TIMESTAMP', start_time),
+        ])
+
+
+def get_hourly_channel_data(channel_ids, start_time):
+    """
+    Fetches the hourly averages of every channel since start_time with a single query.
+    Each row is one channel-hour with data, flagged as valid when none of its averages
+    is missing and its average pm2_5 is positive.
+    """
+    client = bigquery.Client()
+    job_config = get_hourly_channel_data_query_config(channel_ids, start_time)
+    data = client.query(HOURLY_CHANNEL_DATA_QUERY,
+                        job_config=job_config).to_dataframe()
+    print('hourly records fetched\t' + str(len(data)))
 
-    total_hourly_records_count = final_hourly_data.shape[0]
+    data['channel_id'] = data['channel_id'].astype(str)
+    data['time'] = pd.to_datetime(data['time'])
+    data[HOURLY_CHANNEL_DATA_COLUMNS] = data[HOURLY_CHANNEL_DATA_COLUMNS].astype(
+        float).round(2)
+    data['valid'] = data[HOURLY_CHANNEL_DATA_COLUMNS].notna().all(
+        axis=1) & (data['s1_s2_average_pm2_5'] > 0)
+    return data
 
-    records_with_valid_values = final_hourly_data[final_hourly_data['s1_s2_average_pm2_5'] <= 500.4]
-    records_with_valid_values = final_hourly_data[final_hourly_data['s1_s2_average_pm2_5'] > 0]
 
-    records_with_valid_values_count = records_with_valid_values.shape[0]
+def get_specified_hours(time_period, device, today):
+    """
+    Returns the number of hours a device is expected to report in the given time period
+    """
+    specified_hours = int(time_period['specified_hours'])
 
-    invalid_records_count = records_with_valid_values - records_with_valid_values_count
+    if time_period['label'] == 'twelve_months':
+        past_day = today.day
+        past_month = (today.month - 12) % 12
+        past_year = today.year - ((today.month + 12)//12)
+        twelve_months_later = dt.date(past_year, past_month, past_day)
+        specified_hours = (today - twelve_months_later).days * 24
 
-    valid_hourly_records_with_out_null_values = records_with_valid_values.dropna().reset_index()
-    valid_hourly_records_with_out_null_values_count = valid_hourly_records_with_out_null_values.shape[
-        0]
+        device_registration_date = device['createdAt'].date()
+        number_of_months = compute_number_of_months_between_two_dates(
+            device_registration_date, today)
+        if number_of_months < 12:
+            specified_hours = (today - device_registration_date).days * 24
 
-    return valid_hourly_records_with_out_null_values_count, total_hourly_records_count, sensor_one_pm2_5_readings, sensor_two_pm2_5_readings, battery_voltage_readings, time_readings
+    elif time_period['label'] == 'all_time':
+        specified_hours = (today - device['createdAt'].date()).days * 24
 
+    if device['mobility'] == 'Mobile':
+        # divide the specified hours by 2.. for mobile devices, use 12 hours
+        specified_hours = int(specified_hours/2)
 
-def calculate_device_uptime(expected_total_records_count, actual_valid_records_count):
-    device_uptime_in_percentage = round(
-        ((actual_valid_records_count/expected_total_records_count) * 100), 2)
-    device_downtime_in_percentage = round(
-        ((expected_total_records_count-actual_valid_records_count)/expected_total_records_count) * 100)
-    if device_uptime_in_percentage > 100:
-        device_uptime_in_percentage = 100
-    if device_downtime_in_percentage < 0:
-        device_downtime_in_percentage = 0
+    return specified_hours
 
-    return device_uptime_in_percentage, device_downtime_in_percentage
 
+def count_valid_hours(hourly_data, channel_ids, start_times):
+    """
+    Counts the valid hours of each channel at or after the matching start time.
+    All the (channel, start time) pairs are answered by binary search over one sorted key.
+    """
+    valid_data = hourly_data[hourly_data['valid']]
+    channels = pd.Index(pd.unique(np.asarray(channel_ids, dtype=str)))
+    span = np.int64(10 ** 12)
 
-def compute_uptime_for_all_devices():
+    valid_codes = channels.get_indexer(valid_data['channel_id'])
+    keys = valid_codes * span + \
+        valid_data['time'].values.astype('datetime64[s]').astype(np.int64)
+    keys = np.sort(keys[valid_codes >= 0])
+
+    codes = channels.get_indexer(np.asarray(channel_ids, dtype=str)) * span
+    starts = np.asarray(start_times, dtype='datetime64[s]').astype(np.int64)
+    return np.searchsorted(keys, codes + span, side='left') - np.searchsorted(keys, codes + starts, side='left')
+
+
+def get_daily_readings(hourly_data, windows):
+    """
+    Returns the daily sensor one, sensor two and battery voltage readings of each device
+    within its window, keyed by device id
+    """
+    data = hourly_data.merge(windows, on='channel_id')
+    data = data[data['time'] >= data['start_time']]
+    data['day'] = data['time'].dt.floor('D')
+    daily_data = data.groupby(['device_id', 'day'])[
+        HOURLY_CHANNEL_DATA_COLUMNS].mean().dropna().reset_index()
+
+    readings = {}
+    for device_id, device_data in daily_data.groupby('device_id', sort=False):
+        readings[device_id] = (device_data['s1_pm2_5'].tolist(), device_data['s2_pm2_5'].tolist(),
+                               device_data['battery_voltage'].tolist(), device_data['day'].tolist())
+    return readings
 
-    time_periods = [{'label': 'twenty_four_hours', 'specified_hours': 24, 'specifed_hours_mobile': 12}, {'label': 'seven_days', 'specified_hours': 168, 'specifed_hours_mobile': 84},
-                    {'label': 'twenty_eight_days', 'specified_hours': 672, 'specifed_hours_mobile': 336}, {'label': 'twelve_months', 'specified_hours': 0, 'specifed_hours_mobile': 0}, {'label': 'all_time', 'specified_hours': 0, 'specifed_hours_mobile': 0}]
 
-    average_uptime_for_entire_network_in_percentage_for_twentyfour_hours = {}
-    twentyfour_hours = 0
-    average_uptime_for_entire_network_in_percentage_for_seven_days = {}
-    seven_days = 0
-    average_uptime_for_entire_network_in_percentage_for_twenty_eight_days = {}
-    twenty_eight_days = 0
-    average_uptime_for_entire_network_in_percentage_for_twelve_months = {}
-    twelve_months = 0
-    average_uptime_for_entire_network_in_percentage_for_all_time = {}
-    all_time = 0
+def compute_uptime_records(devices, time_periods, hourly_data, current_hour, today):
+    """
+    Derives the device uptime records and the network average of every time period
+    from the hourly channel data
+    """
+    created_at = str_to_date(date_to_str(datetime.now()))
+    network_uptime_records = {}
 
     for time_period in time_periods:
-        results = get_all_devices()
-        specified_hours = int(time_period['specified_hours'])
+        windows = pd.DataFrame({
+            'device_id': [device['_id'] for device in devices],
+            'channel_id': [str(device['channelID']) for device in devices],
+            'specified_hours': [get_specified_hours(time_period, device, today) for device in devices],
+        })
+        windows['start_time'] = current_hour - \
+            pd.to_timedelta(windows['specified_hours'], unit='h')
+        valid_hours = count_valid_hours(
+            hourly_data, windows['channel_id'], windows['start_time'])
+
+        readings = {}
+        if time_period['label'] == 'twenty_eight_days':
+            readings = get_daily_readings(hourly_data, windows)
+
         device_uptime_records = []
         all_devices_uptime_series = []
-
-        if time_period['label'] == 'twelve_months':
-            today = dt.date.today()
-            past_day = today.day
-            past_month = (today.month - 12) % 12
-            past_year = today.year - ((today.month + 12)//12)
-            twelve_months_later = dt.date(past_year, past_month, past_day)
-            delta = datetime.now().date() - twelve_months_later
-            no_of_days = delta.days
-            specified_hours = no_of_days * 24
-
-        elif time_period['label'] == 'all_time':
-            no_of_days = 365
-            specified_hours = no_of_days * 24
-
-        print('specified hours\t' + str(specified_hours))
-        for device in results:
-            channel_id = device['channelID']
-            mobililty = device['mobility']
-            device_id = device['_id']
-            device_name = device['name']
-
-            if time_period['label'] == 'twelve_months':
-                device_registration_date = device['createdAt']
-                end_date = datetime.now().date()
-                start_date = device_registration_date.date()
-                number_of_months = compute_number_of_months_between_two_dates(
-                    start_date, end_date)
-                if number_of_months < 12:
-                    delta = end_date - device_registration_date.date()
-                    no_of_days = delta.days
-                    specified_hours = no_of_days * 24
-
-            if time_period['label'] == 'all_time':
-                device_registration_date = device['createdAt']
-                delta = datetime.now().date() - device_registration_date.date()
-                no_of_days = delta.days
-                specified_hours = no_of_days * 24
-
-            if mobililty == 'Mobile':
-                # divide the specified hours by 2.. for mobile devices, use 12 hours
-                specified_hours = int(specified_hours/2)
-
-            valid_hourly_records_with_out_null_values_count, total_hourly_records_count, sensor_one_pm2_5_readings, sensor_two_pm2_5_readings, battery_voltage_readings, time_readings = get_raw_channel_data(
-                channel_id, specified_hours)
-            print('valid records count' +
-                  str(valid_hourly_records_with_out_null_values_count))
+        for device, specified_hours, valid_hourly_records_count in zip(devices, windows['specified_hours'], valid_hours):
             device_uptime_in_percentage, device_downtime_in_percentage = calculate_device_uptime(
-                specified_hours, valid_hourly_records_with_out_null_values_count)
-            print('device-uptime \t' + str(device_uptime_in_percentage) +
-                  '\n downtime \t' + str(device_downtime_in_percentage))
-
-            created_at = str_to_date(date_to_str(datetime.now()))
+                int(specified_hours), int(valid_hourly_records_count))
 
             all_devices_uptime_series.append(device_uptime_in_percentage)
             device_uptime_record = {"device_uptime_in_percentage": device_uptime_in_percentage,
                                     "device_downtime_in_percentage": device_downtime_in_percentage, "created_at": created_at,
-                                    "device_channel_id": channel_id, "specified_time_in_hours": specified_hours, "device_name": device_name, "device_id": device_id}
+                                    "device_channel_id": device['channelID'], "specified_time_in_hours": int(specified_hours),
+                                    "device_name": device['name'], "device_id": device['_id']}
 
             if time_period['label'] == 'twenty_eight_days':
+                sensor_one_pm2_5_readings, sensor_two_pm2_5_readings, battery_voltage_readings, time_readings = readings.get(
+                    device['_id'], ([], [], [], []))
                 device_uptime_record["device_sensor_one_pm2_5_readings"] = sensor_one_pm2_5_readings
                 device_uptime_record["device_sensor_two_pm2_5_readings"] = sensor_two_pm2_5_readings
                 device_uptime_record["device_battery_voltage_readings"] = battery_voltage_readings
@@ -235,66 +246,57 @@ def compute_uptime_for_all_devices():
 
         average_uptime_for_entire_network_in_percentage_for_selected_timeperiod = round(
             np.mean(all_devices_uptime_series), 2)
-        created_at = str_to_date(date_to_str(datetime.now()))
-
-        print('average uptime for entire network in percentage is : {}%'.format(
-            average_uptime_for_entire_network_in_percentage_for_selected_timeperiod))
-
-        if time_period['label'] == 'twenty_four_hours':
-            entire_network_uptime_record = {"average_uptime_for_entire_network_in_percentage": average_uptime_for_entire_network_in_percentage_for_selected_timeperiod,
-                                            "device_uptime_records": device_uptime_records, "created_at": created_at, 'specified_time_in_hours': specified_hours}
-
-            twentyfour_hours = average_uptime_for_entire_network_in_percentage_for_selected_timeperiod
-            average_uptime_for_entire_network_in_percentage_for_twentyfour_hours = entire_network_uptime_record
-            print('twenty four hours' +
-                  str(average_uptime_for_entire_network_in_percentage_for_selected_timeperiod))
-        elif time_period['label'] == 'seven_days':
-            entire_network_uptime_record = {"average_uptime_for_entire_network_in_percentage": average_uptime_for_entire_network_in_percentage_for_selected_timeperiod,
-                                            "device_uptime_records": device_uptime_records, "created_at": created_at, 'specified_time_in_hours': specified_hours}
-
-            seven_days = average_uptime_for_entire_network_in_percentage_for_selected_timeperiod
-            average_uptime_for_entire_network_in_percentage_for_seven_days = entire_network_uptime_record
-        elif time_period['label'] == 'twelve_months':
-            entire_network_uptime_record = {"average_uptime_for_entire_network_in_percentage": average_uptime_for_entire_network_in_percentage_for_selected_timeperiod,
-                                            "device_uptime_records": device_uptime_records, "created_at": created_at, 'specified_time_in_hours': specified_hours}
-
-            twelve_months = average_uptime_for_entire_network_in_percentage_for_selected_timeperiod
-            print('twelve_months' +
-                  str(average_uptime_for_entire_network_in_percentage_for_selected_timeperiod))
-            average_uptime_for_entire_network_in_percentage_for_twelve_months = entire_network_uptime_record
-        elif time_period['label'] == 'twenty_eight_days':
-            entire_network_uptime_record = {"average_uptime_for_entire_network_in_percentage": average_uptime_for_entire_network_in_percentage_for_selected_timeperiod,
-                                            "device_uptime_records": device_uptime_records, "created_at": created_at, 'specified_time_in_hours': specified_hours}
-
-            twenty_eight_days = average_uptime_for_entire_network_in_percentage_for_selected_timeperiod
-            print(
-                '28 days' + str(average_uptime_for_entire_network_in_percentage_for_selected_timeperiod))
-            average_uptime_for_entire_network_in_percentage_for_twenty_eight_days = entire_network_uptime_record
-        elif time_period['label'] == 'all_time':
-            entire_network_uptime_record = {"average_uptime_for_entire_network_in_percentage": average_uptime_for_entire_network_in_percentage_for_selected_timeperiod,
-                                            "device_uptime_records": device_uptime_records, "created_at": created_at, 'specified_time_in_hours': specified_hours}
-
-            all_time = average_uptime_for_entire_network_in_percentage_for_selected_timeperiod
-            print(
-                'alltime' + str(average_uptime_for_entire_network_in_percentage_for_selected_timeperiod))
-            average_uptime_for_entire_network_in_percentage_for_all_time = entire_network_uptime_record
-
-    all_network_device_uptime_records = []
-
-    entire_network_uptime_record_for_all_periods = {"average_uptime_for_entire_network_for_twentyfour_hours": average_uptime_for_entire_network_in_percentage_for_twentyfour_hours,
-                                                    "average_uptime_for_entire_network_for_seven_days": average_uptime_for_entire_network_in_percentage_for_seven_days,
-                                                    "average_uptime_for_entire_network_for_twenty_eight_days": average_uptime_for_entire_network_in_percentage_for_twenty_eight_days,
-                                                    "average_uptime_for_entire_network_for_twelve_months": average_uptime_for_entire_network_in_percentage_for_twelve_months,
-                                                    "average_uptime_for_entire_network_for_all_time": average_uptime_for_entire_network_in_percentage_for_all_time,
-                                                    "created_at": created_at}
-
-    all_network_device_uptime_records.append(
-        entire_network_uptime_record_for_all_periods)
-
-    # print('average uptime for entire network is : {}%'.format(
-    # entire_network_uptime_record_for_all_periods))
-
-    save_network_uptime_analysis_results(all_network_device_uptime_records)
+        print('average uptime for entire network in percentage for {} is : {}%'.format(
+            time_period['label'], average_uptime_for_entire_network_in_percentage_for_selected_timeperiod))
+
+        network_uptime_records[time_period['label']] = {"average_uptime_for_entire_network_in_percentage": average_uptime_for_entire_network_in_percentage_for_selected_timeperiod,
+                                                        "device_uptime_records": device_uptime_records, "created_at": created_at,
+                                                        'specified_time_in_hours': int(windows['specified_hours'].max()) if len(windows) else 0}
+
+    return network_uptime_records
+
+
+def calculate_device_uptime(expected_total_records_count, actual_valid_records_count):
+    device_uptime_in_percentage = round(
+        ((actual_valid_records_count/expected_total_records_count) * 100), 2)
+    device_downtime_in_percentage = round(
+        ((expected_total_records_count-actual_valid_records_count)/expected_total_records_count) * 100)
+    if device_uptime_in_percentage > 100:
+        device_uptime_in_percentage = 100
+    if device_downtime_in_percentage < 0:
+        device_downtime_in_percentage = 0
+
+    return device_uptime_in_percentage, device_downtime_in_percentage
+
+
+TIME_PERIODS = [{'label': 'twenty_four_hours', 'specified_hours': 24, 'specifed_hours_mobile': 12}, {'label': 'seven_days', 'specified_hours': 168, 'specifed_hours_mobile': 84},
+                {'label': 'twenty_eight_days', 'specified_hours': 672, 'specifed_hours_mobile': 336}, {'label': 'twelve_months', 'specified_hours': 0, 'specifed_hours_mobile': 0}, {'label': 'all_time', 'specified_hours': 0, 'specifed_hours_mobile': 0}]
+
+
+def compute_uptime_for_all_devices():
+    devices = get_all_devices()
+    today = datetime.now().date()
+    current_hour = pd.Timestamp.utcnow().tz_localize(None).floor('H')
+
+    longest_specified_hours = max([get_specified_hours(time_period, device, today)
+                                  for time_period in TIME_PERIODS for device in devices], default=0)
+    start_time = current_hour - pd.Timedelta(hours=longest_specified_hours)
+    print('specified hours\t' + str(longest_specified_hours))
+
+    hourly_data = get_hourly_channel_data(
+        [device['channelID'] for device in devices], start_time.tz_localize('UTC').to_pydatetime())
+    network_uptime_records = compute_uptime_records(
+        devices, TIME_PERIODS, hourly_data, current_hour, today)
+
+    entire_network_uptime_record_for_all_periods = {"average_uptime_for_entire_network_for_twentyfour_hours": network_uptime_records['twenty_four_hours'],
+                                                    "average_uptime_for_entire_network_for_seven_days": network_uptime_records['seven_days'],
+                                                    "average_uptime_for_entire_network_for_twenty_eight_days": network_uptime_records['twenty_eight_days'],
+                                                    "average_uptime_for_entire_network_for_twelve_months": network_uptime_records['twelve_months'],
+                                                    "average_uptime_for_entire_network_for_all_time": network_uptime_records['all_time'],
+                                                    "created_at": str_to_date(date_to_str(datetime.now()))}
+
+    save_network_uptime_analysis_results(
+        [entire_network_uptime_record_for_all_periods])
 
 
 def save_network_uptime_analysis_results(data):
@@ -631,3 +631,61 @@ class CollocationSummary:
     status: str
     date_added: datetime
     status_summary: list[DeviceStatusSummary]
+
+
+@dataclass
+class CollocationBatchState:
+    """
+    Running sufficient statistics of a collocation batch, updated with the raw data
+    received after `watermark` so that results do not have to be recomputed from
+    the full batch window.
+    """
+
+    batch_id: str
+    devices: list[str]
+    columns: list[str]
+    start_date: datetime
+    watermark: datetime
+    data_completeness_parameter: str
+    inter_correlation_parameters: list[str]
+    data_source: str
+
+    # count, sum, squares, min and max of each column: device x column
+    moments: dict[str, list]
+    # n, sum x, sum y, sum x², sum y², sum xy of each sensor pair: device x 6
+    intra_sensor_moments: dict[str, list]
+    # counts, sums, squares and products of hourly means: 4 x device x device
+    inter_sensor_moments: dict[str, list]
+    # Hex bitmap per device of the hours since start_date with data
+    completeness: list[str]
+    # Log bucketed value counts per device and column, used for percentiles
+    sketches: dict[str, dict]
+
+    def to_dict(self):
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(doc: dict):
+        return CollocationBatchState(
+            **{
+                field: doc[field]
+                for field in CollocationBatchState.__dataclass_fields__.keys()
+            }
+        )
+
+    def is_valid_for(self, batch: CollocationBatch, columns: list[str]) -> bool:
+        return (
+            self.devices == batch.devices
+            and self.columns == columns
+            and self.start_date == batch.start_date
+            and self.data_completeness_parameter == batch.data_completeness_parameter
+            and self.inter_correlation_parameters
+            == list(
+                dict.fromkeys(
+                    [
+                        batch.inter_correlation_parameter,
+                        *batch.inter_correlation_additional_parameters,
+                    ]
+                )
+            )
+        )
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from jobs.calculate_devices_uptime import (
+    HOURLY_CHANNEL_DATA_COLUMNS,
+    TIME_PERIODS,
+    compute_uptime_records,
+    count_valid_hours,
+)
+
+CURRENT_HOUR = pd.Timestamp("2024-07-29 10:00")
+
+
+@pytest.fixture
+def hourly_data():
+    times = pd.date_range(end=CURRENT_HOUR, periods=700, freq="H")
+    data = pd.DataFrame(
+        {
+            "channel_id": np.repeat(["1", "2"], len(times)),
+            "time": np.tile(times, 2),
+        }
+    )
+    for column in HOURLY_CHANNEL_DATA_COLUMNS:
+        data[column] = 10.0
+    # channel 2 only reports every other hour
+    data["valid"] = (data["channel_id"] == "1") | (data.index % 2 == 0)
+    return data
+
+
+def test_count_valid_hours(hourly_data):
+    start_times = [
+        CURRENT_HOUR - pd.Timedelta(hours=23),
+        CURRENT_HOUR - pd.Timedelta(hours=23),
+        CURRENT_HOUR,
+    ]
+
+    counts = count_valid_hours(hourly_data, ["1", "2", "3"], start_times)
+
+    assert counts.tolist() == [24, 12, 0]
+
+
+def test_compute_uptime_records(hourly_data):
+    devices = [
+        {
+            "_id": channel_id,
+            "channelID": int(channel_id),
+            "name": f"aq_{channel_id}",
+            "mobility": "Static",
+            "createdAt": datetime(2024, 7, 1),
+        }
+        for channel_id in ["1", "2"]
+    ]
+    time_periods = [
+        time_period
+        for time_period in TIME_PERIODS
+        if time_period["label"] in ["twenty_four_hours", "twenty_eight_days"]
+    ]
+
+    records = compute_uptime_records(
+        devices, time_periods, hourly_data, CURRENT_HOUR, CURRENT_HOUR.date()
+    )
+
+    twenty_four_hours = records["twenty_four_hours"]
+    assert [
+        record["device_uptime_in_percentage"]
+        for record in twenty_four_hours["device_uptime_records"]
+    ] == [100, 50.0]
+    assert twenty_four_hours["average_uptime_for_entire_network_in_percentage"] == 75.0
+    record = records["twenty_eight_days"]["device_uptime_records"][0]
+    assert record["specified_time_in_hours"] == 672
+    assert len(record["device_time_readings"]) == 29
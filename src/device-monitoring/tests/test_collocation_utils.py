@@ -5,7 +5,19 @@ import numpy as np
 import pandas as pd
 import pytest
 
-from helpers.collocation_utils import compute_data_completeness_using_hourly_records
+from helpers.collocation_utils import (
+    compute_data_completeness_using_hourly_records,
+    compute_differences,
+    compute_inter_sensor_correlation,
+    compute_intra_sensor_correlation,
+    compute_results_from_state,
+    compute_statistics,
+    new_collocation_state,
+    update_collocation_state,
+    device_pairs,
+    hourly_device_array,
+    pairwise_correlation,
+)
 from models.collocation import (
     CollocationBatch,
     CollocationBatchStatus,
@@ -258,3 +270,181 @@ def test_differences_threshold(collocation_batch):
     collocation_batch.differences_threshold = 6
     valid = collocation_batch.validate(raise_exception=False)
     assert valid is False
+
+
+def test_device_pairs():
+    assert device_pairs(["x", "y", "z", "x"]) == [["x", "y"], ["x", "z"], ["y", "z"]]
+
+
+def test_hourly_device_array():
+    data = {
+        "x": pd.DataFrame(
+            {
+                "timestamp": [
+                    "2024-01-01 00:10",
+                    "2024-01-01 00:40",
+                    "2024-01-01 02:00",
+                ],
+                "pm2_5": [10.0, 20.0, 30.0],
+            }
+        ),
+        "y": pd.DataFrame({"timestamp": ["2024-01-01 01:00"], "pm2_5": [5.0]}),
+    }
+
+    values = hourly_device_array(data, ["x", "y", "z"], ["pm2_5", "pm10"])
+
+    assert values.shape == (3, 3, 2)
+    np.testing.assert_array_equal(values[0, :, 0], [15.0, np.nan, 30.0])
+    np.testing.assert_array_equal(values[1, :, 0], [np.nan, 5.0, np.nan])
+    assert np.isnan(values[2]).all()
+    assert np.isnan(values[:, :, 1]).all()
+
+
+def test_pairwise_correlation_matches_pandas():
+    values = np.random.uniform(20, 100, (4, 50))
+    values[0, :10] = np.nan
+    values[1, 5:15] = np.nan
+    values[3] = 10.0
+
+    correlation = pairwise_correlation(values)
+    expected = pd.DataFrame(values.T).corr().to_numpy()
+
+    np.testing.assert_allclose(correlation, expected, atol=1e-10)
+
+
+def test_compute_inter_sensor_correlation():
+    timestamps = pd.date_range("2024-01-01", periods=48, freq="H")
+    pm2_5 = np.random.uniform(20, 100, 48)
+    data = {
+        "x": pd.DataFrame({"timestamp": timestamps, "pm2_5": pm2_5, "pm10": pm2_5}),
+        "y": pd.DataFrame(
+            {"timestamp": timestamps, "pm2_5": pm2_5 * 2 + 1, "pm10": pm2_5}
+        ),
+        "z": pd.DataFrame({"timestamp": timestamps, "pm2_5": -pm2_5, "pm10": pm2_5}),
+    }
+
+    result = compute_inter_sensor_correlation(
+        devices=["x", "y", "z"],
+        data=data,
+        threshold=0.9,
+        r2_threshold=0.9,
+        parameter="pm2_5",
+        base_device="",
+        other_parameters=["pm10"],
+    )
+
+    results = {tuple(result["devices"]): result for result in result.results}
+    assert list(results.keys()) == [("x", "y"), ("x", "z"), ("y", "z")]
+    assert results[("x", "y")]["pm2_5_pearson"] == 1.0
+    assert results[("x", "y")]["passed"] is True
+    assert results[("x", "z")]["pm2_5_pearson"] == -1.0
+    assert results[("x", "z")]["pm2_5_r2_pearson"] is None
+    assert results[("x", "z")]["passed"] is False
+    assert result.passed_devices == ["x", "y"] or result.passed_devices == ["y", "x"]
+    assert result.failed_devices == ["z"]
+
+
+def test_compute_differences():
+    statistics = [
+        {"device_name": "x", "pm2_5_mean": 10.0, "pm2_5_std": 1.0},
+        {"device_name": "y", "pm2_5_mean": 12.0, "pm2_5_std": None},
+        {"device_name": "z", "pm2_5_mean": 30.0},
+    ]
+
+    result = compute_differences(
+        statistics=statistics,
+        parameter="pm2_5",
+        threshold=5,
+        base_device="",
+        devices=["x", "y", "z"],
+    )
+
+    assert result.results == [
+        {
+            "devices": ["x", "y"],
+            "passed": True,
+            "differences": {"pm2_5_mean": 2.0, "pm2_5_std": None},
+        },
+        {
+            "devices": ["x", "z"],
+            "passed": False,
+            "differences": {"pm2_5_mean": 20.0, "pm2_5_std": None},
+        },
+        {
+            "devices": ["y", "z"],
+            "passed": False,
+            "differences": {"pm2_5_mean": 18.0, "pm2_5_std": None},
+        },
+    ]
+    assert sorted(result.passed_devices) == ["x", "y"]
+    assert result.failed_devices == ["z"]
+
+
+def test_incremental_collocation_state(collocation_batch):
+    start_date = collocation_batch.start_date
+    watermark = start_date + timedelta(hours=24)
+    end_date = start_date + timedelta(hours=48)
+    data = {
+        device: generate_test_data(
+            device, 40, start_time=start_date, end_time=end_date - timedelta(hours=1)
+        )
+        for device in collocation_batch.devices
+    }
+
+    state = new_collocation_state(collocation_batch)
+    for window_start, window_end in [(start_date, watermark), (watermark, end_date)]:
+        state = update_collocation_state(
+            state=state,
+            data={
+                device: device_data[
+                    (device_data["timestamp"] >= window_start)
+                    & (device_data["timestamp"] < window_end)
+                ]
+                for device, device_data in data.items()
+            },
+            watermark=window_end,
+            data_source="",
+        )
+    results = compute_results_from_state(collocation_batch, state)
+
+    assert state.watermark == end_date
+    assert [result.actual for result in results.data_completeness.results] == [
+        40,
+        40,
+        40,
+    ]
+
+    intra_sensor_correlation = compute_intra_sensor_correlation(
+        devices=collocation_batch.devices,
+        data=data,
+        threshold=collocation_batch.intra_correlation_threshold,
+        parameter=collocation_batch.intra_correlation_parameter,
+        r2_threshold=collocation_batch.intra_correlation_r2_threshold,
+    )
+    for expected, result in zip(
+        intra_sensor_correlation.results, results.intra_sensor_correlation.results
+    ):
+        assert result.pm2_5_pearson == pytest.approx(expected.pm2_5_pearson)
+        assert result.pm10_pearson == pytest.approx(expected.pm10_pearson)
+
+    inter_sensor_correlation = compute_inter_sensor_correlation(
+        devices=collocation_batch.devices,
+        data=data,
+        threshold=collocation_batch.inter_correlation_threshold,
+        r2_threshold=collocation_batch.inter_correlation_r2_threshold,
+        parameter=collocation_batch.inter_correlation_parameter,
+        base_device=collocation_batch.base_device,
+        other_parameters=collocation_batch.inter_correlation_additional_parameters,
+    )
+    for expected, result in zip(
+        inter_sensor_correlation.results, results.inter_sensor_correlation.results
+    ):
+        assert result["pm2_5_pearson"] == pytest.approx(expected["pm2_5_pearson"])
+
+    for expected, result in zip(compute_statistics(data), results.statistics):
+        assert result["pm2_5_mean"] == pytest.approx(expected["pm2_5_mean"])
+        assert result["pm2_5_std"] == pytest.approx(expected["pm2_5_std"])
+        assert result["pm2_5_max"] == pytest.approx(expected["pm2_5_max"])
+        assert result["pm2_5_50_percentile"] == pytest.approx(
+            expected["pm2_5_50_percentile"], rel=0.02
+        )
@@ -29,6 +29,16 @@ class Config:
     BIGQUERY_AIRQLOUDS_SITES = os.getenv("BIGQUERY_AIRQLOUDS_SITES")
     BIGQUERY_HOURLY_DATA = os.getenv("BIGQUERY_HOURLY_DATA")
 
+    # Airqlouds with more training rows than the threshold use a sparse GP
+    GP_SPARSE_THRESHOLD = int(os.getenv("GP_SPARSE_THRESHOLD", 9000))
+    GP_INDUCING_POINTS = int(os.getenv("GP_INDUCING_POINTS", 300))
+    GP_MAX_ITERATIONS = int(os.getenv("GP_MAX_ITERATIONS", 100))
+    GP_WARM_START = os.getenv("GP_WARM_START", "True").lower() == "true"
+    GP_PREDICTION_GRID_SIZE = int(os.getenv("GP_PREDICTION_GRID_SIZE", 10))
+    GP_PREDICTION_BATCH_SIZE = int(os.getenv("GP_PREDICTION_BATCH_SIZE", 5000))
+    # Page size of the precomputed heatmap pages served by the predict API
+    GP_HEATMAP_PAGE_SIZE = int(os.getenv("GP_HEATMAP_PAGE_SIZE", 1000))
+
 
 class ProductionConfig(Config):
     MONGO_URI_NETMANAGER = os.getenv("MONGO_GCE_URI_NETMANAGER")
@@ -13,7 +13,7 @@ def drop_missing_value(df):
     df["time"] = pd.to_datetime(df["time"])
     df = df.drop_duplicates()
     drop_missing_df = df.dropna(axis=0)
-    drop_missing_df = drop_missing_df.sort_values(by="time")
+    drop_missing_df = drop_missing_df.sort_values(by="time", kind="stable")
     return drop_missing_df.reset_index(drop=True)
 
 
@@ -1,3 +1,7 @@
+import gzip
+import hashlib
+import json
+import math
 import requests
 from datetime import datetime
 import pandas as pd
@@ -5,11 +9,15 @@ import numpy as np
 import gpflow
 from google.cloud import bigquery
 from gpflow import set_trainable
+from gpflow.utilities import multiple_assign, parameter_dict
+from pymongo import DeleteMany, ReplaceOne
+from scipy.cluster.vq import kmeans2
 from config import connect_mongo, Config
 from config import configuration
 import argparse
 from threading import Thread
-from shapely.geometry import Point, Polygon
+import shapely
+from shapely.geometry import Polygon
 from data.data import (
     get_airqloud_data,
 )
@@ -39,112 +47,266 @@ def get_airqloud_polygon(tenant, airqloud_id):
     return polygon, min_long, max_long, min_lat, max_lat
 
 
-def train_model(X, Y, airqloud):
+def select_inducing_points(X, num_inducing):
     """
-    Creates a model and trains it using given data
+    Chooses the inducing inputs of a sparse GP as the k-means centroids of the training inputs
+    """
+    unique_inputs = np.unique(X, axis=0)
+    if unique_inputs.shape[0] <= num_inducing:
+        return unique_inputs
+
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1
+    centroids, _ = kmeans2(X / scale, num_inducing, minit="++", seed=0)
+    return centroids * scale
+
+
+def get_kernel(airqloud, input_dim):
+    """
+    Returns the kernel used for a given airqloud
+    """
+    if airqloud in ["kampala", "jinja"]:
+        return (
+            gpflow.kernels.RBF(lengthscales=np.ones(input_dim)) + gpflow.kernels.Bias()
+        )
+    if airqloud == "kira":
+        return gpflow.kernels.RBF() + gpflow.kernels.Bias()
+    return gpflow.kernels.RBF(variance=625) + gpflow.kernels.Bias()
+
+
+def get_model_hyperparameters(m):
+    """
+    Returns the kernel and likelihood parameter values of a trained model
+    """
+    return [
+        {"path": path, "value": parameter.numpy().tolist()}
+        for path, parameter in parameter_dict(m).items()
+        if path.startswith((".kernel", ".likelihood"))
+    ]
+
+
+def assign_model_hyperparameters(m, hyperparameters):
+    """
+    Warm-starts a model from the hyperparameters of a previous run, skipping any whose shape changed
+    """
+    parameters = parameter_dict(m)
+    values = {}
+    for hyperparameter in hyperparameters:
+        parameter = parameters.get(hyperparameter["path"])
+        value = np.asarray(hyperparameter["value"])
+        if parameter is not None and parameter.shape == value.shape:
+            values[hyperparameter["path"]] = value
+    multiple_assign(m, values)
+
+
+def get_hyperparameters(tenant, airqloud):
+    db = connect_mongo(tenant)
+    record = db["gp_model_hyperparameters"].find_one({"airqloud": airqloud})
+    return record["hyperparameters"] if record else None
+
+
+def save_hyperparameters(tenant, airqloud, m):
+    db = connect_mongo(tenant)
+    db["gp_model_hyperparameters"].update_one(
+        {"airqloud": airqloud},
+        {
+            "$set": {
+                "hyperparameters": get_model_hyperparameters(m),
+                "sparse": isinstance(m, gpflow.models.SGPR),
+                "updated_at": datetime.now(),
+            }
+        },
+        upsert=True,
+    )
+
+
+def train_model(X, Y, airqloud, hyperparameters=None):
+    """
+    Creates a model and trains it using given data.
+    Airqlouds with more than `GP_SPARSE_THRESHOLD` rows are fitted with a sparse GP
+    on all their rows instead of an exact GP, and previously learnt hyperparameters
+    are used as the starting point of the optimisation when given.
     """
     print("training model function")
 
-    if X.shape[0] > 9000:
-        Xtraining = X[::2, :]
-        Ytraining = Y[::2, :]
-    else:
-        Xtraining = X
-        Ytraining = Y.reshape(-1, 1)
+    Xtraining = X
+    Ytraining = Y.reshape(-1, 1)
 
     print("rows in Xtraining for " + airqloud + " airqloud", Xtraining.shape[0])
 
-    if airqloud == "kampala":
-        k = (
-            gpflow.kernels.RBF(lengthscales=np.ones(Xtraining.shape[1]))
-            + gpflow.kernels.Bias()
+    k = get_kernel(airqloud, Xtraining.shape[1])
+    if Xtraining.shape[0] > Config.GP_SPARSE_THRESHOLD:
+        inducing_points = select_inducing_points(Xtraining, Config.GP_INDUCING_POINTS)
+        print("inducing points for " + airqloud + " airqloud", inducing_points.shape[0])
+        m = gpflow.models.SGPR(
+            data=(Xtraining, Ytraining),
+            kernel=k,
+            inducing_variable=inducing_points,
+            mean_function=None,
         )
+        set_trainable(m.inducing_variable, False)
+    else:
         m = gpflow.models.GPR(data=(Xtraining, Ytraining), kernel=k, mean_function=None)
+
+    if airqloud == "kampala":
         set_trainable(m.kernel.kernels[0].lengthscales, False)
     elif airqloud == "kawempe":
-        k = gpflow.kernels.RBF(variance=625) + gpflow.kernels.Bias()
-        m = gpflow.models.GPR(data=(Xtraining, Ytraining), kernel=k, mean_function=None)
         set_trainable(m.kernel.kernels[0].variance, False)
-    elif airqloud == "kira":
-        k = gpflow.kernels.RBF() + gpflow.kernels.Bias()
-        m = gpflow.models.GPR(data=(Xtraining, Ytraining), kernel=k, mean_function=None)
-    elif airqloud == "jinja":
-        k = (
-            gpflow.kernels.RBF(lengthscales=np.ones(Xtraining.shape[1]))
-            + gpflow.kernels.Bias()
-        )
-        m = gpflow.models.GPR(data=(Xtraining, Ytraining), kernel=k, mean_function=None)
-    elif airqloud == "makindye":
-        k = gpflow.kernels.RBF(variance=625) + gpflow.kernels.Bias()
-        m = gpflow.models.GPR(data=(Xtraining, Ytraining), kernel=k, mean_function=None)
-    else:
-        k = gpflow.kernels.RBF(variance=625) + gpflow.kernels.Bias()
-        m = gpflow.models.GPR(data=(Xtraining, Ytraining), kernel=k, mean_function=None)
 
     if airqloud != "kampala":
         m.likelihood.variance.assign(400)
         set_trainable(m.likelihood.variance, False)
 
-    opt = gpflow.optimizers.Scipy()
-
-    def objective_closure():
-        return -m.log_marginal_likelihood()
+    if hyperparameters:
+        assign_model_hyperparameters(m, hyperparameters)
 
+    opt = gpflow.optimizers.Scipy()
     opt_logs = opt.minimize(
-        objective_closure, m.trainable_variables, options=dict(maxiter=100)
+        m.training_loss,
+        m.trainable_variables,
+        options=dict(maxiter=Config.GP_MAX_ITERATIONS),
     )
 
     return m
 
 
-def point_in_polygon(row, polygon):
+def predict_in_batches(m, X, batch_size=Config.GP_PREDICTION_BATCH_SIZE):
     """
-    Checks whether a geometric point lies within a given polygon
+    Predicts the latent mean and variance at X a batch at a time, reusing the
+    posterior computed once from the training data
     """
-    mypoint = Point(row.longitude, row.latitude)
-    if polygon.contains(mypoint):
-        return "True"
-    else:
-        return "False"
+    posterior = m.posterior()
+    means, variances = [], []
+    for start in range(0, X.shape[0], batch_size):
+        mean, var = posterior.predict_f(X[start : start + batch_size])
+        means.append(mean.numpy().flatten())
+        variances.append(var.numpy().flatten())
+    if not means:
+        return np.array([]), np.array([])
+    return np.concatenate(means), np.concatenate(variances)
+
+
+def get_grid_mask(poly, longitudes, latitudes):
+    """
+    Returns the mask of grid points lying within an airqloud's polygon
+    """
+    shapely.prepare(poly)
+    return shapely.contains_xy(poly, longitudes, latitudes)
 
 
 def save_predictions_on_bigquery(predictions):
     predictions = predictions[0]
+    if not predictions["values"]:
+        return
+
     airqloud_id = predictions["airqloud_id"]
     timestamp = date_to_str(predictions["created_at"])
 
-    data = list(
-        map(
-            lambda record: {
-                "airqloud_id": airqloud_id,
-                "timestamp": timestamp,
-                "pm2_5": record["predicted_value"],
-                "pm2_5_variance": record["variance"],
-                "pm2_5_confidence_interval": record["interval"],
-                "location": Point(record["longitude"], record["latitude"]).wkt,
-            },
-            predictions["values"],
-        )
-    )
+    values = pd.DataFrame(predictions["values"])
+    data = pd.DataFrame(
+        {
+            "airqloud_id": airqloud_id,
+            "timestamp": timestamp,
+            "pm2_5": values["predicted_value"],
+            "pm2_5_variance": values["variance"],
+            "pm2_5_confidence_interval": values["interval"],
+            "location": shapely.to_wkt(
+                shapely.points(values["longitude"], values["latitude"])
+            ),
+        }
+    ).to_dict("records")
 
     client = bigquery.Client()
-    errors = client.insert_rows_json(
-        json_rows=data,
-        table=Config.BIGQUERY_MEASUREMENTS_PREDICTIONS,
-        skip_invalid_rows=True,
+    job_config = bigquery.LoadJobConfig(
+        schema=client.get_table(Config.BIGQUERY_MEASUREMENTS_PREDICTIONS).schema,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
     )
 
-    if errors:
-        print("Encountered errors while inserting rows:", errors)
+    try:
+        client.load_table_from_json(
+            data, Config.BIGQUERY_MEASUREMENTS_PREDICTIONS, job_config=job_config
+        ).result()
+    except Exception as ex:
+        print("Encountered errors while inserting rows:", ex)
     else:
         client.query(
             f"DELETE FROM `{Config.BIGQUERY_MEASUREMENTS_PREDICTIONS}` "
-            f"WHERE airqloud_id ='{airqloud_id}' "
-            f"AND timestamp < {timestamp}"
-        )
+            f"WHERE airqloud_id = @airqloud_id "
+            f"AND timestamp < @timestamp",
+            job_config=bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ScalarQueryParameter("airqloud_id", "STRING", airqloud_id),
+                    bigquery.ScalarQueryParameter("timestamp", "TIMESTAMP", timestamp),
+                ]
+            ),
+        ).result()
         print("Data inserted successfully.")
 
 
+def get_heatmap_pages(airqloud, values, page_size=Config.GP_HEATMAP_PAGE_SIZE):
+    """
+    Splits the prediction values of an airqloud into the gzip-compressed GeoJSON
+    responses of the predict API heatmap endpoint, one per page
+    """
+    total = len(values)
+    pages = math.ceil(total / page_size)
+    for page in range(1, pages + 1):
+        features = [
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [value["longitude"], value["latitude"]],
+                },
+                "properties": {
+                    "pm2_5": value["predicted_value"],
+                    "variance": value["variance"],
+                    "interval": value["interval"],
+                    "latitude": value["latitude"],
+                    "longitude": value["longitude"],
+                },
+            }
+            for value in values[(page - 1) * page_size : page * page_size]
+        ]
+        body = json.dumps(
+            {
+                "airqloud": airqloud,
+                "page": page,
+                "pages": pages,
+                "predictions": {"type": "FeatureCollection", "features": features},
+                "total": total,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        yield {
+            "airqloud": airqloud,
+            "page": page,
+            "limit": page_size,
+            "etag": hashlib.sha1(body).hexdigest(),
+            "body": gzip.compress(body),
+        }
+
+
+def save_heatmap_pages(tenant, airqloud, values, created_at):
+    """
+    Replaces the precomputed heatmap pages of an airqloud in a single bulk write
+    """
+    operations = [
+        ReplaceOne(
+            {"airqloud": airqloud, "page": page["page"], "limit": page["limit"]},
+            {**page, "created_at": created_at},
+            upsert=True,
+        )
+        for page in get_heatmap_pages(airqloud, values)
+    ]
+    operations.append(
+        DeleteMany({"airqloud": airqloud, "created_at": {"$ne": created_at}})
+    )
+
+    db = connect_mongo(tenant)
+    db["gp_model_heatmap_pages"].bulk_write(operations, ordered=True)
+
+
 def predict_model(m, tenant, airqloud, aq_id, poly, x1, x2, y1, y2):
     """
     Makes the predictions and stores them in a database
@@ -155,24 +317,18 @@ def predict_model(m, tenant, airqloud, aq_id, poly, x1, x2, y1, y2):
         .strftime("%Y-%m-%dT%H:%M:%SZ")
     )
 
-    longitudes = np.linspace(x1, x2, 10)
-    latitudes = np.linspace(y1, y2, 10)
+    longitudes = np.linspace(x1, x2, Config.GP_PREDICTION_GRID_SIZE)
+    latitudes = np.linspace(y1, y2, Config.GP_PREDICTION_GRID_SIZE)
     locations = np.meshgrid(longitudes, latitudes)
-    locations_flat = np.c_[locations[0].flatten(), locations[1].flatten()]
-
-    df = pd.DataFrame(locations_flat, columns=["longitude", "latitude"])
-    df["point_exists"] = df.apply(lambda row: point_in_polygon(row, poly), axis=1)
-    new_df = df[df.point_exists == "True"]
-    new_df.drop("point_exists", axis=1, inplace=True)
-    new_df.reset_index(drop=True, inplace=True)
-    new_df["time"] = time
+    longitudes, latitudes = locations[0].flatten(), locations[1].flatten()
+    mask = get_grid_mask(poly, longitudes, latitudes)
+
+    new_df = pd.DataFrame(
+        {"longitude": longitudes[mask], "latitude": latitudes[mask], "time": time}
+    )
     new_df_preprocess = preprocess(new_df)
     pred_set = new_df_preprocess.values
-    new_array = np.asarray(new_df)
-    mean, var = m.predict_f(pred_set)
-
-    means = mean.numpy().flatten()
-    variances = var.numpy().flatten()
+    means, variances = predict_in_batches(m, pred_set)
     std_dev = np.sqrt(variances)
     interval = 1.96 * std_dev
 
@@ -182,28 +338,27 @@ def predict_model(m, tenant, airqloud, aq_id, poly, x1, x2, y1, y2):
         "airqloud_id": aq_id,
         "created_at": datetime.now(),
     }
-    values = []
-    for i in range(pred_set.shape[0]):
-        latitude = new_array[i][1]
-        longitude = new_array[i][0]
-        values.append(
-            {
-                "latitude": latitude,
-                "longitude": longitude,
-                "predicted_value": means[i],
-                "variance": variances[i],
-                "interval": interval[i],
-            }
-        )
-    result_builder["values"] = values
+    result_builder["values"] = pd.DataFrame(
+        {
+            "latitude": new_df["latitude"],
+            "longitude": new_df["longitude"],
+            "predicted_value": means,
+            "variance": variances,
+            "interval": interval,
+        }
+    ).to_dict("records")
     result.append(result_builder)
 
+    if not result_builder["values"]:
+        print("No grid points within the polygon of " + airqloud + " airqloud")
+        return result
+
     db = connect_mongo(tenant)
     collection = db["gp_model_predictions"]
-
-    if collection.count_documents({"airqloud": airqloud}) != 0:
-        collection.delete_many({"airqloud": airqloud})
-    collection.insert_many(result)
+    collection.replace_one({"airqloud": airqloud}, result_builder, upsert=True)
+    save_heatmap_pages(
+        tenant, airqloud, result_builder["values"], result_builder["created_at"]
+    )
     save_predictions_on_bigquery(result)
 
     return result
@@ -226,7 +381,11 @@ def periodic_function(tenant, airqloud, aq_id):
         Y_target = np.asarray(train_data_preprocessed["pm2_5"].values)
         X = X_features
         Y = Y_target.reshape(-1, 1)
-        m = train_model(X, Y, airqloud)
+        hyperparameters = (
+            get_hyperparameters(tenant, airqloud) if Config.GP_WARM_START else None
+        )
+        m = train_model(X, Y, airqloud, hyperparameters)
+        save_hyperparameters(tenant, airqloud, m)
         predict_model(
             m, tenant, airqloud, aq_id, poly, min_long, max_long, min_lat, max_lat
         )
@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import patch
+
+import gpflow
+import numpy as np
+
+import main
+
+
+class TestModel(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.uniform(size=(20, 3))
+        self.Y = rng.uniform(10, 40, size=(20, 1))
+
+    def test_select_inducing_points(self):
+        inducing_points = main.select_inducing_points(self.X, 5)
+        self.assertEqual(inducing_points.shape, (5, 3))
+
+    def test_select_inducing_points_capped_at_rows(self):
+        X = np.concatenate([self.X[:4], self.X[:4]])
+
+        inducing_points = main.select_inducing_points(X, 10)
+        np.testing.assert_array_equal(inducing_points, np.unique(self.X[:4], axis=0))
+
+    @patch.object(main.Config, "GP_MAX_ITERATIONS", 2)
+    @patch.object(main.Config, "GP_INDUCING_POINTS", 5)
+    @patch.object(main.Config, "GP_SPARSE_THRESHOLD", 10)
+    def test_train_model_sparse_above_threshold(self):
+        m = main.train_model(self.X, self.Y, "kira")
+        self.assertIsInstance(m, gpflow.models.SGPR)
+        self.assertEqual(m.inducing_variable.num_inducing, 5)
+
+        m = main.train_model(self.X[:10], self.Y[:10], "kira")
+        self.assertIsInstance(m, gpflow.models.GPR)
+
+    def test_predict_in_batches(self):
+        m = gpflow.models.GPR(
+            data=(self.X, self.Y), kernel=main.get_kernel("kira", self.X.shape[1])
+        )
+        X = np.random.default_rng(1).uniform(size=(7, 3))
+
+        means, variances = main.predict_in_batches(m, X, batch_size=3)
+        mean, var = m.predict_f(X)
+        np.testing.assert_allclose(means, mean.numpy().flatten())
+        np.testing.assert_allclose(variances, var.numpy().flatten())
+
+    def test_hyperparameters_round_trip(self):
+        kernel = main.get_kernel("jinja", self.X.shape[1])
+        m = gpflow.models.GPR(data=(self.X, self.Y), kernel=kernel)
+        m.kernel.kernels[0].lengthscales.assign([0.5, 1.5, 2.5])
+        m.kernel.kernels[0].variance.assign(30.0)
+        m.likelihood.variance.assign(4.0)
+        hyperparameters = main.get_model_hyperparameters(m)
+
+        other = gpflow.models.GPR(
+            data=(self.X, self.Y), kernel=main.get_kernel("jinja", self.X.shape[1])
+        )
+        main.assign_model_hyperparameters(other, hyperparameters)
+        self.assertEqual(main.get_model_hyperparameters(other), hyperparameters)
+
+        # hyperparameters whose shape changed are skipped
+        two_features = gpflow.models.GPR(
+            data=(self.X[:, :2], self.Y), kernel=main.get_kernel("jinja", 2)
+        )
+        main.assign_model_hyperparameters(two_features, hyperparameters)
+        np.testing.assert_allclose(
+            two_features.kernel.kernels[0].lengthscales.numpy(), [1, 1]
+        )
+        self.assertAlmostEqual(two_features.likelihood.variance.numpy(), 4.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
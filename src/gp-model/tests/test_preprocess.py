@@ -1,6 +1,12 @@
 import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
 import pandas as pd
 import numpy as np
+from shapely.geometry import Polygon
+
+import main
 from data.preprocess import data_to_df, drop_missing_value
 
 
@@ -44,6 +50,55 @@ class TestFunctions(unittest.TestCase):
         df = drop_missing_value(df)
         pd.testing.assert_frame_equal(df, self.expected_df_drop_missing_value)
 
+    def test_drop_missing_value_keeps_order_of_equal_times(self):
+        longitudes = np.linspace(32.5, 32.7, 100)
+        df = pd.DataFrame(
+            {
+                "longitude": longitudes,
+                "latitude": 0.3,
+                "time": "2023-01-01T00:00:00Z",
+            }
+        )
+
+        df = drop_missing_value(df)
+        np.testing.assert_array_equal(df["longitude"], longitudes)
+
+
+class TestGridMask(unittest.TestCase):
+    def setUp(self):
+        self.polygon = Polygon([(32.5, 0.2), (32.7, 0.2), (32.7, 0.4), (32.5, 0.4)])
+
+    def test_get_grid_mask(self):
+        longitudes = np.array([32.6, 32.55, 32.8, 32.6])
+        latitudes = np.array([0.3, 0.35, 0.3, 0.1])
+
+        mask = main.get_grid_mask(self.polygon, longitudes, latitudes)
+        np.testing.assert_array_equal(mask, [True, True, False, False])
+
+    @patch("main.save_predictions_on_bigquery")
+    @patch("main.save_heatmap_pages")
+    @patch("main.connect_mongo")
+    def test_predict_model_without_grid_points(
+        self, connect_mongo, save_heatmap_pages, save_predictions_on_bigquery
+    ):
+        # the grid spans an area outside the polygon
+        result = main.predict_model(
+            MagicMock(), "airqo", "kampala", "aq_1", self.polygon, 33, 34, 1, 2
+        )
+
+        self.assertEqual(result[0]["values"], [])
+        connect_mongo.assert_not_called()
+        save_heatmap_pages.assert_not_called()
+        save_predictions_on_bigquery.assert_not_called()
+
+    @patch("main.bigquery")
+    def test_save_predictions_on_bigquery_without_values(self, bigquery):
+        main.save_predictions_on_bigquery(
+            [{"airqloud_id": "aq_1", "created_at": datetime.now(), "values": []}]
+        )
+
+        bigquery.Client.assert_not_called()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,50 +1,76 @@
-from typing import Union
+import uuid
+from datetime import datetime, timedelta, timezone
 
 import pandas as pd
 from google.cloud import bigquery
 
-from models import AirQloud, Site, Device, AirQloudSite
-
 
 class BigQueryAPI:
     def __init__(self):
         self.client = bigquery.Client()
 
-    def __query_records(self, table: str) -> pd.DataFrame:
-        query = f"SELECT * FROM `{table}`"
-        dataframe = self.client.query(query=query).result().to_dataframe()
-        return dataframe
-
-    def __update_records(self, records: pd.DataFrame, table: str):
-        job_config = bigquery.LoadJobConfig(
-            write_disposition="WRITE_TRUNCATE",
+    @staticmethod
+    def __merge_query(
+        table: str, staging_table: str, columns: list, key_columns: list
+    ) -> str:
+        match_condition = " AND ".join(
+            f"target.`{column}` IS NOT DISTINCT FROM source.`{column}`"
+            for column in key_columns
         )
-        job = self.client.load_table_from_dataframe(
-            records, table, job_config=job_config
+        # nulls in an update leave the stored values as they are
+        update_columns = ", ".join(
+            f"`{column}` = COALESCE(source.`{column}`, target.`{column}`)"
+            for column in columns
+            if column not in key_columns
         )
-        job.result()
-        print("Successfully updated records")
-
-    def update(self, data: Union[AirQloud, Site, Device]):
-        records = data.to_dataframe().set_index(data.id_field, drop=False)
+        insert_columns = ", ".join(f"`{column}`" for column in columns)
+        insert_values = ", ".join(f"source.`{column}`" for column in columns)
 
-        existing_records = self.__query_records(data.table)
-        existing_records.set_index(data.id_field, inplace=True, drop=False)
-        existing_records.update(records)
+        query = f" MERGE `{table}` target USING `{staging_table}` source ON {match_condition} "
+        if update_columns:
+            query += f" WHEN MATCHED THEN UPDATE SET {update_columns} "
+        query += f" WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values}) "
+        return query
 
-        new_records = records.subtract(existing_records, fill_value=0)
+    def merge(self, records: pd.DataFrame, table: str, key_columns: list):
+        """
+        Upserts records into a table by loading them into a short-lived staging table and running a single MERGE on
+        the key columns, so that only the incoming rows are read and written. Records with the same key are
+        deduplicated, keeping the last.
+        """
+        records = records.drop_duplicates(subset=key_columns, keep="last")
+        if records.empty:
+            return
 
-        records = pd.concat([new_records, existing_records], ignore_index=True)
+        columns = records.columns.to_list()
+        schema = [
+            field
+            for field in self.client.get_table(table).schema
+            if field.name in columns
+        ]
 
-        self.__update_records(records=records, table=data.table)
-
-    def update_airqloud_sites(self, data: list[AirQloudSite]):
-        records = pd.DataFrame([row.to_dict() for row in data])
-        existing_records = self.__query_records(AirQloudSite.table)
-
-        records = pd.concat([records, existing_records], ignore_index=True)
-        records.drop_duplicates(
-            inplace=True, subset=["airqloud_id", "site_id", "tenant"]
+        staging_table = bigquery.Table(
+            f"{table}_staging_{uuid.uuid4().hex}", schema=schema
         )
+        staging_table.expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        staging_table = self.client.create_table(staging_table)
+
+        try:
+            job_config = bigquery.LoadJobConfig(
+                schema=schema,
+                write_disposition="WRITE_APPEND",
+            )
+            self.client.load_table_from_dataframe(
+                records, staging_table, job_config=job_config
+            ).result()
 
-        self.__update_records(records=records, table=AirQloudSite.table)
+            query = self.__merge_query(
+                table=table,
+                staging_table=f"{staging_table.project}.{staging_table.dataset_id}.{staging_table.table_id}",
+                columns=columns,
+                key_columns=key_columns,
+            )
+            self.client.query(query=query).result()
+            print(f"Successfully merged {len(records)} records into {table}")
+        finally:
+            self.client.delete_table(staging_table, not_found_ok=True)
@@ -12,6 +12,10 @@ class Config:
     SITES_TOPIC = os.getenv("SITES_TOPIC")
     DEVICES_TOPIC = os.getenv("DEVICES_TOPIC")
     BOOTSTRAP_SERVERS = os.getenv("BOOTSTRAP_SERVERS")
+    CONSUMER_GROUP = os.getenv("CONSUMER_GROUP", "bigquery-connector")
+    BATCH_SIZE = int(os.getenv("BATCH_SIZE", 500))
+    BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", 5))
+    BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", 3))
 
     AIRQLOUDS_TABLE = os.getenv("AIRQLOUDS_TABLE")
     SITES_TABLE = os.getenv("SITES_TABLE")
@@ -1,6 +1,9 @@
 import json
+import time
 import traceback
 
+import pandas as pd
+from google.api_core.exceptions import ServerError, TooManyRequests
 from kafka import KafkaConsumer
 
 from bigquery_api import BigQueryAPI
@@ -10,118 +13,229 @@ from models import Site, Device, AirQloud, AirQloudSite
 
 class MessageBroker:
     @staticmethod
-    def listen_to_sites():
-        connector = KafkaConsumer(
-            Config.SITES_TOPIC,
+    def __consumer(topic: str, name: str) -> KafkaConsumer:
+        # offsets are committed by consume_batches once a batch is stored
+        return KafkaConsumer(
+            topic,
             bootstrap_servers=Config.BOOTSTRAP_SERVERS,
-            value_deserializer=lambda x: json.loads(x.decode("utf-8")),
+            group_id=f"{Config.CONSUMER_GROUP}-{name}",
+            enable_auto_commit=False,
         )
-        bigquery_api = BigQueryAPI()
 
-        print("listening to sites.....")
+    @staticmethod
+    def __is_transient(ex: Exception) -> bool:
+        return isinstance(
+            ex, (ServerError, TooManyRequests, ConnectionError, TimeoutError)
+        )
 
-        for msg in connector:
-            try:
-                data = msg.value
-                site = Site(
-                    id=data.get("_id", None),
-                    latitude=data.get("latitude", None),
-                    longitude=data.get("longitude", None),
-                    tenant=data.get("network", None),
-                    name=data.get("name", None),
-                    location=data.get("location", None),
-                    city=data.get("city", None),
-                    region=data.get("region", None),
-                    country=data.get("country", None),
-                    approximate_latitude=data.get("approximate_latitude", None),
-                    approximate_longitude=data.get("approximate_longitude", None),
-                    display_name=data.get("search_name", None),
-                    display_location=data.get("location_name", None),
-                    description=data.get("description", None),
+    @staticmethod
+    def __process_in_halves(messages: list, process_batch):
+        """
+        Processes the (message, value) pairs, splitting them in halves on a failure until the messages that cannot
+        be stored are isolated. Those are logged and skipped; transient errors are raised so the batch is re-read.
+        """
+        try:
+            process_batch([value for _, value in messages])
+        except Exception as ex:
+            if MessageBroker.__is_transient(ex):
+                raise
+            if len(messages) == 1:
+                msg = messages[0][0]
+                print(
+                    f"Skipping message at offset {msg.offset} of {msg.topic}[{msg.partition}]: {ex}"
+                )
+                return
+            middle = len(messages) // 2
+            MessageBroker.__process_in_halves(messages[:middle], process_batch)
+            MessageBroker.__process_in_halves(messages[middle:], process_batch)
+
+    @staticmethod
+    def consume_batches(connector: KafkaConsumer, process_batch):
+        """
+        Accumulates messages into micro-batches of at most `BATCH_SIZE` messages or `BATCH_TIMEOUT_SECONDS`,
+        whichever comes first, and passes the decoded values of each batch to `process_batch`. The offsets are
+        committed only after `process_batch` succeeds; a failed batch is read again from its first offsets.
+
+        Transient BigQuery and connection errors are retried until they clear. After `BATCH_MAX_RETRIES` other
+        failures, the batch is split until the messages that cannot be stored are isolated and skipped, so that
+        one bad message does not block its partition.
+        """
+        failures = 0
+        while True:
+            batch = []
+            first_offsets = {}
+            started = time.monotonic()
+
+            while len(batch) < Config.BATCH_SIZE:
+                remaining = Config.BATCH_TIMEOUT_SECONDS - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                polled = connector.poll(
+                    timeout_ms=int(remaining * 1000),
+                    max_records=Config.BATCH_SIZE - len(batch),
                 )
-                if site.is_valid():
-                    bigquery_api.update(site)
+                for partition, messages in polled.items():
+                    first_offsets.setdefault(partition, messages[0].offset)
+                    batch.extend(messages)
+
+            if not batch:
+                continue
 
+            messages = []
+            for msg in batch:
+                try:
+                    messages.append((msg, json.loads(msg.value.decode("utf-8"))))
+                except Exception as ex:
+                    print(ex)
+                    traceback.print_exc()
+
+            try:
+                if failures < Config.BATCH_MAX_RETRIES:
+                    process_batch([value for _, value in messages])
+                else:
+                    MessageBroker.__process_in_halves(messages, process_batch)
+                connector.commit()
+                failures = 0
             except Exception as ex:
                 print(ex)
                 traceback.print_exc()
-                continue
+                if not MessageBroker.__is_transient(ex):
+                    failures += 1
+                for partition, offset in first_offsets.items():
+                    connector.seek(partition, offset)
+                time.sleep(Config.BATCH_TIMEOUT_SECONDS)
+
+    @staticmethod
+    def __to_dataframe(records: list) -> pd.DataFrame:
+        return pd.DataFrame([record.to_dict() for record in records])
+
+    @staticmethod
+    def listen_to_sites():
+        connector = MessageBroker.__consumer(Config.SITES_TOPIC, "sites")
+        bigquery_api = BigQueryAPI()
+
+        print("listening to sites.....")
+
+        def process_batch(values: list):
+            sites = []
+            for data in values:
+                try:
+                    site = Site(
+                        id=data.get("_id", None),
+                        latitude=data.get("latitude", None),
+                        longitude=data.get("longitude", None),
+                        tenant=data.get("network", None),
+                        name=data.get("name", None),
+                        location=data.get("location", None),
+                        city=data.get("city", None),
+                        region=data.get("region", None),
+                        country=data.get("country", None),
+                        approximate_latitude=data.get("approximate_latitude", None),
+                        approximate_longitude=data.get("approximate_longitude", None),
+                        display_name=data.get("search_name", None),
+                        display_location=data.get("location_name", None),
+                        description=data.get("description", None),
+                    )
+                    if site.is_valid():
+                        sites.append(site)
+                except Exception as ex:
+                    print(ex)
+                    traceback.print_exc()
+
+            if sites:
+                bigquery_api.merge(
+                    MessageBroker.__to_dataframe(sites), Site.table, Site.key_fields
+                )
+
+        MessageBroker.consume_batches(connector, process_batch)
 
     @staticmethod
     def listen_to_devices():
-        connector = KafkaConsumer(
-            Config.DEVICES_TOPIC,
-            bootstrap_servers=Config.BOOTSTRAP_SERVERS,
-            value_deserializer=lambda x: json.loads(x.decode("utf-8")),
-        )
+        connector = MessageBroker.__consumer(Config.DEVICES_TOPIC, "devices")
         bigquery_api = BigQueryAPI()
 
         print("listening to devices.....")
 
-        for msg in connector:
-            try:
-                data = msg.value
-                device = Device(
-                    device_id=data.get("name", None),
-                    latitude=data.get("latitude", None),
-                    longitude=data.get("longitude", None),
-                    tenant=data.get("network", None),
-                    name=data.get("name", None),
-                    device_manufacturer=data.get("device_manufacturer", None),
-                    device_category=data.get("device_category", None),
-                    approximate_latitude=data.get("approximate_latitude", None),
-                    approximate_longitude=data.get("approximate_longitude", None),
-                    device_number=data.get("device_number", None),
-                    site_id=data.get("site_id", None),
-                    description=data.get("description", None),
+        def process_batch(values: list):
+            devices = []
+            for data in values:
+                try:
+                    device = Device(
+                        device_id=data.get("name", None),
+                        latitude=data.get("latitude", None),
+                        longitude=data.get("longitude", None),
+                        tenant=data.get("network", None),
+                        name=data.get("name", None),
+                        device_manufacturer=data.get("device_manufacturer", None),
+                        device_category=data.get("device_category", None),
+                        approximate_latitude=data.get("approximate_latitude", None),
+                        approximate_longitude=data.get("approximate_longitude", None),
+                        device_number=data.get("device_number", None),
+                        site_id=data.get("site_id", None),
+                        description=data.get("description", None),
+                    )
+                    if device.is_valid():
+                        devices.append(device)
+                except Exception as ex:
+                    print(ex)
+                    traceback.print_exc()
+
+            if devices:
+                bigquery_api.merge(
+                    MessageBroker.__to_dataframe(devices),
+                    Device.table,
+                    Device.key_fields,
                 )
-                if device.is_valid():
-                    bigquery_api.update(device)
 
-            except Exception as ex:
-                print(ex)
-                traceback.print_exc()
-                continue
+        MessageBroker.consume_batches(connector, process_batch)
 
     @staticmethod
     def listen_to_airqlouds():
-        connector = KafkaConsumer(
-            Config.AIRQLOUDS_TOPIC,
-            bootstrap_servers=Config.BOOTSTRAP_SERVERS,
-            value_deserializer=lambda x: json.loads(x.decode("utf-8")),
-        )
+        connector = MessageBroker.__consumer(Config.AIRQLOUDS_TOPIC, "airqlouds")
         bigquery_api = BigQueryAPI()
 
         print("listening to airqlouds.....")
 
-        for msg in connector:
-            try:
-                data = msg.value
-                airqloud = AirQloud(
-                    id=data.get("_id", None),
-                    tenant=data.get("network", None),
-                    name=data.get("name", None),
-                )
-                if airqloud.is_valid():
-                    bigquery_api.update(airqloud)
-
-                    sites = data.get("sites", [])
-                    air_qloud_sites = list(
-                        map(
-                            lambda site: AirQloudSite(
-                                site_id=site.get("_id", None),
-                                airqloud_id=airqloud.id,
-                                tenant=airqloud.tenant,
-                            ),
-                            sites,
-                        )
-                    )
-                    air_qloud_sites = list(
-                        filter(lambda x: x.is_valid(), air_qloud_sites)
+        def process_batch(values: list):
+            airqlouds = []
+            air_qloud_sites = []
+            for data in values:
+                try:
+                    airqloud = AirQloud(
+                        id=data.get("_id", None),
+                        tenant=data.get("network", None),
+                        name=data.get("name", None),
                     )
-                    bigquery_api.update_airqloud_sites(air_qloud_sites)
+                    if not airqloud.is_valid():
+                        continue
+
+                    sites = []
+                    for site in data.get("sites", []):
+                        air_qloud_site = AirQloudSite(
+                            site_id=site.get("_id", None),
+                            airqloud_id=airqloud.id,
+                            tenant=airqloud.tenant,
+                        )
+                        if air_qloud_site.is_valid():
+                            sites.append(air_qloud_site)
+
+                    airqlouds.append(airqloud)
+                    air_qloud_sites.extend(sites)
+                except Exception as ex:
+                    print(ex)
+                    traceback.print_exc()
+
+            if airqlouds:
+                bigquery_api.merge(
+                    MessageBroker.__to_dataframe(airqlouds),
+                    AirQloud.table,
+                    AirQloud.key_fields,
+                )
+            if air_qloud_sites:
+                bigquery_api.merge(
+                    MessageBroker.__to_dataframe(air_qloud_sites),
+                    AirQloudSite.table,
+                    AirQloudSite.key_fields,
+                )
 
-            except Exception as ex:
-                print(ex)
-                traceback.print_exc()
-                continue
+        MessageBroker.consume_batches(connector, process_batch)
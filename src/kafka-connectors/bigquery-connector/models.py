@@ -12,6 +12,7 @@ class AirQloudSite:
     airqloud_id: str
     site_id: str
 
+    key_fields: ClassVar[list] = ["airqloud_id", "site_id", "tenant"]
     table: ClassVar[str] = Config.AIRQLOUDS_SITES_TABLE
 
     def is_valid(self):
@@ -30,11 +31,15 @@ class AirQloud:
     tenant: str
 
     id_field: ClassVar[str] = "id"
+    key_fields: ClassVar[list] = [id_field]
     table: ClassVar[str] = Config.AIRQLOUDS_TABLE
 
     def is_valid(self):
         return self.id is not None and self.id.strip() != ""
 
+    def to_dict(self):
+        return asdict(self)
+
     def to_dataframe(self):
         return pd.DataFrame([asdict(self)])
 
@@ -58,11 +63,15 @@ class Site:
     approximate_longitude: float
 
     id_field: ClassVar[str] = "id"
+    key_fields: ClassVar[list] = [id_field]
     table: ClassVar[str] = Config.SITES_TABLE
 
     def is_valid(self):
         return self.id is not None and self.id.strip() != ""
 
+    def to_dict(self):
+        return asdict(self)
+
     def to_dataframe(self):
         return pd.DataFrame([asdict(self)])
 
@@ -83,10 +92,14 @@ class Device:
     device_category: str
 
     id_field: ClassVar[str] = "device_id"
+    key_fields: ClassVar[list] = [id_field]
     table: ClassVar[str] = Config.DEVICES_TABLE
 
     def is_valid(self):
         return self.device_id is not None and self.device_id.strip() != ""
 
+    def to_dict(self):
+        return asdict(self)
+
     def to_dataframe(self):
         return pd.DataFrame([asdict(self)])
@@ -0,0 +1,128 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from google.api_core.exceptions import BadRequest, ServiceUnavailable
+
+from config import Config
+from message_broker import MessageBroker
+
+
+class StopConsuming(Exception):
+    pass
+
+
+def message(offset, value):
+    return SimpleNamespace(
+        topic="sites",
+        partition=0,
+        offset=offset,
+        value=value if isinstance(value, bytes) else json.dumps(value).encode("utf-8"),
+    )
+
+
+def consume(polls, process_batch, batch_size):
+    """Runs consume_batches over the polls, each returning one batch, until they run out."""
+    connector = MagicMock()
+    connector.poll.side_effect = [{"sites-0": batch} for batch in polls] + [
+        StopConsuming()
+    ]
+
+    with patch.object(Config, "BATCH_SIZE", batch_size), patch.object(
+        Config, "BATCH_MAX_RETRIES", 2
+    ), patch("message_broker.time.sleep"):
+        with pytest.raises(StopConsuming):
+            MessageBroker.consume_batches(connector, process_batch)
+
+    return connector
+
+
+@pytest.fixture
+def batch():
+    return [
+        message(10, {"_id": "site_1"}),
+        message(11, b"not json"),
+        message(12, {"_id": "bad"}),
+        message(13, {"_id": "site_3"}),
+    ]
+
+
+def test_consume_batches(batch):
+    process_batch = MagicMock()
+
+    connector = consume([batch], process_batch, batch_size=len(batch))
+
+    process_batch.assert_called_once_with(
+        [{"_id": "site_1"}, {"_id": "bad"}, {"_id": "site_3"}]
+    )
+    connector.commit.assert_called_once()
+    connector.seek.assert_not_called()
+
+
+def test_consume_batches_skips_messages_that_cannot_be_stored(batch):
+    stored = []
+
+    def process_batch(values):
+        if {"_id": "bad"} in values:
+            raise BadRequest("invalid record")
+        stored.extend(values)
+
+    connector = consume([batch] * 3, process_batch, batch_size=len(batch))
+
+    # the batch is retried, then split until the bad message is isolated
+    assert connector.seek.call_count == 2
+    connector.seek.assert_called_with("sites-0", 10)
+    assert stored == [{"_id": "site_1"}, {"_id": "site_3"}]
+    connector.commit.assert_called_once()
+
+
+def test_consume_batches_retries_transient_errors(batch):
+    process_batch = MagicMock(
+        side_effect=[ServiceUnavailable("unavailable")] * 3 + [None]
+    )
+
+    connector = consume([batch] * 4, process_batch, batch_size=len(batch))
+
+    # transient errors neither count towards the retries nor skip messages
+    assert process_batch.call_count == 4
+    assert process_batch.call_args.args[0] == [
+        {"_id": "site_1"},
+        {"_id": "bad"},
+        {"_id": "site_3"},
+    ]
+    assert connector.seek.call_count == 3
+    connector.commit.assert_called_once()
+
+
+def test_consume_batches_keeps_retrying_when_storage_is_unavailable(batch):
+    process_batch = MagicMock(
+        side_effect=[BadRequest("invalid record")] * 2
+        + [ServiceUnavailable("unavailable")]
+    )
+
+    connector = consume([batch] * 3, process_batch, batch_size=len(batch))
+
+    connector.commit.assert_not_called()
+    assert connector.seek.call_count == 3
+
+
+@patch("message_broker.BigQueryAPI")
+def test_listen_to_sites_skips_records_that_cannot_be_built(bigquery_api):
+    batch = [
+        message(10, {"_id": "site_1", "network": "airqo"}),
+        message(11, ["not", "a", "site"]),
+        message(12, {"network": "airqo"}),
+    ]
+    connector = MagicMock()
+    connector.poll.side_effect = [{"sites-0": batch}, StopConsuming()]
+
+    with patch.object(
+        MessageBroker, "_MessageBroker__consumer", return_value=connector
+    ), patch.object(Config, "BATCH_SIZE", len(batch)):
+        with pytest.raises(StopConsuming):
+            MessageBroker.listen_to_sites()
+
+    records = bigquery_api.return_value.merge.call_args.args[0]
+    assert records["id"].to_list() == ["site_1"]
+    connector.commit.assert_called_once()
@@ -98,13 +98,17 @@ def get_all_meta_data():
 @swag_from("/api/docs/get-nearest-stations.yml")
 def get_nearest_weather_stations():
 
-    distance = request.args.get("distance", None)
     input_data, errors = validation.validate_spatial_data(
         input_data={
             "latitude": request.args.get("latitude"),
             "longitude": request.args.get("longitude"),
         }
     )
+    params, param_errors = validation.validate_nearest_weather_stations_params(
+        input_data={"distance": request.args.get("distance", None)}
+    )
+    if param_errors:
+        errors = {**(errors or {}), **param_errors}
 
     if errors:
         return (
@@ -120,7 +124,7 @@ def get_nearest_weather_stations():
     weather_stations = ext.Extract().get_nearest_weather_stations(
         latitude=float(input_data["latitude"]),
         longitude=float(input_data["longitude"]),
-        threshold_distance=distance,
+        threshold_distance=params["distance"],
     )
 
     return (
@@ -131,6 +135,78 @@ def get_nearest_weather_stations():
     )
 
 
+@extract_bp_v1.route(api.NEAREST_WEATHER_STATIONS_BULK, methods=["POST"])
+@extract_bp_v2.route(api.NEAREST_WEATHER_STATIONS_BULK, methods=["POST"])
+@swag_from("/api/docs/get-nearest-stations-bulk.yml")
+def get_nearest_weather_stations_bulk():
+
+    body = request.get_json(silent=True) or {}
+    coordinates = body.get("coordinates", None)
+    if not isinstance(coordinates, list):
+        return (
+            jsonify(
+                {
+                    "message": "Some errors occurred while processing this request",
+                    "errors": {"coordinates": "A list of coordinates is required."},
+                }
+            ),
+            400,
+        )
+
+    params, errors = validation.validate_nearest_weather_stations_params(
+        input_data={"distance": body.get("distance", None), "k": body.get("k", None)}
+    )
+    if errors:
+        return (
+            jsonify(
+                {
+                    "message": "Some errors occurred while processing this request",
+                    "errors": errors,
+                }
+            ),
+            400,
+        )
+
+    # an invalid coordinate gets its errors and no weather stations instead of failing the whole request
+    results = []
+    valid_coordinates = []
+    for coordinate in coordinates:
+        if not isinstance(coordinate, dict):
+            coordinate = {}
+        result = {
+            "latitude": coordinate.get("latitude"),
+            "longitude": coordinate.get("longitude"),
+            "weather_stations": [],
+        }
+        _, coordinate_errors = validation.validate_spatial_data(
+            input_data={
+                "latitude": result["latitude"],
+                "longitude": result["longitude"],
+            }
+        )
+        if coordinate_errors:
+            result["errors"] = coordinate_errors
+        else:
+            valid_coordinates.append(result)
+        results.append(result)
+
+    weather_stations = ext.Extract().get_nearest_weather_stations_bulk(
+        coordinates=[
+            (float(result["latitude"]), float(result["longitude"]))
+            for result in valid_coordinates
+        ],
+        threshold_distance=params["distance"],
+        k=params["k"],
+    )
+    for result, stations in zip(valid_coordinates, weather_stations):
+        result["weather_stations"] = stations
+
+    return (
+        jsonify(dict(message="Operation successful", weather_stations=results)),
+        200,
+    )
+
+
 @extract_bp_v1.route(api.ADMINISTRATIVE_LEVELS, methods=["GET"])
 @extract_bp_v2.route(api.ADMINISTRATIVE_LEVELS, methods=["GET"])
 def get_administrative_levels():
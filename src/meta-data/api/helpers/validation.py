@@ -17,6 +17,14 @@ class SpatialSchema(Schema):
     )
 
 
+class NearestWeatherStationsSchema(Schema):
+    distance = fields.Float(
+        allow_none=True,
+        validate=validate.Range(min=0, min_inclusive=False),
+    )
+    k = fields.Integer(allow_none=True, strict=True, validate=validate.Range(min=1))
+
+
 class SpatialTemporalSchema(SpatialSchema):
     start_date = fields.Date(
         required=True, error_messages={"required": "datetime missing."}
@@ -76,6 +84,16 @@ def validate_spatial_data(input_data):
     return validated_input, errors
 
 
+def validate_nearest_weather_stations_params(input_data):
+    """Check the search radius and number of nearest weather stations requested."""
+    schema = NearestWeatherStationsSchema()
+
+    try:
+        return schema.load(input_data), None
+    except ValidationError as exc:
+        return None, exc.messages
+
+
 def remove_invalidate_meta_data_values(data: dict) -> dict:
     validated_data = dict()
     for key, value in data.items():
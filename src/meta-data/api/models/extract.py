@@ -1,12 +1,11 @@
 import ee
 import osmnx as ox
-import pyproj
 import requests
 from geopy import distance
-from shapely.geometry import Point
-from shapely.ops import transform
 
 from api.models import TAHMO
+from api.models.road_network import get_distances_to_closest_roads
+from api.models.weather_stations import fetch_weather_stations, weather_station_index
 from config import Config
 
 credentials = ee.ServiceAccountCredentials(
@@ -213,46 +212,28 @@ class Extract:
     def get_nearest_weather_stations(
         self, latitude, longitude, threshold_distance=None
     ):
+        return self.get_nearest_weather_stations_bulk(
+            [(latitude, longitude)], threshold_distance=threshold_distance
+        )[0]
+
+    def get_nearest_weather_stations_bulk(
+        self, coordinates, threshold_distance=None, k=None
+    ):
+        """
+        Returns the nearest weather stations of each (latitude, longitude) in coordinates, sorted by distance
+        and limited to the k nearest when k is set, from the cached station index
+        """
         if not threshold_distance:
             threshold_distance = (
                 Config.WEATHER_STATION_AIRQUALITY_SITE_DISTANCE_THRESHOLD
             )
 
-        all_stations = self.get_all_weather_station_account_has_access_on()
-        stations_with_distances = []
-        specified_coordinates = (latitude, longitude)
-
-        for station in all_stations:
-            station_coordinates = (
-                station["latitude"],
-                station["longitude"],
-            )
-            distance_between_coordinates = distance.distance(
-                specified_coordinates, station_coordinates
-            ).km
-            if float(distance_between_coordinates) <= float(threshold_distance):
-                stations_with_distances.append(
-                    {
-                        "distance": distance_between_coordinates,
-                        "code": station.get("code", ""),
-                        "country": station.get("countrycode", ""),
-                        "id": station.get("id", ""),
-                        "latitude": station.get("latitude", None),
-                        "longitude": station.get("longitude", None),
-                        "name": station.get("name", ""),
-                        "timezone": station.get("timezone", ""),
-                        "type": station.get("type", ""),
-                    }
-                )
-        return sorted(stations_with_distances, key=lambda x: float(x["distance"]))
+        return weather_station_index.nearest(
+            coordinates, threshold_distance=threshold_distance, k=k
+        )
 
     def get_all_weather_station_account_has_access_on(self):
-        tahmo_api = TAHMO.apiWrapper()
-        tahmo_api.setCredentials(
-            Config.TAHMO_API_CREDENTIALS_USERNAME, Config.TAHMO_API_CREDENTIALS_PASSWORD
-        )
-        stations = tahmo_api.getStations()
-        return stations
+        return fetch_weather_stations()
 
     def get_all_available_variables_and_units_tahmo_api(self):
         tahmo_api = TAHMO.apiWrapper()
@@ -343,295 +324,60 @@ class Extract:
         ).km
         return distance_of_specified_coordinates_from_kla
 
+    def get_distances_to_closest_roads(self, lat, lon):
+        """
+        Returns the distance in metres from the nearest road of each class, keyed by class
+        i.e. road, primary, secondary, tertiary, residential, unclassified, trunk and motorway
+        """
+        return get_distances_to_closest_roads(lat, lon)
+
     def get_distance_to_closest_motorway(self, lat, lon):
         """
         Returns the distance in metres from the nearest motorway - 10km radius
         """
-        try:
-            G = ox.graph_from_point((lat, lon), dist=10000, network_type="drive")
-            gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
-            gdf.to_crs(epsg=3310, inplace=True)
-            new_gdf = gdf[gdf["highway"] == "motorway"]
-
-            if new_gdf.shape[0] == 0:
-                closest_distance = None
-            else:
-                wgs84_pt = Point(lon, lat)
-                wgs84 = pyproj.CRS("EPSG:4326")
-                utm = pyproj.CRS("EPSG:3310")
-                project = pyproj.Transformer.from_crs(
-                    wgs84, utm, always_xy=True
-                ).transform
-                utm_point = transform(project, wgs84_pt)
-
-                roads = new_gdf[["geometry", "u", "v"]].values.tolist()
-                roads_with_distances = [
-                    (road, utm_point.distance(road[0])) for road in roads
-                ]
-                roads_with_distances = sorted(roads_with_distances, key=lambda x: x[1])
-                closest_road = roads_with_distances[0]
-                closest_distance = round(closest_road[1], 2)
-        except:
-            closest_distance = None
-        return closest_distance
+        return self.get_distances_to_closest_roads(lat, lon)["motorway"]
 
     def get_distance_to_closest_trunk(self, lat, lon):
         """
-        Returns the distance in metres from the nearest trunk road - 10km radius
+        Returns the distance in metres from the nearest trunk road - 30km radius
         """
-        try:
-            G = ox.graph_from_point((lat, lon), dist=30000, network_type="drive")
-            gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
-            gdf.to_crs(epsg=3310, inplace=True)
-            new_gdf = gdf[gdf["highway"] == "trunk"]
-
-            if new_gdf.shape[0] == 0:
-                closest_distance = None
-            else:
-                wgs84_pt = Point(lon, lat)
-                wgs84 = pyproj.CRS("EPSG:4326")
-                utm = pyproj.CRS("EPSG:3310")
-                project = pyproj.Transformer.from_crs(
-                    wgs84, utm, always_xy=True
-                ).transform
-                utm_point = transform(project, wgs84_pt)
-
-                roads = new_gdf[["geometry", "u", "v"]].values.tolist()
-                roads_with_distances = [
-                    (road, utm_point.distance(road[0])) for road in roads
-                ]
-                roads_with_distances = sorted(roads_with_distances, key=lambda x: x[1])
-                closest_road = roads_with_distances[0]
-                closest_distance = round(closest_road[1], 2)
-        except:
-            closest_distance = None
-        return closest_distance
+        return self.get_distances_to_closest_roads(lat, lon)["trunk"]
 
     def get_distance_to_closest_road(self, lat, lon):
         """
         Returns the distance in metres from the nearest road  - 1km radius
-         i.e. closest road type, closest distance,
         """
-        try:
-
-            G = ox.graph_from_point((lat, lon), dist=1000, network_type="drive")
-            gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
-            gdf.to_crs(epsg=3310, inplace=True)
-            gdf = gdf.reset_index()  ## to ensure the values of u & v are in the columns
-            # convert point to utm in order to get distance in metres
-            wgs84_pt = Point(lon, lat)
-            wgs84 = pyproj.CRS("EPSG:4326")
-            utm = pyproj.CRS("EPSG:3310")
-            project = pyproj.Transformer.from_crs(wgs84, utm, always_xy=True).transform
-            utm_point = transform(project, wgs84_pt)
-            roads = gdf[["geometry", "u", "v", "highway"]].values.tolist()
-            roads_with_distances = [
-                (road, utm_point.distance(road[0])) for road in roads
-            ]
-            roads_with_distances = sorted(roads_with_distances, key=lambda x: x[1])
-            closest_road = roads_with_distances[0]
-            closest_distance = round(closest_road[1], 2)
-
-        except Exception as ex:
-            # closest_road_type = None
-            closest_distance = None
-            print(ex)
-
-        return closest_distance
+        return self.get_distances_to_closest_roads(lat, lon)["road"]
 
     def get_distance_to_closest_residential_road(self, lat, lon):
         """
         Returns the distance in metres from the nearest residential roads  - 1km radius
-        i.e closest_residential_distance
         """
-        try:
-
-            G = ox.graph_from_point((lat, lon), dist=1000, network_type="drive")
-            gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
-            gdf.to_crs(epsg=3310, inplace=True)
-            gdf = gdf.reset_index()  ## to ensure the values of u & v are in the columns
-
-            # convert point to utm in order to get distance in metres
-            wgs84_pt = Point(lon, lat)
-            wgs84 = pyproj.CRS("EPSG:4326")
-            utm = pyproj.CRS("EPSG:3310")
-            project = pyproj.Transformer.from_crs(wgs84, utm, always_xy=True).transform
-            utm_point = transform(project, wgs84_pt)
-
-            residential_gdf = gdf[gdf["highway"] == "residential"]
-            if residential_gdf.shape[0] == 0:
-                closest_residential_distance = None
-            else:
-                residential_roads = residential_gdf[
-                    ["geometry", "u", "v"]
-                ].values.tolist()
-                residential_roads_with_distances = [
-                    (road, utm_point.distance(road[0])) for road in residential_roads
-                ]
-                residential_roads_with_distances = sorted(
-                    residential_roads_with_distances, key=lambda x: x[1]
-                )
-                closest_residential_road = residential_roads_with_distances[0]
-                closest_residential_distance = round(closest_residential_road[1], 2)
-
-        except Exception as ex:
-            closest_residential_distance = None
-            print(ex)
-
-        return closest_residential_distance
+        return self.get_distances_to_closest_roads(lat, lon)["residential"]
 
     def get_distance_to_closest_tertiary_road(self, lat, lon):
         """
         Returns the distance in metres from the nearest tertiary road  - 1km radius
-         i.e.  closest_tertiary_distance,
         """
-        try:
-
-            G = ox.graph_from_point((lat, lon), dist=1000, network_type="drive")
-            gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
-            gdf.to_crs(epsg=3310, inplace=True)
-            gdf = gdf.reset_index()  ## to ensure the values of u & v are in the columns
-
-            # convert point to utm in order to get distance in metres
-            wgs84_pt = Point(lon, lat)
-            wgs84 = pyproj.CRS("EPSG:4326")
-            utm = pyproj.CRS("EPSG:3310")
-            project = pyproj.Transformer.from_crs(wgs84, utm, always_xy=True).transform
-            utm_point = transform(project, wgs84_pt)
-
-            tertiary_gdf = gdf[gdf["highway"] == "tertiary"]
-            if tertiary_gdf.shape[0] == 0:
-                closest_tertiary_distance = None
-            else:
-                tertiary_roads = tertiary_gdf[["geometry", "u", "v"]].values.tolist()
-                tertiary_roads_with_distances = [
-                    (road, utm_point.distance(road[0])) for road in tertiary_roads
-                ]
-                tertiary_roads_with_distances = sorted(
-                    tertiary_roads_with_distances, key=lambda x: x[1]
-                )
-                closest_tertiary_road = tertiary_roads_with_distances[0]
-                closest_tertiary_distance = round(closest_tertiary_road[1], 2)
-
-        except Exception as ex:
-            closest_tertiary_distance = None
-            print(ex)
-
-        return closest_tertiary_distance
+        return self.get_distances_to_closest_roads(lat, lon)["tertiary"]
 
     def get_distance_to_closest_unclassified_road(self, lat, lon):
         """
         Returns the distance in metres from the nearest unclassified road  - 1km radius
-         i.e.  closest_unclassified_distance,
         """
-        try:
-            G = ox.graph_from_point((lat, lon), dist=1000, network_type="drive")
-            gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
-            gdf.to_crs(epsg=3310, inplace=True)
-
-            gdf = gdf.reset_index()
-
-            wgs84_pt = Point(lon, lat)
-            wgs84 = pyproj.CRS("EPSG:4326")
-            utm = pyproj.CRS("EPSG:3310")
-            project = pyproj.Transformer.from_crs(wgs84, utm, always_xy=True).transform
-            utm_point = transform(project, wgs84_pt)
-
-            unclassified_gdf = gdf[gdf["highway"] == "unclassified"]
-            if unclassified_gdf.shape[0] == 0:
-                closest_unclassified_distance = None
-            else:
-                unclassified_roads = unclassified_gdf[
-                    ["geometry", "u", "v"]
-                ].values.tolist()
-                unclassified_roads_with_distances = [
-                    (road, utm_point.distance(road[0])) for road in unclassified_roads
-                ]
-                unclassified_roads_with_distances = sorted(
-                    unclassified_roads_with_distances, key=lambda x: x[1]
-                )
-                closest_unclassified_road = unclassified_roads_with_distances[0]
-                closest_unclassified_distance = round(closest_unclassified_road[1], 2)
-
-        except Exception as ex:
-            closest_unclassified_distance = None
-            print(ex)
-
-        return closest_unclassified_distance
+        return self.get_distances_to_closest_roads(lat, lon)["unclassified"]
 
     def get_distance_to_closest_primary_road(self, lat, lon):
         """
         Returns the distance in metres from the nearest primary road  - 1km radius
-         i.e.  closest_primary_distance,
         """
-        try:
-            G = ox.graph_from_point((lat, lon), dist=1000, network_type="drive")
-            gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
-            gdf.to_crs(epsg=3310, inplace=True)
-            gdf = gdf.reset_index()
-            # convert point to utm in order to get distance in metres
-            wgs84_pt = Point(lon, lat)
-            wgs84 = pyproj.CRS("EPSG:4326")
-            utm = pyproj.CRS("EPSG:3310")
-            project = pyproj.Transformer.from_crs(wgs84, utm, always_xy=True).transform
-            utm_point = transform(project, wgs84_pt)
-
-            primary_gdf = gdf[gdf["highway"] == "primary"]
-            if primary_gdf.shape[0] == 0:
-                closest_primary_distance = None
-            else:
-                primary_roads = primary_gdf[["geometry", "u", "v"]].values.tolist()
-                primary_roads_with_distances = [
-                    (road, utm_point.distance(road[0])) for road in primary_roads
-                ]
-                primary_roads_with_distances = sorted(
-                    primary_roads_with_distances, key=lambda x: x[1]
-                )
-                closest_primary_road = primary_roads_with_distances[0]
-                closest_primary_distance = round(closest_primary_road[1], 2)
-
-        except Exception as ex:
-            closest_primary_distance = None
-            print(ex)
-
-        return closest_primary_distance
+        return self.get_distances_to_closest_roads(lat, lon)["primary"]
 
     def get_distance_to_closest_secondary_road(self, lat, lon):
         """
         Returns the distance in metres from the nearest secondary road  - 1km radius
-         i.e.  closest_secondary_distance
         """
-        try:
-            G = ox.graph_from_point((lat, lon), dist=1000, network_type="drive")
-            gdf = ox.graph_to_gdfs(G, nodes=False, fill_edge_geometry=True)
-            gdf.to_crs(epsg=3310, inplace=True)
-            gdf = gdf.reset_index()
-
-            wgs84_pt = Point(lon, lat)
-            wgs84 = pyproj.CRS("EPSG:4326")
-            utm = pyproj.CRS("EPSG:3310")
-            project = pyproj.Transformer.from_crs(wgs84, utm, always_xy=True).transform
-            utm_point = transform(project, wgs84_pt)
-
-            secondary_gdf = gdf[gdf["highway"] == "secondary"]
-            if secondary_gdf.shape[0] == 0:
-                closest_secondary_distance = None
-            else:
-                secondary_roads = secondary_gdf[["geometry", "u", "v"]].values.tolist()
-                secondary_roads_with_distances = [
-                    (road, utm_point.distance(road[0])) for road in secondary_roads
-                ]
-                secondary_roads_with_distances = sorted(
-                    secondary_roads_with_distances, key=lambda x: x[1]
-                )
-                closest_secondary_road = secondary_roads_with_distances[0]
-                closest_secondary_distance = round(closest_secondary_road[1], 2)
-
-        except Exception as ex:
-            closest_secondary_distance = None
-            print(ex)
-
-        return closest_secondary_distance
+        return self.get_distances_to_closest_roads(lat, lon)["secondary"]
 
 
 if __name__ == "__main__":
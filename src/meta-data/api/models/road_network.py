@@ -0,0 +1,113 @@
+from functools import lru_cache
+
+import osmnx as ox
+import pyproj
+import shapely
+from shapely.geometry import Point
+
+from config import Config
+
+ox.settings.use_cache = True
+ox.settings.cache_folder = Config.OSM_CACHE_FOLDER
+
+# Search radius in metres of each road class. "road" is any drivable road.
+ROAD_CLASS_RADII = {
+    "road": 1000,
+    "primary": 1000,
+    "secondary": 1000,
+    "tertiary": 1000,
+    "residential": 1000,
+    "unclassified": 1000,
+    "trunk": 30000,
+    "motorway": 10000,
+}
+
+# A drive network over the trunk radius is far too large to download, so the major roads come from a
+# second download filtered to their classes.
+MAJOR_ROAD_CLASSES = ["trunk", "motorway"]
+
+
+class RoadNetwork:
+    """
+    Road edges around a point, projected to the point's UTM zone and indexed in an STRtree per highway class.
+    """
+
+    def __init__(self, lat, lon, edges):
+        edges = ox.projection.project_gdf(edges).reset_index(drop=True)
+        project = pyproj.Transformer.from_crs(
+            "EPSG:4326", edges.crs, always_xy=True
+        ).transform
+        self.point = Point(project(lon, lat))
+
+        self.trees = {"road": shapely.STRtree(edges.geometry.values)}
+        # simplified edges can carry a list of highway classes
+        highways = edges["highway"].explode()
+        for road_class, index in highways.groupby(highways).groups.items():
+            self.trees[road_class] = shapely.STRtree(
+                edges.geometry.values[index.unique()]
+            )
+
+    def distance_to_closest(self, road_class, max_distance):
+        tree = self.trees.get(road_class, None)
+        if tree is None:
+            return None
+
+        _, distances = tree.query_nearest(
+            self.point, max_distance=max_distance, return_distance=True
+        )
+        if len(distances) == 0:
+            return None
+        return round(float(distances.min()), 2)
+
+
+@lru_cache(maxsize=Config.ROAD_NETWORK_CACHE_SIZE)
+def get_local_road_network(lat, lon):
+    graph = ox.graph_from_point(
+        (lat, lon), dist=ROAD_CLASS_RADII["road"], network_type="drive"
+    )
+    edges = ox.graph_to_gdfs(graph, nodes=False, fill_edge_geometry=True)
+    return RoadNetwork(lat, lon, edges)
+
+
+@lru_cache(maxsize=Config.ROAD_NETWORK_CACHE_SIZE)
+def get_major_road_network(lat, lon):
+    graph = ox.graph_from_point(
+        (lat, lon),
+        dist=max(ROAD_CLASS_RADII[road_class] for road_class in MAJOR_ROAD_CLASSES),
+        custom_filter=f'["highway"~"^({"|".join(MAJOR_ROAD_CLASSES)})$"]',
+    )
+    edges = ox.graph_to_gdfs(graph, nodes=False, fill_edge_geometry=True)
+    return RoadNetwork(lat, lon, edges)
+
+
+def get_distances_to_closest_roads(lat, lon):
+    """
+    Returns the distance in metres from the point to the closest road of every class in ROAD_CLASS_RADII, or
+    None for the classes with no road within their radius. The road networks are downloaded once per point,
+    whatever the number of classes, and the Overpass responses are cached on disk.
+    """
+    lat, lon = round(float(lat), 6), round(float(lon), 6)
+    distances = {}
+    for get_road_network, road_classes in [
+        (
+            get_local_road_network,
+            [c for c in ROAD_CLASS_RADII if c not in MAJOR_ROAD_CLASSES],
+        ),
+        (get_major_road_network, MAJOR_ROAD_CLASSES),
+    ]:
+        try:
+            road_network = get_road_network(lat, lon)
+        except Exception as ex:
+            print(ex)
+            road_network = None
+
+        for road_class in road_classes:
+            distances[road_class] = (
+                road_network.distance_to_closest(
+                    road_class, ROAD_CLASS_RADII[road_class]
+                )
+                if road_network
+                else None
+            )
+
+    return distances
@@ -0,0 +1,153 @@
+import threading
+import time
+
+import numpy as np
+from geopy import distance
+from sklearn.neighbors import BallTree
+
+from api.models import TAHMO
+from config import Config
+
+EARTH_RADIUS_KM = 6371.0088
+
+# The tree measures great-circle distances, which are within 0.5% of the geodesic ones reported for the
+# stations, so candidates are searched in a slightly larger radius before being filtered on the latter.
+SEARCH_RADIUS_MARGIN = 1.01
+
+
+def fetch_weather_stations():
+    tahmo_api = TAHMO.apiWrapper()
+    tahmo_api.setCredentials(
+        Config.TAHMO_API_CREDENTIALS_USERNAME, Config.TAHMO_API_CREDENTIALS_PASSWORD
+    )
+    return tahmo_api.getStations()
+
+
+def format_weather_station(station, station_distance):
+    return {
+        "distance": station_distance,
+        "code": station.get("code", ""),
+        "country": station.get("countrycode", ""),
+        "id": station.get("id", ""),
+        "latitude": station.get("latitude", None),
+        "longitude": station.get("longitude", None),
+        "name": station.get("name", ""),
+        "timezone": station.get("timezone", ""),
+        "type": station.get("type", ""),
+    }
+
+
+class WeatherStationIndex:
+    """
+    The weather stations the TAHMO account has access to, indexed in a haversine BallTree.
+
+    The catalogue is listed once and refreshed when it is older than `ttl` seconds, so that a lookup neither
+    lists every station from the TAHMO API nor measures the distance to each of them. The stations are listed
+    outside the lock by one request at a time while the others keep serving the previous catalogue, and a
+    failed refresh keeps serving it too.
+    """
+
+    def __init__(self, load_stations=fetch_weather_stations, ttl=3600):
+        self.load_stations = load_stations
+        self.ttl = ttl
+        self._stations = []
+        self._tree = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _is_fresh(self):
+        return (
+            self._loaded_at is not None
+            and time.monotonic() - self._loaded_at < self.ttl
+        )
+
+    def _get_catalogue(self):
+        with self._lock:
+            if self._is_fresh():
+                return self._stations, self._tree
+            loaded = self._loaded_at is not None
+
+        # only the first load waits for a refresh in progress
+        if not self._refresh_lock.acquire(blocking=not loaded):
+            with self._lock:
+                return self._stations, self._tree
+
+        try:
+            with self._lock:
+                if self._is_fresh():
+                    return self._stations, self._tree
+
+            try:
+                stations = [
+                    station
+                    for station in self.load_stations()
+                    if station.get("latitude") is not None
+                    and station.get("longitude") is not None
+                ]
+            except Exception as ex:
+                if not loaded:
+                    raise
+                print(ex)
+                with self._lock:
+                    return self._stations, self._tree
+
+            coordinates = np.radians(
+                [[float(s["latitude"]), float(s["longitude"])] for s in stations]
+            )
+            tree = BallTree(coordinates, metric="haversine") if stations else None
+            with self._lock:
+                self._stations = stations
+                self._tree = tree
+                self._loaded_at = time.monotonic()
+                return self._stations, self._tree
+        finally:
+            self._refresh_lock.release()
+
+    def nearest(self, coordinates, threshold_distance=None, k=None):
+        """
+        Returns, for each (latitude, longitude) in `coordinates`, the stations within `threshold_distance` km
+        sorted by their geodesic distance, limited to the `k` nearest when `k` is set.
+        """
+        coordinates = [(float(lat), float(lon)) for lat, lon in coordinates]
+        stations, tree = self._get_catalogue()
+        if tree is None or not coordinates:
+            return [[] for _ in coordinates]
+
+        points = np.radians(coordinates)
+        if threshold_distance:
+            threshold_distance = float(threshold_distance)
+            candidates = tree.query_radius(
+                points,
+                r=threshold_distance * SEARCH_RADIUS_MARGIN / EARTH_RADIUS_KM,
+            )
+        else:
+            candidates = tree.query(
+                points, k=min(k or len(stations), len(stations)), return_distance=False
+            )
+
+        results = []
+        for point, indices in zip(coordinates, candidates):
+            nearest_stations = []
+            for index in indices:
+                station = stations[index]
+                station_distance = distance.distance(
+                    point, (station["latitude"], station["longitude"])
+                ).km
+                if threshold_distance and station_distance > threshold_distance:
+                    continue
+                nearest_stations.append(
+                    format_weather_station(station, station_distance)
+                )
+
+            nearest_stations.sort(key=lambda x: x["distance"])
+            results.append(nearest_stations[:k] if k else nearest_stations)
+
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+weather_station_index = WeatherStationIndex(ttl=Config.WEATHER_STATIONS_CACHE_TTL)
@@ -1,5 +1,6 @@
 ALL_META_DATA_URL = "/all"
 NEAREST_WEATHER_STATIONS = "/nearest-weather-stations"
+NEAREST_WEATHER_STATIONS_BULK = "/nearest-weather-stations/bulk"
 ADMINISTRATIVE_LEVELS = "/administrative-levels"
 IP_GEO_COORDINATES = "/ip-geo-coordinates"
 MOBILE_CARRIER = "/mobile-carrier"
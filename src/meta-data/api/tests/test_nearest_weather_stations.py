@@ -0,0 +1,104 @@
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+
+from api.helpers.validation import validate_nearest_weather_stations_params
+from api.routes import api
+from config import Config
+
+# The extract model initialises Earth Engine on import.
+with patch("ee.ServiceAccountCredentials"), patch("ee.Initialize"):
+    from api.controllers.extract import extract_bp_v2
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(extract_bp_v2)
+    return app.test_client()
+
+
+@pytest.fixture
+def get_nearest_weather_stations_bulk():
+    with patch(
+        "api.models.extract.Extract.get_nearest_weather_stations_bulk",
+        side_effect=lambda coordinates, threshold_distance, k: [
+            [{"code": f"TA{lat}"}] for lat, _ in coordinates
+        ],
+    ) as mock_get_nearest_weather_stations_bulk:
+        yield mock_get_nearest_weather_stations_bulk
+
+
+BULK_URL = f"{Config.BASE_URL_V2}{api.NEAREST_WEATHER_STATIONS_BULK}"
+
+
+@pytest.mark.parametrize(
+    "params, errors",
+    [
+        ({}, None),
+        ({"distance": "10", "k": 3}, None),
+        ({"distance": None, "k": None}, None),
+        ({"distance": "far"}, ["distance"]),
+        ({"distance": 0}, ["distance"]),
+        ({"k": 0}, ["k"]),
+        ({"k": 2.5}, ["k"]),
+        ({"distance": -1, "k": "3"}, ["distance", "k"]),
+    ],
+)
+def test_validate_nearest_weather_stations_params(params, errors):
+    _, validation_errors = validate_nearest_weather_stations_params(params)
+
+    assert (sorted(validation_errors) if validation_errors else None) == errors
+
+
+def test_bulk_returns_errors_per_coordinate(client, get_nearest_weather_stations_bulk):
+    response = client.post(
+        BULK_URL,
+        json={
+            "coordinates": [
+                {"latitude": 1, "longitude": 32.5},
+                {"latitude": None, "longitude": 32.5},
+                "not a coordinate",
+                {"latitude": 95, "longitude": 32.5},
+                {"latitude": "2", "longitude": "33"},
+            ],
+            "distance": 50,
+            "k": 2,
+        },
+    )
+
+    assert response.status_code == 200
+    results = response.get_json()["weather_stations"]
+    assert [result["weather_stations"] for result in results] == [
+        [{"code": "TA1.0"}],
+        [],
+        [],
+        [],
+        [{"code": "TA2.0"}],
+    ]
+    assert ["errors" in result for result in results] == [
+        False,
+        True,
+        True,
+        True,
+        False,
+    ]
+    get_nearest_weather_stations_bulk.assert_called_once_with(
+        coordinates=[(1.0, 32.5), (2.0, 33.0)], threshold_distance=50.0, k=2
+    )
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"coordinates": "0.3,32.5"},
+        {"coordinates": [], "distance": "far"},
+        {"coordinates": [], "k": "three"},
+    ],
+)
+def test_bulk_rejects_invalid_request(client, get_nearest_weather_stations_bulk, body):
+    response = client.post(BULK_URL, json=body)
+
+    assert response.status_code == 400
+    get_nearest_weather_stations_bulk.assert_not_called()
@@ -0,0 +1,123 @@
+from unittest.mock import patch
+
+import networkx as nx
+import osmnx as ox
+import pytest
+from shapely.geometry import LineString
+
+from api.models import road_network
+from api.models.road_network import RoadNetwork, get_distances_to_closest_roads
+
+LATITUDE, LONGITUDE = 0.3, 32.5
+
+# metres per degree of longitude at the point
+METRES_PER_DEGREE = 111_320
+
+
+def road_graph(roads):
+    """Builds a graph of north-south roads at the given longitudes, 0.02 degrees long."""
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+    for index, (highway, longitude) in enumerate(roads):
+        start, end = 2 * index, 2 * index + 1
+        graph.add_node(start, x=longitude, y=LATITUDE - 0.01)
+        graph.add_node(end, x=longitude, y=LATITUDE + 0.01)
+        graph.add_edge(
+            start,
+            end,
+            key=0,
+            highway=highway,
+            length=2200,
+            geometry=LineString(
+                [(longitude, LATITUDE - 0.01), (longitude, LATITUDE + 0.01)]
+            ),
+        )
+    return graph
+
+
+LOCAL_GRAPH = road_graph(
+    [
+        ("trunk_link", LONGITUDE + 0.001),
+        ("residential", LONGITUDE + 0.005),
+        (["secondary", "tertiary"], LONGITUDE - 0.003),
+        ("primary", LONGITUDE + 0.02),
+    ]
+)
+MAJOR_GRAPH = road_graph(
+    [
+        ("trunk", LONGITUDE + 0.1),
+        ("motorway", LONGITUDE + 0.2),
+    ]
+)
+
+
+def graph_from_point(center_point, dist, **kwargs):
+    return MAJOR_GRAPH if "custom_filter" in kwargs else LOCAL_GRAPH
+
+
+@pytest.fixture
+def mock_graph_from_point():
+    road_network.get_local_road_network.cache_clear()
+    road_network.get_major_road_network.cache_clear()
+    with patch(
+        "api.models.road_network.ox.graph_from_point", side_effect=graph_from_point
+    ) as mock_graph_from_point:
+        yield mock_graph_from_point
+    road_network.get_local_road_network.cache_clear()
+    road_network.get_major_road_network.cache_clear()
+
+
+def test_road_network_is_projected_to_utm():
+    edges = ox.graph_to_gdfs(LOCAL_GRAPH, nodes=False, fill_edge_geometry=True)
+
+    network = RoadNetwork(LATITUDE, LONGITUDE, edges)
+
+    # UTM zone 36N, in metres
+    assert network.point.x == pytest.approx(444_350, abs=100)
+    assert network.point.y == pytest.approx(33_160, abs=100)
+
+
+def test_get_distances_to_closest_roads(mock_graph_from_point):
+    distances = get_distances_to_closest_roads(LATITUDE, LONGITUDE)
+
+    assert distances["road"] == pytest.approx(0.001 * METRES_PER_DEGREE, rel=0.01)
+    assert distances["residential"] == pytest.approx(
+        0.005 * METRES_PER_DEGREE, rel=0.01
+    )
+    assert distances["secondary"] == distances["tertiary"]
+    assert distances["secondary"] == pytest.approx(0.003 * METRES_PER_DEGREE, rel=0.01)
+    # beyond the 1 km radius of primary roads
+    assert distances["primary"] is None
+    assert distances["unclassified"] is None
+    # trunk and motorway roads come from the major road network only
+    assert distances["trunk"] == pytest.approx(0.1 * METRES_PER_DEGREE, rel=0.01)
+    assert distances["motorway"] is None
+
+
+def test_local_and_major_road_networks_are_downloaded_once(mock_graph_from_point):
+    get_distances_to_closest_roads(LATITUDE, LONGITUDE)
+
+    calls = mock_graph_from_point.call_args_list
+    assert len(calls) == 2
+    assert calls[0].kwargs == {"dist": 1000, "network_type": "drive"}
+    assert calls[1].kwargs["dist"] == 30000
+    assert calls[1].kwargs["custom_filter"] == '["highway"~"^(trunk|motorway)$"]'
+
+
+def test_road_networks_are_cached_per_rounded_point(mock_graph_from_point):
+    first = get_distances_to_closest_roads(LATITUDE, LONGITUDE)
+    second = get_distances_to_closest_roads(str(LATITUDE), "32.5000001")
+
+    assert first == second
+    assert mock_graph_from_point.call_count == 2
+
+    get_distances_to_closest_roads(LATITUDE + 0.001, LONGITUDE)
+    assert mock_graph_from_point.call_count == 4
+
+
+def test_failed_download_returns_no_distances(mock_graph_from_point):
+    mock_graph_from_point.side_effect = Exception("Overpass unavailable")
+
+    distances = get_distances_to_closest_roads(LATITUDE, LONGITUDE)
+
+    assert set(distances) == set(road_network.ROAD_CLASS_RADII)
+    assert all(distance is None for distance in distances.values())
@@ -0,0 +1,115 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from api.models.weather_stations import WeatherStationIndex
+
+
+def station(code, latitude, longitude):
+    return {"code": code, "latitude": latitude, "longitude": longitude}
+
+
+@pytest.fixture
+def stations():
+    return [
+        station("TA3", 0.3, 0),
+        station("TA1", 0.1, 0),
+        station("TA4", 0.4, 0),
+        station("TA2", 0.2, 0),
+        station("no coordinates", None, None),
+    ]
+
+
+def test_nearest_k(stations):
+    index = WeatherStationIndex(load_stations=lambda: stations)
+
+    nearest = index.nearest([(0, 0), (0.45, 0)], k=2)
+
+    assert [[s["code"] for s in result] for result in nearest] == [
+        ["TA1", "TA2"],
+        ["TA4", "TA3"],
+    ]
+    assert nearest[0][0]["distance"] < nearest[0][1]["distance"]
+
+
+def test_nearest_within_threshold_distance(stations):
+    index = WeatherStationIndex(load_stations=lambda: stations)
+
+    nearest = index.nearest([(0, 0)], threshold_distance="25")
+
+    assert [s["code"] for s in nearest[0]] == ["TA1", "TA2"]
+
+
+def test_nearest_search_radius_margin():
+    # A degree of latitude at the equator is 110.57 km on the ellipsoid but 111.19 km on the sphere of the
+    # tree, and a degree of longitude is 111.32 km on the ellipsoid.
+    index = WeatherStationIndex(
+        load_stations=lambda: [station("north", 1, 0), station("east", 0, 1)]
+    )
+
+    nearest = index.nearest([(0, 0)], threshold_distance=111)
+
+    assert [s["code"] for s in nearest[0]] == ["north"]
+    assert nearest[0][0]["distance"] == pytest.approx(110.57, abs=0.01)
+
+
+def test_nearest_without_stations():
+    index = WeatherStationIndex(load_stations=lambda: [])
+
+    assert index.nearest([(0, 0), (1, 1)]) == [[], []]
+    assert index.nearest([]) == []
+
+
+def test_catalogue_is_cached(stations):
+    load_stations = MagicMock(return_value=stations)
+    index = WeatherStationIndex(load_stations=load_stations)
+
+    index.nearest([(0, 0)], k=1)
+    index.nearest([(0, 0)], k=1)
+    assert load_stations.call_count == 1
+
+    index.clear()
+    index.nearest([(0, 0)], k=1)
+    assert load_stations.call_count == 2
+
+
+def test_refresh_lists_stations_outside_the_lock(stations):
+    index = WeatherStationIndex(ttl=0)
+
+    def load_stations():
+        assert not index._lock.locked()
+        return stations
+
+    index.load_stations = load_stations
+    assert index.nearest([(0, 0)], k=1)[0][0]["code"] == "TA1"
+
+
+def test_stale_catalogue_served_during_refresh(stations):
+    load_stations = MagicMock(return_value=stations)
+    index = WeatherStationIndex(load_stations=load_stations, ttl=0)
+    index.nearest([(0, 0)], k=1)
+
+    # another request is refreshing the catalogue
+    with index._refresh_lock:
+        nearest = index.nearest([(0, 0)], k=1)
+
+    assert nearest[0][0]["code"] == "TA1"
+    assert load_stations.call_count == 1
+
+
+def test_failed_refresh_keeps_catalogue(stations):
+    load_stations = MagicMock(side_effect=[stations, Exception("TAHMO unavailable")])
+    index = WeatherStationIndex(load_stations=load_stations, ttl=0)
+    index.nearest([(0, 0)], k=1)
+
+    assert index.nearest([(0, 0)], k=1)[0][0]["code"] == "TA1"
+    assert load_stations.call_count == 2
+
+
+def test_failed_first_load_raises():
+    index = WeatherStationIndex(
+        load_stations=MagicMock(side_effect=Exception("TAHMO unavailable"))
+    )
+
+    with pytest.raises(Exception):
+        index.nearest([(0, 0)])
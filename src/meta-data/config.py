@@ -36,6 +36,11 @@ class Config:
     )
     CENTER_OF_KAMPALA_LATITUDE = os.getenv("CENTER_OF_KAMPALA_LATITUDE")
     CENTER_OF_KAMPALA_LONGITUDE = os.getenv("CENTER_OF_KAMPALA_LONGITUDE")
+    OSM_CACHE_FOLDER = os.getenv("OSM_CACHE_FOLDER", "./cache")
+    ROAD_NETWORK_CACHE_SIZE = int(os.getenv("ROAD_NETWORK_CACHE_SIZE", 32))
+    WEATHER_STATIONS_CACHE_TTL = int(
+        os.getenv("WEATHER_STATIONS_CACHE_TTL", 3600)
+    )  # seconds
     SWAGGER_CONFIG = {
         **Swagger.DEFAULT_CONFIG,
         **{"specs_route": f"{BASE_URL_V2}/apidocs/"},
@@ -83,59 +83,8 @@ class MessageBroker:
                 }
             )
 
-            print(
-                f"Computing distance to closest road for site {site_id} .....")
-            distance_to_closest_road = model.get_distance_to_closest_road(
-                site_latitude, site_longitude
-            )
-            print(
-                f"Computing distance to closest primary road for site {site_id} ....."
-            )
-            distance_to_closest_primary_road = (
-                model.get_distance_to_closest_primary_road(
-                    site_latitude, site_longitude
-                )
-            )
-            print(
-                f"Computing distance to closest secondary road for site {site_id} ....."
-            )
-            distance_to_closest_secondary_road = (
-                model.get_distance_to_closest_secondary_road(
-                    site_latitude, site_longitude
-                )
-            )
-            print(
-                f"Computing distance to closest residential road for site {site_id} ....."
-            )
-            distance_to_closest_residential_road = (
-                model.get_distance_to_closest_residential_road(
-                    site_latitude, site_longitude
-                )
-            )
-            print(
-                f"Computing distance to closest tertiary road for site {site_id} ....."
-            )
-            distance_to_closest_tertiary_road = (
-                model.get_distance_to_closest_tertiary_road(
-                    site_latitude, site_longitude
-                )
-            )
-            print(
-                f"Computing distance to closest trunk for site {site_id} .....")
-            distance_to_closest_trunk = model.get_distance_to_closest_trunk(
-                site_latitude, site_longitude
-            )
-            print(
-                f"Computing distance to closest unclassified road for site {site_id} ....."
-            )
-            distance_to_closest_unclassified_road = (
-                model.get_distance_to_closest_unclassified_road(
-                    site_latitude, site_longitude
-                )
-            )
-            print(
-                f"Computing distance to closest motorway for site {site_id} .....")
-            distance_to_closest_motorway = model.get_distance_to_closest_motorway(
+            print(f"Computing distances to closest roads for site {site_id} .....")
+            distances_to_closest_roads = model.get_distances_to_closest_roads(
                 site_latitude, site_longitude
             )
             print(f"Computing greenness for site{site_id} ....")
@@ -146,14 +95,14 @@ class MessageBroker:
             print(f"Saving distances for site {site_id} .....")
             validated_data = remove_invalidate_meta_data_values(
                 {
-                    "distance_to_nearest_road": distance_to_closest_road,
-                    "distance_to_nearest_secondary_road": distance_to_closest_secondary_road,
-                    "distance_to_nearest_primary_road": distance_to_closest_primary_road,
-                    "distance_to_nearest_residential_road": distance_to_closest_residential_road,
-                    "distance_to_nearest_tertiary_road": distance_to_closest_tertiary_road,
-                    "distance_to_nearest_trunk": distance_to_closest_trunk,
-                    "distance_to_nearest_unclassified_road": distance_to_closest_unclassified_road,
-                    "distance_to_nearest_motorway": distance_to_closest_motorway,
+                    "distance_to_nearest_road": distances_to_closest_roads["road"],
+                    "distance_to_nearest_secondary_road": distances_to_closest_roads["secondary"],
+                    "distance_to_nearest_primary_road": distances_to_closest_roads["primary"],
+                    "distance_to_nearest_residential_road": distances_to_closest_roads["residential"],
+                    "distance_to_nearest_tertiary_road": distances_to_closest_roads["tertiary"],
+                    "distance_to_nearest_trunk": distances_to_closest_roads["trunk"],
+                    "distance_to_nearest_unclassified_road": distances_to_closest_roads["unclassified"],
+                    "distance_to_nearest_motorway": distances_to_closest_roads["motorway"],
                     "greenness_of_the_site":greenness_for_a_site,
                 }
             )
@@ -27,6 +27,9 @@ class Config:
     )
     CACHE_TIMEOUT = os.getenv("CACHE_TIMEOUT", 3600)
     PARISH_PREDICTIONS_QUERY_LIMIT = os.getenv("PARISH_PREDICTIONS_QUERY_LIMIT", 100)
+    PREDICTIONS_INDEX_REFRESH_INTERVAL = int(
+        os.getenv("PREDICTIONS_INDEX_REFRESH_INTERVAL", 60)
+    )
 
 
 class ProductionConfig(Config):
@@ -1,14 +1,19 @@
+import gzip
 import json
 import math
+import threading
+import time
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 import requests
 from dotenv import load_dotenv
 from flask import current_app
-from flask import request
+from flask import request, Response
 from google.cloud import bigquery
 from pymongo import errors
+from scipy.spatial import cKDTree
 from sqlalchemy import func
 
 from app import cache
@@ -124,9 +129,137 @@ def get_health_tips(language="") -> list[dict]:
         return []
 
 
-@cache.memoize(timeout=Config.CACHE_TIMEOUT)
+EARTH_RADIUS_METRES = 6371008.8
+
+
+def to_unit_vectors(latitudes, longitudes) -> np.ndarray:
+    latitudes = np.radians(latitudes)
+    longitudes = np.radians(longitudes)
+    return np.column_stack(
+        [
+            np.cos(latitudes) * np.cos(longitudes),
+            np.cos(latitudes) * np.sin(longitudes),
+            np.sin(latitudes),
+        ]
+    )
+
+
+class PredictionsIndex:
+    """
+    In-process KD-tree over the latest GP predictions of every airqloud.
+
+    Points are stored as unit vectors, so a great-circle radius maps to a chord
+    length and point lookups need no warehouse query. The index checks at most
+    every `refresh_interval` seconds whether the gp_model_predictions documents
+    have changed and rebuilds itself when they have.
+    """
+
+    def __init__(self, refresh_interval: int):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._version = None
+        self._tree = None
+        self._predictions = None
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._tree is not None and now - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if (
+                self._tree is not None
+                and now - self._checked_at < self.refresh_interval
+            ):
+                return
+            collection = db.gp_model_predictions
+            version = sorted(
+                (str(document["_id"]), str(document.get("created_at")))
+                for document in collection.find({}, {"created_at": 1})
+            )
+            if version != self._version:
+                self._build(collection.find({}, {"created_at": 1, "values": 1}))
+                self._version = version
+            self._checked_at = now
+
+    def _build(self, documents):
+        predictions = [
+            pd.DataFrame(document["values"]).assign(
+                timestamp=date_to_str(
+                    pd.Timestamp(document["created_at"], tz="UTC").to_pydatetime()
+                )
+            )
+            for document in documents
+            if document.get("values")
+        ]
+        if not predictions:
+            self._tree, self._predictions = None, None
+            return
+        predictions = pd.concat(predictions, ignore_index=True)
+        self._predictions = predictions[
+            ["predicted_value", "interval", "timestamp"]
+        ].to_records(index=False)
+        self._tree = cKDTree(
+            to_unit_vectors(predictions["latitude"], predictions["longitude"])
+        )
+
+    def nearest(
+        self, latitude: float, longitude: float, distance_in_metres: int
+    ) -> dict | None:
+        """
+        Returns the most confident prediction within distance_in_metres of the point,
+        an empty dict when there is none, or None when the index is unavailable.
+        """
+        self._refresh()
+        tree, predictions = self._tree, self._predictions
+        if tree is None:
+            return None
+
+        chord = 2 * math.sin(
+            min(distance_in_metres / (2 * EARTH_RADIUS_METRES), math.pi / 2)
+        )
+        indices = tree.query_ball_point(
+            to_unit_vectors([latitude], [longitude])[0], chord
+        )
+        if not indices:
+            return {}
+
+        prediction = predictions[
+            indices[int(np.argmin(predictions["interval"][indices]))]
+        ]
+        return {
+            "pm2_5": float(prediction["predicted_value"]),
+            "timestamp": prediction["timestamp"],
+            "pm2_5_confidence_interval": float(prediction["interval"]),
+        }
+
+
+predictions_index = PredictionsIndex(Config.PREDICTIONS_INDEX_REFRESH_INTERVAL)
+
+
 def get_predictions_by_geo_coordinates(
     latitude: float, longitude: float, distance_in_metres: int
+) -> dict:
+    try:
+        data = predictions_index.nearest(latitude, longitude, distance_in_metres)
+    except errors.PyMongoError as ex:
+        current_app.logger.error(
+            "Failed to refresh the predictions index: %s", ex, exc_info=False
+        )
+        data = None
+
+    if data is None:
+        data = get_predictions_by_geo_coordinates_from_bigquery(
+            latitude=latitude,
+            longitude=longitude,
+            distance_in_metres=distance_in_metres,
+        )
+    return data
+
+
+@cache.memoize(timeout=Config.CACHE_TIMEOUT)
+def get_predictions_by_geo_coordinates_from_bigquery(
+    latitude: float, longitude: float, distance_in_metres: int
 ) -> dict:
     client = bigquery.Client()
 
@@ -314,6 +447,34 @@ def get_forecasts_2(
     return results
 
 
+def read_heatmap_page(airqloud, page_number=1, limit=1000):
+    """
+    Returns the heatmap page precomputed by the GP model for an airqloud, if any
+    """
+    return db.gp_model_heatmap_pages.find_one(
+        {"airqloud": airqloud, "page": page_number, "limit": limit},
+        {"_id": 0, "etag": 1, "body": 1},
+    )
+
+
+def heatmap_page_response(heatmap_page) -> Response:
+    """
+    Serves a precomputed heatmap page as stored, decompressing it only for clients
+    that do not accept gzip. Requests whose If-None-Match matches get a 304.
+    """
+    body = heatmap_page["body"]
+    if "gzip" in request.accept_encodings:
+        response = Response(body, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(gzip.decompress(body), mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    response.cache_control.public = True
+    response.cache_control.max_age = int(Config.CACHE_TIMEOUT)
+    response.set_etag(heatmap_page["etag"])
+    return response.make_conditional(request)
+
+
 @cache.memoize(timeout=Config.CACHE_TIMEOUT)
 def read_predictions_from_db(airqloud=None, page_number=1, limit=1000):
     collection = db.gp_model_predictions
@@ -21,6 +21,8 @@ from helpers import (
     get_health_tips,
     geo_coordinates_cache_key,
     read_predictions_from_db,
+    read_heatmap_page,
+    heatmap_page_response,
     heatmap_cache_key,
     read_faulty_devices,
     get_faults_cache_key,
@@ -227,12 +229,28 @@ def get_all_hourly_forecasts():
 
 
 @ml_app.route(routes.route["predict_for_heatmap"], methods=["GET"])
-@cache.cached(timeout=Config.CACHE_TIMEOUT, key_prefix=heatmap_cache_key)
 def predictions_for_heatmap():
     airqloud = request.args.get("airqloud")
     page = int(request.args.get("page", 1))
     limit = int(request.args.get("limit", 1000))
 
+    if airqloud:
+        try:
+            heatmap_page = read_heatmap_page(airqloud, page, limit)
+            if heatmap_page:
+                return heatmap_page_response(heatmap_page)
+        except Exception as e:
+            current_app.logger.error("Error: %s", e, exc_info=True)
+
+    return aggregated_predictions_for_heatmap(airqloud, page, limit)
+
+
+@cache.cached(timeout=Config.CACHE_TIMEOUT, key_prefix=heatmap_cache_key)
+def aggregated_predictions_for_heatmap(airqloud, page, limit):
+    """
+    Builds a heatmap page from all the prediction values, used when there is no
+    precomputed page for the request
+    """
     response = {}
 
     try:
@@ -250,7 +268,7 @@ def predictions_for_heatmap():
             status_code = 404
     except Exception as e:
         response["error"] = f"Unfortunately an error occured"
-        current_app.logger.error("Error: ", str(e), exc_info=True)
+        current_app.logger.error("Error: %s", e, exc_info=True)
         status_code = 500
     finally:
         return jsonify(response), status_code
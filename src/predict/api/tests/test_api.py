@@ -1,15 +1,24 @@
+import gzip
+from datetime import datetime
 from unittest.mock import patch
 
 import pytest
 import requests
-from flask import json
+from flask import Flask, json
 from mongomock import MongoClient
 
 from app import create_app
 from config import Config
 from tests.conftest import monkeypatch
-from helpers import read_predictions_from_db, add_forecast_health_tips, get_health_tips
-from prediction import validate_param_values
+from helpers import (
+    read_predictions_from_db,
+    add_forecast_health_tips,
+    get_health_tips,
+    PredictionsIndex,
+    read_heatmap_page,
+    heatmap_page_response,
+    validate_param_values,
+)
 
 valid_params = [
     {"correlation_fault": "0", "missing_data_fault": "0"},
@@ -359,3 +368,87 @@ def test_get_health_tips_timeout(requests_mock):
         {"_id": "64283f6402cbab001e628296"},
         {"_id": "64283f4702cbab001e628293"},
     ]
+
+
+def test_predictions_index_nearest(monkeypatch):
+    mock_db = MongoClient().db
+    mock_db.gp_model_predictions.insert_one(
+        {
+            "airqloud": "kampala",
+            "created_at": datetime(2024, 7, 10, 10),
+            "values": [
+                {
+                    "latitude": 0.3,
+                    "longitude": 32.6,
+                    "predicted_value": 40.0,
+                    "interval": 9.0,
+                },
+                {
+                    "latitude": 0.3005,
+                    "longitude": 32.6,
+                    "predicted_value": 35.0,
+                    "interval": 4.0,
+                },
+                {
+                    "latitude": 0.4,
+                    "longitude": 32.7,
+                    "predicted_value": 20.0,
+                    "interval": 1.0,
+                },
+            ],
+        }
+    )
+    monkeypatch.setattr("helpers.db", mock_db)
+    index = PredictionsIndex(refresh_interval=60)
+
+    assert index.nearest(0.3, 32.6, 100) == {
+        "pm2_5": 35.0,
+        "timestamp": "2024-07-10T10:00:00+00:00",
+        "pm2_5_confidence_interval": 4.0,
+    }
+    assert index.nearest(0.3, 32.6, 10)["pm2_5"] == 40.0
+    assert index.nearest(1.0, 33.0, 100) == {}
+
+
+@pytest.fixture
+def heatmap_page():
+    return {
+        "etag": "kampala-1-1000-1720605600",
+        "body": gzip.compress(json.dumps({"predictions": [], "page": 1}).encode()),
+    }
+
+
+def test_read_heatmap_page(monkeypatch, heatmap_page):
+    mock_db = MongoClient().db
+    mock_db.gp_model_heatmap_pages.insert_one(
+        {"airqloud": "kampala", "page": 1, "limit": 1000, **heatmap_page}
+    )
+    monkeypatch.setattr("helpers.db", mock_db)
+
+    assert read_heatmap_page("kampala", 1, 1000) == heatmap_page
+    assert read_heatmap_page("kampala", 2, 1000) is None
+    assert read_heatmap_page("kampala", 1, 500) is None
+
+
+def test_heatmap_page_response(heatmap_page):
+    app = Flask(__name__)
+    app.add_url_rule("/heatmap", "heatmap", lambda: heatmap_page_response(heatmap_page))
+    client = app.test_client()
+
+    response = client.get("/heatmap", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.data == heatmap_page["body"]
+    assert response.headers["ETag"] == f'"{heatmap_page["etag"]}"'
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+    response = client.get("/heatmap")
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert json.loads(response.data) == {"predictions": [], "page": 1}
+
+    response = client.get(
+        "/heatmap", headers={"If-None-Match": f'"{heatmap_page["etag"]}"'}
+    )
+    assert response.status_code == 304
+    assert response.data == b""
@@ -316,6 +316,51 @@ class AirQoApi:
 
         return list(response["weather_stations"]) if response else []
 
+    def get_nearest_weather_stations_bulk(
+        self, coordinates: List[Dict[str, Any]]
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve the nearest weather stations of several coordinates in a single request.
+
+        Args:
+            coordinates(List[Dict[str, Any]]): Dictionaries with the "latitude" and "longitude" of each location.
+
+        Returns:
+            List[List[Dict[str, Any]]]: The nearest weather stations of each location, in the order of the coordinates supplied, each formatted as in `get_nearest_weather_stations`. Locations without coordinates have none.
+        """
+        # locations without coordinates are not sent and get no weather stations
+        indexes = [
+            index
+            for index, coordinate in enumerate(coordinates)
+            if coordinate.get("latitude") is not None
+            and coordinate.get("longitude") is not None
+        ]
+        nearest_weather_stations = [[] for _ in coordinates]
+        if not indexes:
+            return nearest_weather_stations
+
+        response = self.__request(
+            endpoint="meta-data/nearest-weather-stations/bulk",
+            body={
+                "coordinates": [
+                    {
+                        "latitude": coordinates[index].get("latitude"),
+                        "longitude": coordinates[index].get("longitude"),
+                    }
+                    for index in indexes
+                ]
+            },
+            method="post",
+        )
+
+        if response:
+            for index, record in zip(indexes, response["weather_stations"]):
+                nearest_weather_stations[index] = list(
+                    record.get("weather_stations", [])
+                )
+
+        return nearest_weather_stations
+
     def get_meta_data(self, latitude: str, longitude: str) -> Dict[str, float]:
         """
         Retrieve meta data given latitude and longitude for updating site distance measures.
@@ -1,3 +1,4 @@
+import concurrent.futures
 import traceback
 from datetime import datetime, timezone
 
@@ -21,7 +22,7 @@ from .ml_utils import GCSUtils
 from .thingspeak_api import ThingspeakApi
 from .utils import Utils
 from .weather_data_utils import WeatherDataUtils
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Generator
 from .airqo_gx_expectations import AirQoGxExpectations
 
 import logging
@@ -313,6 +314,8 @@ class AirQoDataUtils:
 
         Retrieves sensor data from Thingspeak API for devices belonging to the specified device category (BAM or low-cost sensors).
         Optionally filters data by specific device numbers and removes outliers if requested.
+        Devices are queried concurrently by a bounded pool of `THINGSPEAK_MAX_WORKERS` threads sharing one thingspeak session,
+        and the per-device frames are concatenated once at the end.
 
         Args:
             start_date_time (str): Start date and time (ISO 8601 format) for data extraction.
@@ -367,7 +370,6 @@ class AirQoDataUtils:
         ]
         data_columns = list(set(data_columns))
 
-        devices_data = pd.DataFrame()
         dates = Utils.query_dates_array(
             start_date_time=start_date_time,
             end_date_time=end_date_time,
@@ -377,56 +379,44 @@ class AirQoDataUtils:
         devices = pd.DataFrame(devices)
         devices.set_index("device_number", inplace=True)
 
+        read_keys = []
         for device_number, read_key in airqo_api.get_thingspeak_read_keys(
             devices[["readKey"]], return_type="yield"
         ):
             if read_key is None or device_number is None:
                 logger.exception(f"{device_number} does not have a read key")
                 continue
-
-            for start, end in dates:
-                data = thingspeak_api.query_data(
+            read_keys.append((device_number, read_key))
+
+        devices_data_list: List[pd.DataFrame] = []
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=configuration.THINGSPEAK_MAX_WORKERS
+        ) as executor:
+            futures = [
+                executor.submit(
+                    AirQoDataUtils._extract_device_data,
+                    thingspeak_api=thingspeak_api,
+                    device=devices.loc[device_number],
                     device_number=device_number,
-                    start_date_time=start,
-                    end_date_time=end,
                     read_key=read_key,
+                    dates=dates,
+                    device_category=device_category,
+                    field_8_cols=field_8_cols,
+                    data_columns=data_columns,
                 )
-                if data.empty:
-                    logger.exception(
-                        f"Device does not have data between {start} and {end}"
-                    )
-                    continue
-
-                if "field8" not in data.columns.to_list():
-                    data = DataValidationUtils.fill_missing_columns(
-                        data=data, cols=data_columns
-                    )
-                else:
-                    data[field_8_cols] = data["field8"].apply(
-                        lambda x: AirQoDataUtils.flatten_field_8(
-                            device_category=device_category, field_8=x
-                        )
-                    )
-
-                meta_data = data.attrs.pop("meta_data", {})
-                data["device_number"] = device_number
-                data["device_id"] = devices.loc[device_number].device_id
-                data["site_id"] = devices.loc[device_number].site_id
-
-                if device_category in AirQoDataUtils.Device_Field_Mapping:
-                    data["latitude"] = devices.loc[device_number].latitude
-                    data["longitude"] = devices.loc[device_number].longitude
-                    data.rename(
-                        columns=AirQoDataUtils.Device_Field_Mapping[device_category],
-                        inplace=True,
-                    )
-                else:
-                    data["latitude"] = meta_data.get("latitude", None)
-                    data["longitude"] = meta_data.get("longitude", None)
+                for device_number, read_key in read_keys
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    devices_data_list.extend(future.result())
+                except Exception as ex:
+                    logger.exception(f"An error occurred: {ex}")
 
-                devices_data = pd.concat(
-                    [devices_data, data[data_columns]], ignore_index=True
-                )
+        devices_data = (
+            pd.concat(devices_data_list, ignore_index=True)
+            if devices_data_list
+            else pd.DataFrame()
+        )
 
         if remove_outliers:
             if "vapor_pressure" in devices_data.columns.to_list():
@@ -438,40 +428,85 @@ class AirQoDataUtils:
         return devices_data
 
     @staticmethod
-    def aggregate_low_cost_sensors_data(data: pd.DataFrame) -> pd.DataFrame:
+    def _extract_device_data(
+        thingspeak_api: ThingspeakApi,
+        device: pd.Series,
+        device_number: int,
+        read_key: str,
+        dates: List[tuple],
+        device_category: DeviceCategory,
+        field_8_cols: List[str],
+        data_columns: List[str],
+    ) -> List[pd.DataFrame]:
+        """
+        Queries thingspeak for a single device over all the date ranges in `dates`. Runs in a worker thread of `extract_devices_data`.
+
+        Returns:
+            A list of pandas DataFrames, one for every date range that returned data.
+        """
+        device_data: List[pd.DataFrame] = []
+        for start, end in dates:
+            data = thingspeak_api.query_data(
+                device_number=device_number,
+                start_date_time=start,
+                end_date_time=end,
+                read_key=read_key,
+            )
+            if data.empty:
+                logger.exception(f"Device does not have data between {start} and {end}")
+                continue
+
+            if "field8" not in data.columns.to_list():
+                data = DataValidationUtils.fill_missing_columns(
+                    data=data, cols=data_columns
+                )
+            else:
+                data[field_8_cols] = data["field8"].apply(
+                    lambda x: AirQoDataUtils.flatten_field_8(
+                        device_category=device_category, field_8=x
+                    )
+                )
+
+            meta_data = data.attrs.pop("meta_data", {})
+            data["device_number"] = device_number
+            data["device_id"] = device.device_id
+            data["site_id"] = device.site_id
+
+            if device_category in AirQoDataUtils.Device_Field_Mapping:
+                data["latitude"] = device.latitude
+                data["longitude"] = device.longitude
+                data.rename(
+                    columns=AirQoDataUtils.Device_Field_Mapping[device_category],
+                    inplace=True,
+                )
+            else:
+                data["latitude"] = meta_data.get("latitude", None)
+                data["longitude"] = meta_data.get("longitude", None)
+
+            device_data.append(data[data_columns])
+
+        return device_data
+
+    @staticmethod
+    def aggregate_low_cost_sensors_data(
+        data: pd.DataFrame, include_counts: bool = False
+    ) -> pd.DataFrame:
         """
         Resamples and avergages out the numeric type fields on an hourly basis.
 
         Args:
             data(pandas.DataFrame): A pandas DataFrame object containing cleaned/converted(numeric) data.
+            include_counts(bool): If True, adds a `<column>_count` column with the number of raw values in each hourly average.
 
         Returns:
             A pandas DataFrame object containing hourly averages of data.
         """
-        data["timestamp"] = pd.to_datetime(data["timestamp"])
-        averages_list: List[pd.DataFrame] = []
-        for _, device_group in data.groupby("device_number"):
-            site_id = device_group.iloc[0]["site_id"]
-            device_id = device_group.iloc[0]["device_id"]
-            device_number = device_group.iloc[0]["device_number"]
-
-            del device_group["site_id"]
-            del device_group["device_id"]
-            del device_group["device_number"]
-            try:
-                averages = device_group.resample("1H", on="timestamp").mean()
-            except ValueError as value_error:
-                logger.exception(f"Error: {value_error}")
-                logger.info(device_group)
-                continue
-            averages["timestamp"] = averages.index
-            averages["device_id"] = device_id
-            averages["site_id"] = site_id
-            averages["device_number"] = device_number
-            averages_list.append(averages)
-        aggregated_data = pd.concat(averages_list, ignore_index=True)
-
-        return aggregated_data
+        return Utils.aggregate_by_frequency(
+            data,
+            group_by=["device_number", "device_id", "site_id"],
+            frequency="1H",
+            include_counts=include_counts,
+        )
 
     @staticmethod
     def clean_bam_data(data: pd.DataFrame) -> pd.DataFrame:
@@ -640,82 +675,157 @@ class AirQoDataUtils:
             A list of measurements
         """
         restructured_data = []
+        for batch in AirQoDataUtils.process_data_for_api_in_batches(
+            data, frequency=frequency
+        ):
+            restructured_data.extend(batch)
 
-        data["timestamp"] = pd.to_datetime(data["timestamp"])
-        data["timestamp"] = data["timestamp"].apply(date_to_str)
+        return restructured_data
 
-        # Create a device lookup dictionary for faster access
-        airqo_api = AirQoApi()
-        devices = airqo_api.get_devices(tenant=Tenant.AIRQO)
+    @staticmethod
+    def process_data_for_api_in_batches(
+        data: pd.DataFrame,
+        frequency: Frequency,
+        batch_size: int = None,
+        devices: List[Dict[str, Any]] = None,
+    ) -> Generator[List[Dict[str, Any]], None, None]:
+        """
+        Formats device measurements into the events endpoint format, yielding fixed-size batches so that the whole payload is never held in memory.
 
-        device_lookup = {
-            device["device_number"]: device
-            for device in devices
-            if device.get("device_number")
-        }
+        Device details are attached with a single merge on `device_number` and the nested payloads are built from column arrays rather than row by row.
 
-        for _, row in data.iterrows():
-            try:
-                device_number = row["device_number"]
+        Args:
+            data(pandas.DataFrame): device measurements
+            frequency(Frequency): frequency of the measurements.
+            batch_size(int, optional): Number of measurements per batch. Defaults to `API_EVENTS_BATCH_SIZE`.
+            devices(list, optional): Devices as returned by `AirQoApi.get_devices`. Fetched from the api if not supplied.
 
-                # Get device details from the lookup dictionary
-                device_details = device_lookup.get(device_number)
-                if not device_details:
-                    logger.exception(
-                        f"Device number {device_number} not found in device list."
-                    )
-                    continue
+        Yields:
+            Lists of at most `batch_size` measurements.
+        """
+        if data.empty:
+            return
+
+        batch_size = batch_size or configuration.API_EVENTS_BATCH_SIZE
+        if devices is None:
+            devices = AirQoApi().get_devices(tenant=Tenant.AIRQO)
+
+        devices = pd.DataFrame(devices, columns=["device_number", "device_id", "_id"])
+        devices = devices.dropna(subset=["device_number"]).drop_duplicates(
+            subset=["device_number"], keep="first"
+        )
+        devices = devices.rename(columns={"device_id": "device", "_id": "mongo_id"})
+
+        data = data.drop(columns=["device", "mongo_id"], errors="ignore")
+        data = pd.merge(data, devices, on="device_number", how="left")
+
+        missing_devices = data.loc[data["device"].isna(), "device_number"].unique()
+        if missing_devices.size:
+            logger.exception(
+                f"Device numbers {missing_devices.tolist()} not found in device list."
+            )
+            data = data.dropna(subset=["device"])
+
+        data["timestamp"] = pd.to_datetime(data["timestamp"]).dt.strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+        data = Utils.populate_missing_columns(
+            data=data,
+            columns=[
+                "site_id",
+                "latitude",
+                "longitude",
+                "pm2_5",
+                "pm2_5_calibrated_value",
+                "pm10",
+                "pm10_calibrated_value",
+                "s1_pm2_5",
+                "s1_pm10",
+                "s2_pm2_5",
+                "s2_pm10",
+                "battery",
+                "altitude",
+                "wind_speed",
+                "satellites",
+                "hdop",
+                "temperature",
+                "humidity",
+            ],
+        )
+
+        tenant = str(Tenant.AIRQO)
+        frequency = str(frequency)
 
+        for start in range(0, len(data), batch_size):
+            batch = data.iloc[start : start + batch_size]
+            batch = batch.astype(object).where(batch.notna(), None)
+            columns = {col: batch[col].tolist() for col in batch.columns}
+
+            restructured_data = []
+            for i in range(len(batch)):
                 row_data = {
-                    "device": device_details["device_id"],
-                    "device_id": device_details["_id"],
-                    "site_id": row["site_id"],
-                    "device_number": device_number,
-                    "tenant": str(Tenant.AIRQO),
+                    "device": columns["device"][i],
+                    "device_id": columns["mongo_id"][i],
+                    "site_id": columns["site_id"][i],
+                    "device_number": columns["device_number"][i],
+                    "tenant": tenant,
                     "location": {
-                        "latitude": {"value": row["latitude"]},
-                        "longitude": {"value": row["longitude"]},
+                        "latitude": {"value": columns["latitude"][i]},
+                        "longitude": {"value": columns["longitude"][i]},
                     },
-                    "frequency": str(frequency),
-                    "time": row["timestamp"],
+                    "frequency": frequency,
+                    "time": columns["timestamp"][i],
                     "average_pm2_5": {
-                        "value": row["pm2_5"],
-                        "calibratedValue": row["pm2_5_calibrated_value"],
+                        "value": columns["pm2_5"][i],
+                        "calibratedValue": columns["pm2_5_calibrated_value"][i],
                     },
                     "average_pm10": {
-                        "value": row["pm10"],
-                        "calibratedValue": row["pm10_calibrated_value"],
+                        "value": columns["pm10"][i],
+                        "calibratedValue": columns["pm10_calibrated_value"][i],
                     },
                     "pm2_5": {
-                        "value": row["pm2_5"],
-                        "calibratedValue": row["pm2_5_calibrated_value"],
+                        "value": columns["pm2_5"][i],
+                        "calibratedValue": columns["pm2_5_calibrated_value"][i],
                     },
                     "pm10": {
-                        "value": row["pm10"],
-                        "calibratedValue": row["pm10_calibrated_value"],
+                        "value": columns["pm10"][i],
+                        "calibratedValue": columns["pm10_calibrated_value"][i],
                     },
-                    "s1_pm2_5": {"value": row["s1_pm2_5"]},
-                    "s1_pm10": {"value": row["s1_pm10"]},
-                    "s2_pm2_5": {"value": row["s2_pm2_5"]},
-                    "s2_pm10": {"value": row["s2_pm10"]},
-                    "battery": {"value": row["battery"]},
-                    "altitude": {"value": row["altitude"]},
-                    "speed": {"value": row["wind_speed"]},
-                    "satellites": {"value": row["satellites"]},
-                    "hdop": {"value": row["hdop"]},
-                    "externalTemperature": {"value": row["temperature"]},
-                    "externalHumidity": {"value": row["humidity"]},
+                    "s1_pm2_5": {"value": columns["s1_pm2_5"][i]},
+                    "s1_pm10": {"value": columns["s1_pm10"][i]},
+                    "s2_pm2_5": {"value": columns["s2_pm2_5"][i]},
+                    "s2_pm10": {"value": columns["s2_pm10"][i]},
+                    "battery": {"value": columns["battery"][i]},
+                    "altitude": {"value": columns["altitude"][i]},
+                    "speed": {"value": columns["wind_speed"][i]},
+                    "satellites": {"value": columns["satellites"][i]},
+                    "hdop": {"value": columns["hdop"][i]},
+                    "externalTemperature": {"value": columns["temperature"][i]},
+                    "externalHumidity": {"value": columns["humidity"][i]},
                 }
 
-                if row_data["site_id"] is None or row_data["site_id"] is np.nan:
+                if row_data["site_id"] is None:
                     row_data.pop("site_id")
 
                 restructured_data.append(row_data)
 
-            except Exception as ex:
-                logger.exception(f"An error occurred: {ex}")
+            yield restructured_data
 
-        return restructured_data
+    @staticmethod
+    def send_data_to_api(data: pd.DataFrame, frequency: Frequency) -> None:
+        """
+        Streams device measurements to the events endpoint in batches of `API_EVENTS_BATCH_SIZE`.
+
+        Args:
+            data(pandas.DataFrame): device measurements
+            frequency(Frequency): frequency of the measurements.
+        """
+        airqo_api = AirQoApi()
+        devices = airqo_api.get_devices(tenant=Tenant.AIRQO)
+        for batch in AirQoDataUtils.process_data_for_api_in_batches(
+            data, frequency=frequency, devices=devices
+        ):
+            airqo_api.save_events(measurements=batch)
 
     @staticmethod
     def merge_aggregated_weather_data(
@@ -957,22 +1067,26 @@ class AirQoDataUtils:
 
         grouped_df = data.groupby("city", dropna=False)
 
-        rf_model = GCSUtils.get_trained_model_from_gcs(
+        # Models are served from the process level ModelRegistry, so each one is only downloaded when it changes in the bucket.
+        default_rf_model = GCSUtils.get_trained_model_from_gcs(
             project_name=project_id,
             bucket_name=bucket,
             source_blob_name=Utils.get_calibration_model_path(
                 CityModel.DEFAULT, "pm2_5"
             ),
         )
-        lasso_model = GCSUtils.get_trained_model_from_gcs(
+        default_lasso_model = GCSUtils.get_trained_model_from_gcs(
             project_name=project_id,
             bucket_name=bucket,
             source_blob_name=Utils.get_calibration_model_path(
                 CityModel.DEFAULT, "pm10"
             ),
         )
+        city_models = [c.value.lower() for c in CityModel]
         for city, group in grouped_df:
-            if str(city).lower() in [c.value.lower() for c in CityModel]:
+            rf_model = default_rf_model
+            lasso_model = default_lasso_model
+            if str(city).lower() in city_models:
                 try:
                     rf_model = GCSUtils.get_trained_model_from_gcs(
                         project_name=project_id,
@@ -988,6 +1102,8 @@ class AirQoDataUtils:
                     )
                 except Exception as ex:
                     logger.exception(f"Error getting model: {ex}")
+                    rf_model = default_rf_model
+                    lasso_model = default_lasso_model
             group["pm2_5_calibrated_value"] = rf_model.predict(group[input_variables])
             group["pm10_calibrated_value"] = lasso_model.predict(group[input_variables])
 
@@ -1039,38 +1155,33 @@ class AirQoDataUtils:
                       If any errors occur during the process, an empty DataFrame is returned.
         """
         from airqo_etl_utils.message_broker_utils import MessageBrokerUtils
-        from confluent_kafka import KafkaException
-        import json
 
         broker = MessageBrokerUtils()
-        devices_list: list = []
+        batches: List[pd.DataFrame] = []
 
-        for message in broker.consume_from_topic(
-            topic="devices-topic",
-            group_id=group_id,
-            auto_offset_reset="earliest",
-            auto_commit=False,
-        ):
-            try:
-                key = message.get("key", None)
-                try:
-                    value = json.loads(message.get("value", None))
-                except json.JSONDecodeError as e:
-                    logger.exception(f"Error decoding JSON: {e}")
-                    continue
-                if not key or not value.get("device_id"):
-                    logger.info(
-                        f"Skipping message with key: {key}, missing 'device_id'."
-                    )
-                    continue
-
-                devices_list.append(value)
-            except KafkaException as e:
-                logger.exception(f"Error while consuming message: {e}")
-            continue
+        try:
+            broker.consume_batches(
+                topic="devices-topic",
+                group_id=group_id,
+                sink=batches.append,
+                auto_offset_reset="earliest",
+                commit=False,
+                keyed_only=True,
+            )
+        except Exception as e:
+            logger.exception(f"Error while consuming devices: {e}")
 
         try:
-            devices = pd.DataFrame(devices_list)
+            devices = (
+                pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+            )
+            if "device_id" in devices.columns:
+                skipped = devices["device_id"].isna()
+                if skipped.any():
+                    logger.info(
+                        f"Skipping {skipped.sum()} messages missing 'device_id'."
+                    )
+                devices = devices[~skipped]
             # Will be removed in the future. Just here for initial tests.
             devices.drop(
                 devices.columns[devices.columns.str.contains("^Unnamed")],
@@ -1083,8 +1194,8 @@ class AirQoDataUtils:
             devices = pd.DataFrame()
 
         if "device_name" in devices.columns.tolist():
-            devices.drop_duplicates(subset=["device_name"], keep="last")
+            devices = devices.drop_duplicates(subset=["device_name"], keep="last")
         elif "device_id" in devices.columns.tolist():
-            devices.drop_duplicates(subset=["device_id"], keep="last")
+            devices = devices.drop_duplicates(subset=["device_id"], keep="last")
 
         return devices
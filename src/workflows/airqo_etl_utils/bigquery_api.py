@@ -1,7 +1,9 @@
 import logging
 import os
-from datetime import datetime
-from typing import List
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
 
 import pandas as pd
 from google.cloud import bigquery
@@ -16,6 +18,23 @@ logger = logging.getLogger(__name__)
 
 
 class BigQueryApi:
+    # The schema files do not change at runtime, so the parsed schemas, column lists and coercion plans are shared by all instances.
+    _schemas: Dict[str, List[dict]] = {}
+    _columns: Dict[tuple, List[str]] = {}
+    _coercion_plans: Dict[str, Dict[str, List[str]]] = {}
+    _schema_stats: Dict[str, float] = {
+        f"{name}{suffix}": 0
+        for name in [
+            "schema_loads",
+            "columns_hits",
+            "columns_misses",
+            "coercion_plan_hits",
+            "coercion_plan_misses",
+            "validations",
+        ]
+        for suffix in ["", "_seconds"]
+    }
+
     def __init__(self):
         self.client = bigquery.Client()
         self.schema_mapping = configuration.SCHEMA_FILE_MAPPING
@@ -118,7 +137,9 @@ class BigQueryApi:
         float_columns=None,
         integer_columns=None,
     ) -> pd.DataFrame:
-        valid_cols = self.get_columns(table=table)
+        started = time.perf_counter()
+        plan = self.get_coercion_plan(table=table)
+        valid_cols = plan["columns"]
         dataframe_cols = dataframe.columns.to_list()
 
         if set(valid_cols).issubset(set(dataframe_cols)):
@@ -132,34 +153,45 @@ class BigQueryApi:
             if raise_exception:
                 raise Exception("Invalid columns")
 
-        date_time_columns = (
-            date_time_columns
-            if date_time_columns
-            else self.get_columns(table=table, column_type=[ColumnDataType.TIMESTAMP])
-        )
-
-        float_columns = (
-            float_columns
-            if float_columns
-            else self.get_columns(table=table, column_type=[ColumnDataType.FLOAT])
-        )
-
-        integer_columns = (
-            integer_columns
-            if integer_columns
-            else self.get_columns(table=table, column_type=[ColumnDataType.INTEGER])
-        )
-
         from .data_validator import DataValidationUtils
 
         dataframe = DataValidationUtils.format_data_types(
             data=dataframe,
-            floats=float_columns,
-            integers=integer_columns,
-            timestamps=date_time_columns,
+            floats=float_columns if float_columns else plan["floats"],
+            integers=integer_columns if integer_columns else plan["integers"],
+            timestamps=date_time_columns if date_time_columns else plan["timestamps"],
         )
+        dataframe = dataframe.drop_duplicates(keep="first")
 
-        return dataframe.drop_duplicates(keep="first")
+        BigQueryApi._record_schema_stat("validations", time.perf_counter() - started)
+        return dataframe
+
+    @staticmethod
+    def _record_schema_stat(name: str, seconds: float = 0.0) -> None:
+        BigQueryApi._schema_stats[f"{name}"] += 1
+        BigQueryApi._schema_stats[f"{name}_seconds"] += seconds
+
+    @staticmethod
+    def get_schema_stats() -> Dict[str, float]:
+        """
+        Returns the counters of the schema registry: the schema files loaded from disk, the hits and misses of the column lists and coercion plans, and the validations run, each with the total seconds spent on them.
+        """
+        return dict(BigQueryApi._schema_stats)
+
+    @staticmethod
+    def load_schema(file_name: str) -> List[dict]:
+        """
+        Loads a schema file once per process and serves it from memory afterwards.
+        """
+        schema = BigQueryApi._schemas.get(file_name, None)
+        if schema is None:
+            started = time.perf_counter()
+            schema = Utils.load_schema(file_name=file_name)
+            BigQueryApi._schemas[file_name] = schema
+            BigQueryApi._record_schema_stat(
+                "schema_loads", time.perf_counter() - started
+            )
+        return schema
 
     def get_columns(
         self,
@@ -168,6 +200,7 @@ class BigQueryApi:
     ) -> List[str]:
         """
         Retrieves a list of columns that match a schema of a given table and or match data type as well. The schemas should match the tables in bigquery.
+        The lists are cached per table and column types, and a copy is returned so that callers may modify it.
 
         Args:
             table (str): The data asset name as it appears in BigQuery, in the format 'project.dataset.table'.
@@ -176,13 +209,20 @@ class BigQueryApi:
         Returns:
             List[str]: A list of column names that match the passed specifications.
         """
+        key = (table, tuple(sorted(str(ct) for ct in column_type)))
+        columns = BigQueryApi._columns.get(key, None)
+        if columns is not None:
+            BigQueryApi._record_schema_stat("columns_hits")
+            return list(columns)
+
+        started = time.perf_counter()
         schema_file = self.schema_mapping.get(table, None)
 
         if schema_file is None and table != "all":
             raise Exception("Invalid table")
 
         if schema_file:
-            schema = Utils.load_schema(file_name=schema_file)
+            schema = self.load_schema(file_name=schema_file)
         else:
             schema = []
             for file in [
@@ -199,7 +239,7 @@ class BigQueryApi:
                 "bam_measurements",
                 "bam_raw_measurements",
             ]:
-                file_schema = Utils.load_schema(file_name=f"{file}.json")
+                file_schema = self.load_schema(file_name=f"{file}.json")
                 schema.extend(file_schema)
 
         # Convert column_type list to strings for comparison
@@ -217,7 +257,41 @@ class BigQueryApi:
             )
         )
 
-        return columns
+        BigQueryApi._columns[key] = columns
+        BigQueryApi._record_schema_stat("columns_misses", time.perf_counter() - started)
+        return list(columns)
+
+    def get_coercion_plan(self, table: str) -> Dict[str, List[str]]:
+        """
+        Builds, once per table, the columns of the table and the columns to coerce to each type when validating data for it.
+
+        Args:
+            table (str): The data asset name as it appears in BigQuery, in the format 'project.dataset.table'.
+
+        Returns:
+            Dict[str, List[str]]: The "columns", "floats", "integers" and "timestamps" of the table. A copy of the cached plan is returned so that callers may modify it.
+        """
+        plan = BigQueryApi._coercion_plans.get(table, None)
+        if plan is not None:
+            BigQueryApi._record_schema_stat("coercion_plan_hits")
+            return {name: list(columns) for name, columns in plan.items()}
+
+        started = time.perf_counter()
+        plan = {
+            "columns": self.get_columns(table=table),
+            "floats": self.get_columns(table=table, column_type=[ColumnDataType.FLOAT]),
+            "integers": self.get_columns(
+                table=table, column_type=[ColumnDataType.INTEGER]
+            ),
+            "timestamps": self.get_columns(
+                table=table, column_type=[ColumnDataType.TIMESTAMP]
+            ),
+        }
+        BigQueryApi._coercion_plans[table] = plan
+        BigQueryApi._record_schema_stat(
+            "coercion_plan_misses", time.perf_counter() - started
+        )
+        return {name: list(columns) for name, columns in plan.items()}
 
     def load_data(
         self,
@@ -241,22 +315,6 @@ class BigQueryApi:
         print(f"Loaded {len(dataframe)} rows to {table}")
         print(f"Total rows after load :  {destination_table.num_rows}")
 
-    @staticmethod
-    def add_unique_id(dataframe: pd.DataFrame, id_column="unique_id") -> pd.DataFrame:
-        dataframe[id_column] = dataframe.apply(
-            lambda row: BigQueryApi.device_unique_col(
-                tenant=row["tenant"],
-                device_number=row["device_number"],
-                device_id=row["device_id"],
-            ),
-            axis=1,
-        )
-        return dataframe
-
-    @staticmethod
-    def device_unique_col(tenant: str, device_id: str, device_number: int):
-        return str(f"{tenant}:{device_id}:{device_number}").lower()
-
     def update_airqlouds(self, dataframe: pd.DataFrame, table=None) -> None:
         if table is None:
             table = self.airqlouds_table
@@ -396,112 +454,136 @@ class BigQueryApi:
         dataframe = self.validate_data(dataframe=dataframe, table=table)
 
         if component == "sites":
-            unique_id = "id"
+            key_columns = ["id"]
 
         elif component == "devices":
-            unique_id = "unique_id"
-            dataframe = self.add_unique_id(dataframe)
+            key_columns = ["tenant", "device_id", "device_number"]
 
         else:
             raise Exception("Invalid component. Valid values are sites and devices.")
 
-        dataframe.drop_duplicates(subset=[unique_id], inplace=True, keep="first")
-
-        available_data = (
-            self.client.query(query=f"SELECT * FROM `{table}`").result().to_dataframe()
-        )
-
-        if available_data.empty:
-            up_to_date_data = dataframe
-        else:
-            if component == "devices":
-                available_data = self.add_unique_id(available_data)
-
-            available_data.drop_duplicates(
-                subset=[unique_id], inplace=True, keep="first"
-            )
-            data_not_for_updating = available_data.loc[
-                ~available_data[unique_id].isin(dataframe[unique_id].to_list())
-            ]
-            up_to_date_data = pd.concat(
-                [data_not_for_updating, dataframe], ignore_index=True
-            )
-
-        if component == "devices":
-            del up_to_date_data[unique_id]
-
-        self.load_data(
-            dataframe=up_to_date_data, table=table, job_action=JobAction.OVERWRITE
-        )
+        self.merge_data(dataframe=dataframe, table=table, key_columns=key_columns)
 
     def update_sites_meta_data(self, dataframe: pd.DataFrame) -> None:
         dataframe.reset_index(drop=True, inplace=True)
         table = self.sites_meta_data_table
         dataframe = self.validate_data(dataframe=dataframe, table=table)
 
-        unique_id = "site_id"
+        self.merge_data(dataframe=dataframe, table=table, key_columns=["site_id"])
 
-        dataframe.drop_duplicates(subset=[unique_id], inplace=True, keep="first")
+    def update_data(
+        self,
+        dataframe: pd.DataFrame,
+        table: str,
+    ) -> None:
+        dataframe.reset_index(drop=True, inplace=True)
+        dataframe = self.validate_data(dataframe=dataframe, table=table)
 
-        available_data = (
-            self.client.query(query=f"SELECT * FROM `{table}`").result().to_dataframe()
+        self.merge_data(
+            dataframe=dataframe,
+            table=table,
+            key_columns=["tenant", "device_id", "device_number"],
         )
 
-        if available_data.empty:
-            up_to_date_data = dataframe
-        else:
-            available_data.drop_duplicates(
-                subset=[unique_id], inplace=True, keep="first"
-            )
-            data_not_for_updating = available_data.loc[
-                ~available_data[unique_id].isin(dataframe[unique_id].to_list())
-            ]
-            up_to_date_data = pd.concat(
-                [data_not_for_updating, dataframe], ignore_index=True
-            )
+    @staticmethod
+    def compose_merge_query(
+        table: str, staging_table: str, columns: List[str], key_columns: List[str]
+    ) -> str:
+        """
+        Composes a MERGE statement upserting the rows of a staging table into a table. Rows are matched on the key columns case insensitively, with nulls matching nulls, as the unique ids previously built from them did.
 
-        self.load_data(
-            dataframe=up_to_date_data, table=table, job_action=JobAction.OVERWRITE
+        Args:
+            table (str): The target table, in the format 'project.dataset.table'.
+            staging_table (str): The staging table holding the incoming rows.
+            columns (List[str]): The columns of the staging table.
+            key_columns (List[str]): The columns identifying a row.
+
+        Returns:
+            str: The MERGE statement.
+        """
+        match_condition = " AND ".join(
+            f"LOWER(CAST(target.`{column}` AS STRING)) IS NOT DISTINCT FROM LOWER(CAST(source.`{column}` AS STRING))"
+            for column in key_columns
+        )
+        update_columns = ", ".join(
+            f"`{column}` = source.`{column}`"
+            for column in columns
+            if column not in key_columns
         )
+        insert_columns = ", ".join(f"`{column}`" for column in columns)
+        insert_values = ", ".join(f"source.`{column}`" for column in columns)
 
-    def update_data(
+        query = f" MERGE `{table}` target USING `{staging_table}` source ON {match_condition} "
+        if update_columns:
+            query += f" WHEN MATCHED THEN UPDATE SET {update_columns} "
+        query += f" WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values}) "
+
+        return query
+
+    def merge_data(
         self,
         dataframe: pd.DataFrame,
         table: str,
+        key_columns: List[str],
     ) -> None:
-        dataframe.reset_index(drop=True, inplace=True)
-        dataframe = self.validate_data(dataframe=dataframe, table=table)
-        dataframe = self.add_unique_id(dataframe=dataframe)
-        dataframe.drop_duplicates(subset=["unique_id"], inplace=True, keep="first")
+        """
+        Upserts a dataframe into a table. The dataframe is loaded into a short-lived staging table next to the target table and merged into it with a single MERGE on the key columns, so only the incoming rows are read and written rather than the whole table.
 
-        available_data = (
-            self.client.query(query=f"SELECT * FROM `{table}`").result().to_dataframe()
+        Args:
+            dataframe (pd.DataFrame): The validated rows to upsert.
+            table (str): The target table, in the format 'project.dataset.table'.
+            key_columns (List[str]): The columns identifying a row. Incoming rows with the same key are deduplicated, keeping the first.
+        """
+        # nulls stay null so that None and NaN are one key, as in the MERGE condition
+        keys = pd.DataFrame(
+            {
+                column: dataframe[column]
+                .astype(str)
+                .str.lower()
+                .where(dataframe[column].notna())
+                for column in key_columns
+            }
+        )
+        dataframe = dataframe.loc[~keys.duplicated(keep="first")].reset_index(drop=True)
+        if dataframe.empty:
+            return
+
+        columns = dataframe.columns.to_list()
+        schema = [
+            field
+            for field in self.client.get_table(table).schema
+            if field.name in columns
+        ]
+
+        staging_table = bigquery.Table(
+            f"{table}_staging_{uuid.uuid4().hex}", schema=schema
         )
+        # expires on its own if the run dies before dropping it
+        staging_table.expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        staging_table = self.client.create_table(staging_table)
 
-        if available_data.empty:
-            up_to_date_data = dataframe
-        else:
-            available_data["timestamp"] = available_data["timestamp"].apply(
-                pd.to_datetime
+        try:
+            job_config = bigquery.LoadJobConfig(
+                schema=schema,
+                write_disposition=JobAction.APPEND.get_name(),
             )
-            available_data = self.add_unique_id(dataframe=available_data)
+            self.client.load_table_from_dataframe(
+                dataframe, staging_table, job_config=job_config
+            ).result()
 
-            available_data.drop_duplicates(
-                subset=["unique_id"], inplace=True, keep="first"
+            query = self.compose_merge_query(
+                table=table,
+                staging_table=f"{staging_table.project}.{staging_table.dataset_id}.{staging_table.table_id}",
+                columns=columns,
+                key_columns=key_columns,
             )
-            data_not_for_updating = available_data.loc[
-                ~available_data["unique_id"].isin(dataframe["unique_id"].to_list())
-            ]
-            up_to_date_data = pd.concat(
-                [data_not_for_updating, dataframe], ignore_index=True
+            job = self.client.query(query=query)
+            job.result()
+            logger.info(
+                f"Merged {len(dataframe)} rows into {table}, {job.num_dml_affected_rows} rows affected"
             )
-
-        up_to_date_data["timestamp"] = up_to_date_data["timestamp"].apply(date_to_str)
-        del up_to_date_data["unique_id"]
-
-        self.load_data(
-            dataframe=up_to_date_data, table=table, job_action=JobAction.OVERWRITE
-        )
+        finally:
+            self.client.delete_table(staging_table, not_found_ok=True)
 
     def compose_query(
         self,
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 import pymongo as pm
@@ -21,6 +22,10 @@ class Config:
     # Thingspeak
     THINGSPEAK_API_KEY = os.getenv("THINGSPEAK_API_KEY")
     THINGSPEAK_CHANNEL_URL = os.getenv("THINGSPEAK_CHANNEL_URL")
+    THINGSPEAK_MAX_WORKERS = int(os.getenv("THINGSPEAK_MAX_WORKERS", 10))
+    THINGSPEAK_MAX_REQUESTS_PER_SECOND = float(
+        os.getenv("THINGSPEAK_MAX_REQUESTS_PER_SECOND", 20)
+    )
 
     # Aggregated data
     BIGQUERY_HOURLY_EVENTS_TABLE = os.getenv("BIGQUERY_HOURLY_EVENTS_TABLE")
@@ -73,6 +78,7 @@ class Config:
     # AirQo
     POST_EVENTS_BODY_SIZE = os.getenv("POST_EVENTS_BODY_SIZE", 10)
     POST_WEATHER_BODY_SIZE = os.getenv("POST_EVENTS_BODY_SIZE", 10)
+    API_EVENTS_BATCH_SIZE = int(os.getenv("API_EVENTS_BATCH_SIZE", 1000))
     CALIBRATION_BASE_URL = os.getenv("CALIBRATION_BASE_URL")
     AIRQO_BASE_URL_V2 = os.getenv("AIRQO_BASE_URL_V2")
     AIRQO_API_KEY = os.getenv("AIRQO_API_KEY")
@@ -265,6 +271,17 @@ class Config:
     SATELLITE_TRAINING_SCOPE = os.getenv("SATELLITE_TRAINING_SCOPE")
     MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI")
     FORECAST_MODELS_BUCKET = os.getenv("FORECAST_MODELS_BUCKET")
+    # Model registry. Set MODEL_REGISTRY_BACKEND to "local" to read models from the local filesystem.
+    MODEL_REGISTRY_BACKEND = os.getenv("MODEL_REGISTRY_BACKEND", "gcs")
+    MODEL_CACHE_DIR = os.getenv(
+        "MODEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "airqo_models")
+    )
+    MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", 10))
+    # Fault detection. Devices are grouped into clusters that each get their own isolation forest.
+    FAULT_DETECTION_DEVICE_CLUSTERS = int(
+        os.getenv("FAULT_DETECTION_DEVICE_CLUSTERS", 1)
+    )
+    FAULT_DETECTION_N_JOBS = int(os.getenv("FAULT_DETECTION_N_JOBS", 1))
     MONGO_URI = os.getenv("MONGO_URI")
     MONGO_DATABASE_NAME = os.getenv("MONGO_DATABASE_NAME", "airqo_db")
     ENVIRONMENT = os.getenv("ENVIRONMENT")
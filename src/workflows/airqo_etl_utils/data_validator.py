@@ -33,6 +33,9 @@ class DataValidationUtils:
         "intakehumidity": (0, 99),
     }
 
+    # Validation plans built by get_validation_plan, keyed by table.
+    _validation_plans: Dict[str, Dict[str, Any]] = {}
+
     @staticmethod
     def format_data_types(
         data: pd.DataFrame,
@@ -44,6 +47,33 @@ class DataValidationUtils:
         integers = [] if integers is None else integers
         timestamps = [] if timestamps is None else timestamps
 
+        # Columns that already hold numbers are cast together in one astype, only the others need parsing.
+        # Nullable integer columns, as BigQuery returns them, go through the parsing that maps missing values
+        # to -1.
+        dtypes = {
+            col: np.float64
+            for col in floats
+            if pd.api.types.is_numeric_dtype(data[col])
+            and not pd.api.types.is_bool_dtype(data[col])
+        }
+        dtypes.update(
+            {
+                col: np.int64
+                for col in integers
+                if pd.api.types.is_integer_dtype(data[col])
+                and not pd.api.types.is_extension_array_dtype(data[col])
+            }
+        )
+        floats = [col for col in floats if col not in dtypes]
+        integers = [col for col in integers if col not in dtypes]
+        timestamps = [
+            col
+            for col in timestamps
+            if not pd.api.types.is_datetime64_any_dtype(data[col])
+        ]
+        if dtypes:
+            data = data.astype(dtypes)
+
         # This drops rows that have data that cannot be converted
         data[floats] = data[floats].apply(pd.to_numeric, errors="coerce")
         data[timestamps] = data[timestamps].apply(pd.to_datetime, errors="coerce")
@@ -80,23 +110,75 @@ class DataValidationUtils:
         return row_value
 
     @staticmethod
-    def remove_outliers(data: pd.DataFrame) -> pd.DataFrame:
+    def get_validation_plan(table: str = "all") -> Dict[str, Any]:
+        """
+        Builds, once per table, the columns to type-cast and the valid (min, max) range of every column that has one.
+        The plan is cached on the class so repeated calls do not re-read the schema files.
+
+        Args:
+            table(str): The bigquery table whose schema is used to build the plan. Defaults to "all" schemas.
+
+        Returns:
+            A dictionary with the structure.
+            {
+                "floats": set(str),
+                "integers": set(str),
+                "timestamps": set(str),
+                "ranges": {column: (min, max)}
+            }
+        """
+        plan = DataValidationUtils._validation_plans.get(table, None)
+        if plan is not None:
+            return plan
+
         big_query_api = BigQueryApi()
-        float_columns = set(
-            big_query_api.get_columns(table="all", column_type=[ColumnDataType.FLOAT])
-        )
-        integer_columns = set(
-            big_query_api.get_columns(table="all", column_type=[ColumnDataType.INTEGER])
-        )
-        timestamp_columns = set(
-            big_query_api.get_columns(
-                table="all", column_type=[ColumnDataType.TIMESTAMP]
-            )
-        )
+        plan = {
+            "floats": set(
+                big_query_api.get_columns(
+                    table=table, column_type=[ColumnDataType.FLOAT]
+                )
+            ),
+            "integers": set(
+                big_query_api.get_columns(
+                    table=table, column_type=[ColumnDataType.INTEGER]
+                )
+            ),
+            "timestamps": set(
+                big_query_api.get_columns(
+                    table=table, column_type=[ColumnDataType.TIMESTAMP]
+                )
+            ),
+        }
+
+        ranges: Dict[str, tuple] = {}
+        for col in chain(plan["floats"], plan["integers"], plan["timestamps"]):
+            name = configuration.AIRQO_DATA_COLUMN_NAME_MAPPING.get(col, None)
+            if name in DataValidationUtils.VALID_SENSOR_RANGES:
+                ranges[col] = DataValidationUtils.VALID_SENSOR_RANGES[name]
+        plan["ranges"] = ranges
+
+        DataValidationUtils._validation_plans[table] = plan
+        return plan
+
+    @staticmethod
+    def remove_outliers(data: pd.DataFrame, table: str = "all") -> pd.DataFrame:
+        """
+        Casts columns to their schema types and sets values outside the valid sensor ranges to null.
+        The number of rejected values per column is logged and stored in `data.attrs["outliers"]`.
+
+        Args:
+            data(pandas.DataFrame): The data to validate.
+            table(str): The bigquery table whose schema defines the column types. Defaults to "all" schemas.
+
+        Returns:
+            The validated pandas DataFrame.
+        """
+        plan = DataValidationUtils.get_validation_plan(table)
+        data_columns = set(data.columns)
 
-        float_columns = list(float_columns & set(data.columns))
-        integer_columns = list(integer_columns & set(data.columns))
-        timestamp_columns = list(timestamp_columns & set(data.columns))
+        float_columns = list(plan["floats"] & data_columns)
+        integer_columns = list(plan["integers"] & data_columns)
+        timestamp_columns = list(plan["timestamps"] & data_columns)
 
         data = DataValidationUtils.format_data_types(
             data=data,
@@ -105,15 +187,20 @@ class DataValidationUtils:
             timestamps=timestamp_columns,
         )
 
-        columns = list(chain(float_columns, integer_columns, timestamp_columns))
-
-        for col in columns:
-            name = configuration.AIRQO_DATA_COLUMN_NAME_MAPPING.get(col, None)
-            data.loc[:, col] = data[col].apply(
-                lambda x: DataValidationUtils.get_valid_value(
-                    column_name=name, row_value=x
-                )
-            )
+        outliers: Dict[str, int] = {}
+        for col, (min_val, max_val) in plan["ranges"].items():
+            if col not in data_columns:
+                continue
+            values = data[col]
+            invalid = ~values.between(min_val, max_val) & values.notna()
+            rejected = int(invalid.sum())
+            if rejected:
+                data[col] = values.mask(invalid)
+                outliers[col] = rejected
+
+        if outliers:
+            logger.info(f"Outliers removed per column: {outliers}")
+        data.attrs["outliers"] = outliers
 
         return data
 
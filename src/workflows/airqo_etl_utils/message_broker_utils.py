@@ -1,6 +1,6 @@
 import json
 import logging
-import sys
+import time
 
 import numpy as np
 import pandas as pd
@@ -11,7 +11,7 @@ from airqo_etl_utils.airqo_api import AirQoApi
 from airqo_etl_utils.constants import Tenant
 from .date import date_to_str
 
-from typing import Any, Generator, Optional, List
+from typing import Any, Callable, Dict, Generator, Iterable, Optional, List, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +24,7 @@ class MessageBrokerUtils:
     """
 
     MAX_MESSAGE_SIZE = 1 * 1024 * 1024
+    ENCODING_SLICE_SIZE = 10000
 
     def __init__(self):
         """
@@ -43,53 +44,64 @@ class MessageBrokerUtils:
         """Select the least loaded partition."""
         return min(self.partition_loads, key=self.partition_loads.get)
 
-    def __on_delivery(self, err, msg):
+    def _encode_records(
+        self, data: pd.DataFrame, column_key: str = None
+    ) -> Generator[Tuple[Any, bytes], None, None]:
         """
-        Delivery callback for Kafka message send operations.
+        Generator that serializes the dataframe slice by slice, encoding every record to JSON exactly once.
 
         Args:
-            err: Error information if the message failed delivery, otherwise None.
-            msg: The message that was sent.
+            data: The dataframe to serialize.
+            column_key: Optional column whose value is yielded as the record's key.
 
-        Logs:
-            Success or failure of the message delivery.
+        yield:
+            (key, encoded record) tuples. The key is None if no column_key is provided.
         """
-        if err is not None:
-            logger.error(f"Message delivery failed: {err}")
-        else:
-            logger.info(
-                f"Message delivered to {msg.topic()} [{msg.partition()}] at offset {msg.offset()}"
-            )
+        for start in range(0, len(data), self.ENCODING_SLICE_SIZE):
+            frame = data.iloc[start : start + self.ENCODING_SLICE_SIZE]
+            records = frame.to_json(
+                orient="records", lines=True, date_format="iso", double_precision=15
+            ).split("\n")
+            keys = frame[column_key].tolist() if column_key else [None] * len(frame)
+            for key, record in zip(keys, records):
+                yield key, record.encode("utf-8")
 
     def _generate_chunks(
-        self, dataframe_list: List[dict]
-    ) -> Generator[List[dict], None, None]:
+        self, records: Iterable[bytes]
+    ) -> Generator[List[bytes], None, None]:
         """
-        Generator that yields chunks of data that fit within the MAX_MESSAGE_SIZE.
+        Generator that yields chunks of encoded records that fit within the MAX_MESSAGE_SIZE once wrapped as {"data": [...]}.
 
         Args:
-            dataframe_list: List of dictionaries representing data records.
+            records: Already encoded JSON records.
 
         yield:
-            Chunked data fitting within 1MB size.
+            Chunked records fitting within 1MB size.
         """
+        overhead = len(b'{"data":[]}')
         chunk = []
-        size = 0
-        for row in dataframe_list:
-            row_size = sys.getsizeof(json.dumps(row))
-            if size + row_size > self.MAX_MESSAGE_SIZE:
+        size = overhead
+        for record in records:
+            record_size = len(record) + 1  # separating comma
+            if chunk and size + record_size > self.MAX_MESSAGE_SIZE:
                 logger.info(f"Message size: {size}")
                 yield chunk
                 chunk = []
-                size = 0
-            chunk.append(row)
-            size += row_size
+                size = overhead
+            chunk.append(record)
+            size += record_size
 
         if chunk:  # yield the last chunk
             yield chunk
 
     def _send_message(
-        self, producer: Producer, topic: str, key: Any, message: str, partition=None
+        self,
+        producer: Producer,
+        topic: str,
+        key: Any,
+        message: bytes,
+        partition=None,
+        on_delivery=None,
     ) -> None:
         """
         Sends a message to the specified Kafka topic using the provided producer.
@@ -100,24 +112,25 @@ class MessageBrokerUtils:
             key: The key of the message (can be None if no key is needed).
             message: The message to send, typically serialized to JSON.
             partition: Optionally specify the partition to send the message to. If None, Kafka will decide the partition.
+            on_delivery: Optional delivery callback. The producer is polled without blocking after every message so callbacks are served as deliveries complete.
 
         Raises:
             Exception: If an error occurs while sending the message, the exception is logged.
         """
+        kwargs = {"topic": topic, "key": key, "value": message}
+        if partition is not None:
+            kwargs["partition"] = partition
+        if on_delivery is not None:
+            kwargs["on_delivery"] = on_delivery
+
         try:
-            if partition is not None:
-                producer.produce(
-                    topic=topic,
-                    key=key,
-                    value=message,
-                    partition=partition,
-                    on_delivery=self.__on_delivery,
-                )
-            else:
-                producer.produce(
-                    topic=topic, key=key, value=message, on_delivery=self.__on_delivery
-                )
+            try:
+                producer.produce(**kwargs)
+            except BufferError:
+                # The local queue is full, wait for some deliveries before retrying.
                 producer.poll(1.0)
+                producer.produce(**kwargs)
+            producer.poll(0)
         except Exception as e:
             logger.exception(f"Error while sending message to topic {topic}: {e}")
 
@@ -127,7 +140,7 @@ class MessageBrokerUtils:
         data: pd.DataFrame,
         column_key: str = None,
         auto_partition: bool = True,
-    ):
+    ) -> Dict[str, Any]:
         """
         Publishes data to a Kafka topic. If a `column_key` is provided, each row's key will be
         extracted from the specified column, otherwise data is split into chunks and sent without keys.
@@ -138,6 +151,9 @@ class MessageBrokerUtils:
             column_key: Optional column name to be used as the message key. If None, data is chunked and sent without keys.
             auto_partition: If True, Kafka will automatically select the partition. If False, partitions are selected manually based on load.
 
+        Returns:
+            Dict[str, Any]: Publishing metrics i.e message, byte and record counts, delivered/failed counts, messages/s, bytes/s and delivery latency in seconds.
+
         Raises:
             Exception: If an error occurs while sending a message, the exception is logged.
         """
@@ -157,45 +173,80 @@ class MessageBrokerUtils:
         )
         producer = Producer(producer_config)
 
+        metrics = {"messages": 0, "bytes": 0, "delivered": 0, "failed": 0}
+        latencies: List[float] = []
+
+        def on_delivery(err, msg):
+            if err is not None:
+                metrics["failed"] += 1
+                logger.error(f"Message delivery failed: {err}")
+                return
+            metrics["delivered"] += 1
+            latency = msg.latency()
+            if latency is not None:
+                latencies.append(latency)
+
         logger.info(f"Preparing to publish data to topic: {topic}")
-        data.replace(np.nan, None, inplace=True)
-        dataframe_list = data.to_dict("records")
-        message_counts = 0
+        start_time = time.monotonic()
+        record_count = 0
         if column_key:
             logger.info(f"Using '{column_key}' as the key for messages")
-            for row in dataframe_list:
-                key = row.get(column_key, None)
-                if key is None:
+            for key, message in self._encode_records(data, column_key):
+                if key is None or pd.isna(key):
                     logger.warning(
-                        f"No key found for column '{column_key}' in row: {row}"
+                        f"No key found for column '{column_key}' in row: {message}"
                     )
                     continue
-                message = json.dumps(row, allow_nan=True).encode("utf-8")
 
                 selected_partition = (
                     None if auto_partition else self.__get_least_loaded_partition()
                 )
-                self._send_message(producer, topic, key, message, selected_partition)
+                self._send_message(
+                    producer, topic, key, message, selected_partition, on_delivery
+                )
                 if not auto_partition:
                     self.partition_loads[selected_partition] += 1
-                message_counts += 1
+                metrics["messages"] += 1
+                metrics["bytes"] += len(message)
+                record_count += 1
 
         else:
             logger.info("No key provided, splitting data into chunks and publishing")
-            for chunk_data in self._generate_chunks(dataframe_list):
-                message_counts += len(chunk_data)
-                message = json.dumps({"data": chunk_data}).encode("utf-8")
+            records = (record for _, record in self._encode_records(data))
+            for chunk_data in self._generate_chunks(records):
+                record_count += len(chunk_data)
+                message = b'{"data":[' + b",".join(chunk_data) + b"]}"
 
                 selected_partition = (
                     None if auto_partition else self.__get_least_loaded_partition()
                 )
-                self._send_message(producer, topic, None, message, selected_partition)
+                self._send_message(
+                    producer, topic, None, message, selected_partition, on_delivery
+                )
 
                 if not auto_partition:
                     self.partition_loads[selected_partition] += 1
+                metrics["messages"] += 1
+                metrics["bytes"] += len(message)
 
-        logger.info(f"{message_counts} messages have been loaded.")
         producer.flush()
+        elapsed = max(time.monotonic() - start_time, 1e-9)
+
+        metrics.update(
+            {
+                "records": record_count,
+                "seconds": elapsed,
+                "messages_per_second": metrics["messages"] / elapsed,
+                "bytes_per_second": metrics["bytes"] / elapsed,
+                "mean_delivery_latency": (
+                    float(np.mean(latencies)) if latencies else None
+                ),
+                "max_delivery_latency": float(np.max(latencies)) if latencies else None,
+            }
+        )
+        logger.info(f"{record_count} messages have been loaded.")
+        logger.info(f"Publishing metrics for topic {topic}: {metrics}")
+        return metrics
 
     def consume_from_topic(
         self,
@@ -283,3 +334,155 @@ class MessageBrokerUtils:
             logger.info(
                 f"Closed consumer. No more messages to consume from topic: {topic}"
             )
+
+    @staticmethod
+    def _decode_batch(values: List[bytes]) -> pd.DataFrame:
+        """
+        Decodes a batch of JSON payloads into a single DataFrame in one parse. Chunked payloads of the form {"data": [...]} are expanded into their records.
+
+        Args:
+            values: Raw message payloads.
+
+        Returns:
+            pd.DataFrame: One row per record in the batch.
+        """
+        try:
+            payloads = json.loads(b"[" + b",".join(values) + b"]")
+        except json.JSONDecodeError:
+            # Fall back to decoding messages individually so that one bad message does not drop the whole batch.
+            payloads = []
+            for value in values:
+                try:
+                    payloads.append(json.loads(value))
+                except json.JSONDecodeError as e:
+                    logger.exception(f"Error decoding JSON: {e}")
+
+        records: List[dict] = []
+        for payload in payloads:
+            if isinstance(payload, dict) and isinstance(payload.get("data"), list):
+                records.extend(payload["data"])
+            elif isinstance(payload, dict):
+                records.append(payload)
+
+        return pd.DataFrame(records)
+
+    @staticmethod
+    def _get_consumer_lag(consumer: Consumer) -> int:
+        """
+        Sums, over all assigned partitions, the number of messages between the consumer's position and the high watermark.
+        """
+        lag = 0
+        try:
+            for partition in consumer.position(consumer.assignment()):
+                _, high = consumer.get_watermark_offsets(partition, cached=True)
+                if partition.offset >= 0 and high >= 0:
+                    lag += max(high - partition.offset, 0)
+        except Exception as e:
+            logger.exception(f"Failed to compute consumer lag: {e}")
+        return lag
+
+    def consume_batches(
+        self,
+        topic: str,
+        group_id: str,
+        sink: Callable[[pd.DataFrame], None],
+        batch_size: int = 500,
+        timeout: float = 1.0,
+        auto_offset_reset: str = "latest",
+        commit: bool = True,
+        max_batches: Optional[int] = None,
+        wait_time_sec: int = 40,
+        streaming: bool = False,
+        keyed_only: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Consumes a Kafka topic in batches using `Consumer.consume`, decoding every batch into a single DataFrame that is passed to `sink`.
+        Offsets are committed per batch and only after `sink` returns, so a failing sink causes the batch to be redelivered.
+
+        Args:
+            topic: The Kafka topic to consume from.
+            group_id: The consumer group ID.
+            sink: Callable that stores/processes a decoded batch. Exceptions raised by the sink stop consumption without committing the batch.
+            batch_size: Maximum number of messages fetched per batch.
+            timeout: Maximum time in seconds to wait for a batch.
+            auto_offset_reset: Determines where to start reading when there's no valid offset. Default is 'latest'.
+            commit: Whether to commit offsets after each successful batch. Set to False to re-read the topic on every run.
+            max_batches: Limit on the number of batches to consume. If None, consume all available messages.
+            wait_time_sec: How long to wait for the first batch (partition assignment).
+            streaming: If True, run as a continuous streaming job.
+            keyed_only: If True, messages without a key are skipped.
+
+        Returns:
+            Dict[str, Any]: Consumption metrics i.e batch, message and record counts, the last consumer lag and batch processing times in seconds.
+        """
+        consumer_config = self.config.copy()
+        consumer_config.update(
+            {
+                "group.id": group_id,
+                "auto.offset.reset": auto_offset_reset,
+                "enable.auto.commit": "false",
+                "fetch.message.max.bytes": 2 * 1024 * 1024,
+            }
+        )
+
+        consumer = Consumer(consumer_config)
+        consumer.subscribe([topic])
+
+        metrics = {
+            "batches": 0,
+            "messages": 0,
+            "records": 0,
+            "lag": None,
+            "batch_processing_seconds": [],
+        }
+        waited = 0.0
+        try:
+            while max_batches is None or metrics["batches"] < max_batches:
+                messages = consumer.consume(num_messages=batch_size, timeout=timeout)
+
+                if not messages:
+                    if streaming:
+                        continue
+                    if metrics["batches"] == 0 and waited < wait_time_sec:
+                        logger.info("Waiting for partition assignment...")
+                        waited += timeout
+                        continue
+                    break
+
+                start_time = time.monotonic()
+                values = []
+                for msg in messages:
+                    if msg.error():
+                        logger.exception(f"Consumer error: {msg.error()}")
+                        continue
+                    if keyed_only and not msg.key():
+                        logger.info(f"Skipping message without a key from {topic}.")
+                        continue
+                    if msg.value():
+                        values.append(msg.value())
+
+                data = self._decode_batch(values) if values else pd.DataFrame()
+                if not data.empty:
+                    sink(data)
+
+                if commit:
+                    consumer.commit(asynchronous=False)
+
+                metrics["batches"] += 1
+                metrics["messages"] += len(messages)
+                metrics["records"] += len(data)
+                metrics["batch_processing_seconds"].append(
+                    time.monotonic() - start_time
+                )
+                metrics["lag"] = self._get_consumer_lag(consumer)
+                logger.info(
+                    f"Processed batch {metrics['batches']} of {len(messages)} messages from {topic} in "
+                    f"{metrics['batch_processing_seconds'][-1]:.3f}s, consumer lag: {metrics['lag']}"
+                )
+        finally:
+            consumer.close()
+            logger.info(
+                f"Closed consumer for topic {topic}: {metrics['batches']} batches consumed."
+            )
+
+        return metrics
@@ -1,5 +1,12 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from typing import Any, Dict, Tuple
 
+import fsspec
 import gcsfs
 import joblib
 import mlflow
@@ -24,17 +31,110 @@ pd.options.mode.chained_assignment = None
 ### This module contains utility functions for ML jobs.
 
 
+class ModelRegistry:
+    """
+    Process level cache of trained models.
+
+    Models are kept unpickled in an LRU keyed by (bucket, blob, generation) and their files are kept in `MODEL_CACHE_DIR`,
+    so a model is only downloaded again when its generation in the bucket changes.
+    """
+
+    _models: "OrderedDict[Tuple[str, str, str], Any]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_filesystem(project_name: str) -> fsspec.AbstractFileSystem:
+        if configuration.MODEL_REGISTRY_BACKEND == "local":
+            return fsspec.filesystem("file")
+        return gcsfs.GCSFileSystem(project=project_name)
+
+    @staticmethod
+    def get_generation(info: Dict[str, Any]) -> str:
+        """
+        Returns the version identifier of a stored model. GCS objects have a generation, local files fall back to their modification time and size.
+        """
+        generation = info.get("generation", None)
+        if generation:
+            return str(generation)
+        return f"{info.get('mtime', '')}-{info.get('size', '')}"
+
+    @staticmethod
+    def is_valid_cache_file(path: str, info: Dict[str, Any]) -> bool:
+        if not os.path.exists(path):
+            return False
+        if info.get("size", None) is not None and os.path.getsize(path) != int(
+            info["size"]
+        ):
+            return False
+        md5_hash = info.get("md5Hash", None)
+        if md5_hash:
+            with open(path, "rb") as handle:
+                digest = hashlib.md5(handle.read()).digest()
+            return base64.b64encode(digest).decode("utf-8") == md5_hash
+        return True
+
+    @staticmethod
+    def get_model(project_name: str, bucket_name: str, source_blob_name: str) -> Any:
+        """
+        Retrieves a trained model, downloading it only if the generation in the bucket is not already cached in memory or on disk.
+
+        Args:
+            project_name(str): Google cloud project of the bucket.
+            bucket_name(str): Bucket (or local directory for the local backend) holding the model.
+            source_blob_name(str): Name of the model file in the bucket.
+
+        Returns:
+            The unpickled model.
+        """
+        fs = ModelRegistry.get_filesystem(project_name)
+        remote_path = f"{bucket_name}/{source_blob_name}"
+        info = fs.info(remote_path)
+        key = (bucket_name, source_blob_name, ModelRegistry.get_generation(info))
+
+        with ModelRegistry._lock:
+            if key in ModelRegistry._models:
+                ModelRegistry._models.move_to_end(key)
+                return ModelRegistry._models[key]
+
+        cache_dir = os.path.join(
+            configuration.MODEL_CACHE_DIR, bucket_name.strip("/").replace("/", "_")
+        )
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_file = os.path.join(
+            cache_dir, f"{key[2]}-{source_blob_name.replace('/', '_')}"
+        )
+
+        if not ModelRegistry.is_valid_cache_file(cache_file, info):
+            temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            fs.get(remote_path, temp_file)
+            if not ModelRegistry.is_valid_cache_file(temp_file, info):
+                os.remove(temp_file)
+                raise ValueError(f"Checksum mismatch for downloaded {remote_path}")
+            os.replace(temp_file, cache_file)
+
+        model = joblib.load(cache_file)
+
+        with ModelRegistry._lock:
+            ModelRegistry._models[key] = model
+            ModelRegistry._models.move_to_end(key)
+            while len(ModelRegistry._models) > configuration.MODEL_CACHE_SIZE:
+                ModelRegistry._models.popitem(last=False)
+
+        return model
+
+    @staticmethod
+    def clear() -> None:
+        with ModelRegistry._lock:
+            ModelRegistry._models.clear()
+
+
 class GCSUtils:
     """Utility class for saving and retrieving models from GCS"""
 
     # TODO: In future, save and retrieve models from mlflow instead of GCS
     @staticmethod
     def get_trained_model_from_gcs(project_name, bucket_name, source_blob_name):
-        fs = gcsfs.GCSFileSystem(project=project_name)
-        fs.ls(bucket_name)
-        with fs.open(bucket_name + "/" + source_blob_name, "rb") as handle:
-            job = joblib.load(handle)
-        return job
+        return ModelRegistry.get_model(project_name, bucket_name, source_blob_name)
 
     @staticmethod
     def upload_trained_model_to_gcs(
@@ -438,142 +538,140 @@ class ForecastUtils(BaseMlUtils):
 
     @staticmethod
     def generate_forecasts(data, project_name, bucket_name, frequency):
+        """
+        Recursively forecasts pm2_5 for all devices at once.
+
+        The last values of every device are kept in a fixed-length buffer (devices x buffer length), the lag, rolling and
+        cyclic features are updated from the buffer at each horizon step and the model is called once per step for all devices.
+
+        The forecast of step n is timestamped n hours (hourly) or n days (daily) after the device's last observation.
+        """
         data = data.dropna(subset=["device_id"])
         data["timestamp"] = pd.to_datetime(data["timestamp"])
         data.columns = data.columns.str.strip()
 
-        # data["margin_of_error"] = data["adjusted_forecast"] = 0
+        if frequency == "daily":
+            suffix = "day"
+            step = pd.Timedelta(days=1)
+            lags = [1, 2, 3, 7]
+            windows = [2, 3, 7]
+            functions = ["mean", "std", "max", "min"]
+            attributes = ["year", "month", "day", "dayofweek"]
+            max_vals = [2023, 12, 30, 7]
+            horizon = int(configuration.DAILY_FORECAST_HORIZON)
+        elif frequency == "hourly":
+            suffix = "hour"
+            step = pd.Timedelta(hours=1)
+            lags = [1, 2, 6, 12]
+            windows = [3, 6, 12, 24]
+            functions = ["mean", "std", "median", "skew"]
+            attributes = ["year", "month", "day", "dayofweek", "hour"]
+            max_vals = [2023, 12, 30, 7, 23]
+            horizon = int(configuration.HOURLY_FORECAST_HORIZON)
+        else:
+            raise ValueError("Invalid frequency argument")
 
-        def get_forecasts(
-            df_tmp,
-            forecast_model,
-            frequency,
-            horizon,
-        ):
-            """This method generates forecasts for a given device dataframe basing on horizon provided"""
-            for i in range(int(horizon)):
-                df_tmp = pd.concat([df_tmp, df_tmp.iloc[-1:]], ignore_index=True)
-                df_tmp_no_ts = df_tmp.drop(
-                    columns=["timestamp", "device_id", "site_id"], axis=1, inplace=False
-                )
-                # daily frequency
-                if frequency == "daily":
-                    df_tmp.tail(1)["timestamp"] += timedelta(days=1)
-                    shifts1 = [1, 2, 3, 7]
-                    for s in shifts1:
-                        df_tmp[f"pm2_5_last_{s}_day"] = df_tmp.shift(s, axis=0)["pm2_5"]
-                    # rolling features
-                    shifts2 = [2, 3, 7]
-                    functions = ["mean", "std", "max", "min"]
-                    for s in shifts2:
-                        for f in functions:
-                            df_tmp[f"pm2_5_{f}_{s}_day"] = (
-                                df_tmp_no_ts.shift(1, axis=0).rolling(s).agg(f)
-                            )["pm2_5"]
-
-                elif frequency == "hourly":
-                    df_tmp.iloc[-1, df_tmp.columns.get_loc("timestamp")] = df_tmp.iloc[
-                        -2, df_tmp.columns.get_loc("timestamp")
-                    ] + pd.Timedelta(hours=1)
-
-                    # lag features
-                    shifts1 = [1, 2, 6, 12]
-                    for s in shifts1:
-                        df_tmp[f"pm2_5_last_{s}_hour"] = df_tmp.shift(s, axis=0)[
-                            "pm2_5"
-                        ]
-
-                    # rolling features
-                    shifts2 = [3, 6, 12, 24]
-                    functions = ["mean", "std", "median", "skew"]
-                    for s in shifts2:
-                        for f in functions:
-                            df_tmp[f"pm2_5_{f}_{s}_hour"] = (
-                                df_tmp_no_ts.shift(1, axis=0).rolling(s).agg(f)
-                            )["pm2_5"]
-
-                attributes = ["year", "month", "day", "dayofweek"]
-                max_vals = [2023, 12, 30, 7]
-                if frequency == "hourly":
-                    attributes.append("hour")
-                    max_vals.append(23)
-                for a, m in zip(attributes, max_vals):
-                    df_tmp.tail(1)[f"{a}_sin"] = np.sin(
-                        2
-                        * np.pi
-                        * df_tmp.tail(1)["timestamp"].dt.__getattribute__(a)
-                        / m
-                    )
-                    df_tmp.tail(1)[f"{a}_cos"] = np.cos(
-                        2
-                        * np.pi
-                        * df_tmp.tail(1)["timestamp"].dt.__getattribute__(a)
-                        / m
-                    )
-                df_tmp.tail(1)["week_sin"] = np.sin(
-                    2 * np.pi * df_tmp.tail(1)["timestamp"].dt.isocalendar().week / 52
-                )
-                df_tmp.tail(1)["week_cos"] = np.cos(
-                    2 * np.pi * df_tmp.tail(1)["timestamp"].dt.isocalendar().week / 52
-                )
+        excluded_columns = [
+            "device_id",
+            "site_id",
+            "pm2_5",
+            "timestamp",
+            "latitude",
+            "longitude",
+        ]
+        feature_columns = [col for col in data.columns if col not in excluded_columns]
+        feature_index = {col: i for i, col in enumerate(feature_columns)}
+
+        def set_feature(features, name, values):
+            if name in feature_index:
+                features[:, feature_index[name]] = values
+
+        def rolling_agg(window, function):
+            """Pandas rolling semantics: NaN if any value in the window is missing, sample std and bias-corrected skew."""
+            if function == "mean":
+                return window.mean(axis=1)
+            if function == "std":
+                return window.std(axis=1, ddof=1)
+            if function == "median":
+                return np.median(window, axis=1)
+            if function == "max":
+                return window.max(axis=1)
+            if function == "min":
+                return window.min(axis=1)
+            if function == "skew":
+                n = window.shape[1]
+                if n < 3:
+                    return np.full(window.shape[0], np.nan)
+                deviations = window - window.mean(axis=1, keepdims=True)
+                m2 = (deviations**2).mean(axis=1)
+                m3 = (deviations**3).mean(axis=1)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    skew = np.sqrt(n * (n - 1)) / (n - 2) * m3 / m2**1.5
+                return np.where(m2 <= 1e-14, np.nan, skew)
+            raise ValueError(f"Unsupported rolling function {function}")
 
-                excluded_columns = [
-                    "device_id",
-                    "site_id",
-                    "pm2_5",
-                    "timestamp",
-                    "latitude",
-                    "longitude",
-                    # "margin_of_error",
-                    # "adjusted_forecast",
-                ]
-                # excluded_columns_2 = [
-                #     "timestamp",
-                #     "margin_of_error",
-                #     "adjusted_forecast",
-                # ]
-                df_tmp.loc[df_tmp.index[-1], "pm2_5"] = forecast_model.predict(
-                    df_tmp.drop(excluded_columns, axis=1).tail(1).values.reshape(1, -1)
-                )
-                # df_tmp.loc[df_tmp.index[-1], "margin_of_error"] = error_model.predict(
-                #     df_tmp.drop(excluded_columns_2, axis=1)
-                #     .tail(1)
-                #     .values.reshape(1, -1)
-                # )
-                # df_tmp.loc[df_tmp.index[-1], "adjusted_forecast"] = (
-                #     df_tmp.loc[df_tmp.index[-1], "pm2_5"]
-                #     + df_tmp.loc[df_tmp.index[-1], "margin_of_error"]
-                # )
-
-            return df_tmp.iloc[-int(horizon) :, :]
-
-        forecasts = pd.DataFrame()
         forecast_model = GCSUtils.get_trained_model_from_gcs(
             project_name, bucket_name, f"{frequency}_forecast_model.pkl"
         )
-        # error_model = GCSUtils.get_trained_model_from_gcs(
-        #     project_name, bucket_name, f"{frequency}_error_model.pkl"
-        # )
 
-        df_tmp = data.copy()
-        for device in df_tmp["device_id"].unique():
-            test_copy = df_tmp[df_tmp["device_id"] == device]
-            horizon = (
-                configuration.HOURLY_FORECAST_HORIZON
-                if frequency == "hourly"
-                else configuration.DAILY_FORECAST_HORIZON
-            )
-            device_forecasts = get_forecasts(
-                test_copy,
-                forecast_model,
-                frequency,
-                horizon,
-            )
-
-            forecasts = pd.concat([forecasts, device_forecasts], ignore_index=True)
+        buffer_length = max(max(lags), max(windows))
+        by_device = data.groupby("device_id", sort=False)
+        last_rows = by_device.tail(1)
+        device_ids = last_rows["device_id"].to_numpy()
+        device_index = pd.Index(device_ids)
+
+        history = by_device.tail(buffer_length)
+        positions = (
+            history.groupby("device_id", sort=False)
+            .cumcount(ascending=False)
+            .to_numpy()
+        )
+        buffer = np.full((len(device_ids), buffer_length), np.nan)
+        buffer[
+            device_index.get_indexer(history["device_id"]),
+            buffer_length - 1 - positions,
+        ] = history["pm2_5"].to_numpy(dtype=float)
+
+        features = last_rows[feature_columns].to_numpy(dtype=float, copy=True)
+        timestamps = pd.DatetimeIndex(last_rows["timestamp"])
+
+        forecast_values = np.empty((len(device_ids), horizon))
+        for i in range(horizon):
+            timestamps = timestamps + step
+
+            for s in lags:
+                set_feature(features, f"pm2_5_last_{s}_{suffix}", buffer[:, -s])
+            for w in windows:
+                window = buffer[:, -w:]
+                for f in functions:
+                    set_feature(
+                        features, f"pm2_5_{f}_{w}_{suffix}", rolling_agg(window, f)
+                    )
 
-        forecasts["pm2_5"] = forecasts["pm2_5"].astype(float)
-        # forecasts["margin_of_error"] = forecasts["margin_of_error"].astype(float)
+            for a, m in zip(attributes, max_vals):
+                values = getattr(timestamps, a).to_numpy(dtype=float)
+                set_feature(features, f"{a}_sin", np.sin(2 * np.pi * values / m))
+                set_feature(features, f"{a}_cos", np.cos(2 * np.pi * values / m))
+            weeks = timestamps.isocalendar().week.to_numpy(dtype=float)
+            set_feature(features, "week_sin", np.sin(2 * np.pi * weeks / 52))
+            set_feature(features, "week_cos", np.cos(2 * np.pi * weeks / 52))
+
+            predictions = np.asarray(forecast_model.predict(features), dtype=float)
+            forecast_values[:, i] = predictions
+
+            buffer[:, :-1] = buffer[:, 1:]
+            buffer[:, -1] = predictions
+
+        steps = np.tile(np.arange(1, horizon + 1), len(device_ids))
+        forecasts = pd.DataFrame(
+            {
+                "device_id": np.repeat(device_ids, horizon),
+                "site_id": np.repeat(last_rows["site_id"].to_numpy(), horizon),
+                "timestamp": pd.DatetimeIndex(last_rows["timestamp"]).repeat(horizon)
+                + steps * step,
+                "pm2_5": forecast_values.ravel(),
+            }
+        )
 
         return forecasts[
             [
@@ -581,27 +679,13 @@ class ForecastUtils(BaseMlUtils):
                 "site_id",
                 "timestamp",
                 "pm2_5",
-                # "margin_of_error",
-                # "adjusted_forecast",
             ]
         ]
 
     @staticmethod
     def save_forecasts_to_mongo(data, frequency):
-        device_ids = data["device_id"].unique()
         created_at = pd.to_datetime(datetime.now()).isoformat()
 
-        forecast_results = []
-        for i in device_ids:
-            doc = {
-                "device_id": i,
-                "created_at": created_at,
-                "site_id": data[data["device_id"] == i]["site_id"].unique()[0],
-                "pm2_5": data[data["device_id"] == i]["pm2_5"].tolist(),
-                "timestamp": data[data["device_id"] == i]["timestamp"].tolist(),
-            }
-            forecast_results.append(doc)
-
         if frequency == "hourly":
             collection = db.hourly_forecasts_1
         elif frequency == "daily":
@@ -609,27 +693,94 @@ class ForecastUtils(BaseMlUtils):
         else:
             raise ValueError("Invalid frequency argument")
 
-        for doc in forecast_results:
-            try:
-                filter_query = {
-                    "device_id": doc["device_id"],
-                    "site_id": doc["site_id"],
-                }
-                update_query = {
+        bulk_ops = [
+            pm.UpdateOne(
+                {"device_id": device_id, "site_id": device_data["site_id"].iloc[0]},
+                {
                     "$set": {
-                        "pm2_5": doc["pm2_5"],
-                        "timestamp": doc["timestamp"],
-                        "created_at": doc["created_at"],
+                        "pm2_5": device_data["pm2_5"].tolist(),
+                        "timestamp": device_data["timestamp"].tolist(),
+                        "created_at": created_at,
                     }
-                }
-                collection.update_one(filter_query, update_query, upsert=True)
-            except Exception as e:
-                print(
-                    f"Failed to update forecast for device {doc['device_id']}: {str(e)}"
-                )
+                },
+                upsert=True,
+            )
+            for device_id, device_data in data.groupby("device_id", sort=False)
+        ]
+        if not bulk_ops:
+            return
+
+        try:
+            collection.bulk_write(bulk_ops, ordered=False)
+        except Exception as e:
+            print(f"Failed to update forecasts: {str(e)}")
 
 
 class FaultDetectionUtils(BaseMlUtils):
+    @staticmethod
+    def device_correlation(df: pd.DataFrame, column_x: str, column_y: str) -> pd.Series:
+        """
+        Computes the Pearson correlation between two columns for every device in a single groupby pass.
+
+        Args:
+            df: Frame with a `device_id` column and the two columns to correlate.
+            column_x: Name of the first column.
+            column_y: Name of the second column.
+
+        Returns:
+            pd.Series: Correlation per device, computed over the rows where both columns are present like `Series.corr`. NaN when it is undefined.
+        """
+        complete = df[column_x].notna() & df[column_y].notna()
+        values = df.loc[complete, [column_x, column_y]].astype(float)
+        devices = df.loc[complete, "device_id"]
+
+        centred = values - values.groupby(devices).transform("mean")
+        moments = (
+            pd.DataFrame(
+                {
+                    "count": 1,
+                    "xx": centred[column_x] ** 2,
+                    "yy": centred[column_y] ** 2,
+                    "xy": centred[column_x] * centred[column_y],
+                }
+            )
+            .groupby(devices)
+            .sum()
+        )
+        moments = moments.reindex(pd.unique(df["device_id"]))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation = moments["xy"] / np.sqrt(moments["xx"] * moments["yy"])
+        correlation[moments["count"] < 2] = np.nan
+        return correlation.clip(-1, 1)
+
+    @staticmethod
+    def max_run_length(flags: pd.Series, devices: pd.Series) -> pd.Series:
+        """
+        Returns the longest run of consecutive True flags of every device, in row order.
+
+        Args:
+            flags: Boolean series.
+            devices: Device id of every row of `flags`.
+
+        Returns:
+            pd.Series: Longest run length per device, 0 for devices with no flagged rows.
+        """
+        order = np.argsort(pd.factorize(devices)[0], kind="stable")
+        flags = flags.iloc[order].to_numpy(dtype=bool)
+        devices = devices.iloc[order]
+        starts = np.r_[
+            True,
+            (flags[1:] != flags[:-1]) | (devices.values[1:] != devices.values[:-1]),
+        ]
+        runs = np.cumsum(starts)
+        run_lengths = np.bincount(runs)[runs]
+        return (
+            pd.Series(np.where(flags, run_lengths, 0), index=devices.values)
+            .groupby(level=0, sort=False)
+            .max()
+        )
+
     @staticmethod
     def flag_rule_based_faults(df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -649,73 +800,104 @@ class FaultDetectionUtils(BaseMlUtils):
                 f"Input must have the following columns: {required_columns}"
             )
 
+        correlation = FaultDetectionUtils.device_correlation(df, "s1_pm2_5", "s2_pm2_5")
+        missing_data_run = pd.concat(
+            [
+                FaultDetectionUtils.max_run_length(df[col].isna(), df["device_id"])
+                for col in ["s1_pm2_5", "s2_pm2_5"]
+            ],
+            axis=1,
+        ).max(axis=1)
+
         result = pd.DataFrame(
-            columns=[
-                "device_id",
-                "correlation_fault",
-                "correlation_value",
-                "missing_data_fault",
-            ]
+            {
+                "device_id": correlation.index,
+                "correlation_fault": (correlation < 0.9).astype(int).values,
+                "correlation_value": correlation.values,
+                "missing_data_fault": (
+                    missing_data_run.reindex(correlation.index) >= 60
+                )
+                .astype(int)
+                .values,
+            }
         )
-        for device in df["device_id"].unique():
-            device_df = df[df["device_id"] == device]
-            corr = device_df["s1_pm2_5"].corr(device_df["s2_pm2_5"])
-            correlation_fault = 1 if corr < 0.9 else 0
-            missing_data_fault = 0
-            for col in ["s1_pm2_5", "s2_pm2_5"]:
-                null_series = device_df[col].isna()
-                if (null_series.rolling(window=60).sum() >= 60).any():
-                    missing_data_fault = 1
-                    break
-
-            temp = pd.DataFrame(
-                {
-                    "device_id": [device],
-                    "correlation_fault": [correlation_fault],
-                    "correlation_value": [corr],
-                    "missing_data_fault": [missing_data_fault],
-                }
-            )
-            result = pd.concat([result, temp], ignore_index=True)
         result = result[
             (result["correlation_fault"] == 1) | (result["missing_data_fault"] == 1)
         ]
         return result
 
     @staticmethod
-    def flag_pattern_based_faults(df: pd.DataFrame) -> pd.DataFrame:
-        """
-        Flags pattern-based faults such as high variance, constant values, etc"""
+    def _fit_predict_isolation_forest(features: np.ndarray) -> np.ndarray:
         from sklearn.ensemble import IsolationForest
 
+        isolation_forest = IsolationForest(contamination=0.37)
+        return isolation_forest.fit(features).predict(features)
+
+    @staticmethod
+    def flag_pattern_based_faults(
+        df: pd.DataFrame, n_clusters: int = None, n_jobs: int = None
+    ) -> pd.DataFrame:
+        """
+        Flags pattern-based faults such as high variance, constant values, etc.
+
+        With more than one cluster, devices are grouped by k-means over their mean features and an isolation forest is fitted per cluster, in parallel.
+
+        Args:
+            df: Frame with `device_id`, `timestamp` and numeric feature columns.
+            n_clusters: Number of device clusters. Defaults to `FAULT_DETECTION_DEVICE_CLUSTERS`.
+            n_jobs: Number of parallel jobs. Defaults to `FAULT_DETECTION_N_JOBS`.
+
+        Returns:
+            pd.DataFrame: The rows without missing values and an `anomaly_value` column, -1 for anomalies and 1 otherwise.
+        """
+        from joblib import Parallel, delayed
+        from sklearn.cluster import KMeans
+        from sklearn.preprocessing import StandardScaler
+
         if not isinstance(df, pd.DataFrame):
             raise ValueError("Input must be a dataframe")
 
+        n_clusters = n_clusters or configuration.FAULT_DETECTION_DEVICE_CLUSTERS
+        n_jobs = n_jobs or configuration.FAULT_DETECTION_N_JOBS
+
         df["timestamp"] = pd.to_datetime(df["timestamp"])
         columns_to_ignore = ["device_id", "timestamp"]
         df.dropna(inplace=True)
+        features = df.drop(columns=columns_to_ignore)
+
+        device_features = features.groupby(df["device_id"]).mean()
+        if 1 < n_clusters < len(device_features):
+            labels = KMeans(
+                n_clusters=n_clusters, n_init=10, random_state=0
+            ).fit_predict(StandardScaler().fit_transform(device_features))
+            clusters = df["device_id"].map(
+                pd.Series(labels, index=device_features.index)
+            )
+        else:
+            clusters = pd.Series(0, index=df.index)
 
-        isolation_forest = IsolationForest(contamination=0.37)
-        isolation_forest.fit(df.drop(columns=columns_to_ignore))
-
-        df["anomaly_value"] = isolation_forest.predict(
-            df.drop(columns=columns_to_ignore)
+        cluster_rows = list(clusters.groupby(clusters).indices.values())
+        predictions = Parallel(n_jobs=n_jobs)(
+            delayed(FaultDetectionUtils._fit_predict_isolation_forest)(
+                features.values[rows]
+            )
+            for rows in cluster_rows
         )
 
+        anomaly_value = np.ones(len(df), dtype=int)
+        for rows, prediction in zip(cluster_rows, predictions):
+            anomaly_value[rows] = prediction
+        df["anomaly_value"] = anomaly_value
+
         return df
 
     @staticmethod
     def process_faulty_devices_percentage(df: pd.DataFrame):
         """Process faulty devices dataframe and save to MongoDB"""
 
-        anomaly_percentage = pd.DataFrame(
-            (
-                df[df["anomaly_value"] == -1].groupby("device_id").size()
-                / df.groupby("device_id").size()
-            )
-            * 100,
-            columns=["anomaly_percentage"],
-        )
+        anomaly_percentage = (
+            (df["anomaly_value"] == -1).groupby(df["device_id"]).mean() * 100
+        ).to_frame("anomaly_percentage")
 
         return anomaly_percentage[
             anomaly_percentage["anomaly_percentage"] > 45
@@ -723,18 +905,14 @@ class FaultDetectionUtils(BaseMlUtils):
 
     @staticmethod
     def process_faulty_devices_fault_sequence(df: pd.DataFrame):
-        df["group"] = (df["anomaly_value"] != df["anomaly_value"].shift(1)).cumsum()
-        df["anomaly_sequence_length"] = (
-            df[df["anomaly_value"] == -1].groupby(["device_id", "group"]).cumcount() + 1
+        device_max_anomaly_sequence = FaultDetectionUtils.max_run_length(
+            df["anomaly_value"] == -1, df["device_id"]
         )
-        df["anomaly_sequence_length"].fillna(0, inplace=True)
-        device_max_anomaly_sequence = (
-            df.groupby("device_id")["anomaly_sequence_length"].max().reset_index()
+        faulty_devices_df = (
+            device_max_anomaly_sequence[device_max_anomaly_sequence >= 80]
+            .rename_axis("device_id")
+            .reset_index(name="fault_count")
         )
-        faulty_devices_df = device_max_anomaly_sequence[
-            device_max_anomaly_sequence["anomaly_sequence_length"] >= 80
-        ]
-        faulty_devices_df.columns = ["device_id", "fault_count"]
 
         return faulty_devices_df
 
@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+import pytest
+
+from airqo_etl_utils.airqo_api import AirQoApi
+from airqo_etl_utils.config import configuration
+
+
+@pytest.fixture(autouse=True)
+def base_url(monkeypatch):
+    monkeypatch.setattr(
+        configuration, "AIRQO_BASE_URL_V2", "https://api.airqo.net/api/v2/"
+    )
+
+
+@patch.object(AirQoApi, "_AirQoApi__request")
+def test_get_nearest_weather_stations_bulk(mock_request):
+    mock_request.return_value = {
+        "weather_stations": [
+            {"latitude": 0.3, "longitude": 32.5, "weather_stations": [{"code": "TA1"}]},
+            {"latitude": 1.0, "longitude": 33.0, "weather_stations": [{"code": "TA2"}]},
+        ]
+    }
+    coordinates = [
+        {"site_id": "site_1", "latitude": 0.3, "longitude": 32.5},
+        {"site_id": "site_2", "latitude": None, "longitude": 32.0},
+        {"site_id": "site_3", "latitude": 1.0, "longitude": 33.0},
+    ]
+
+    nearest_weather_stations = AirQoApi().get_nearest_weather_stations_bulk(coordinates)
+
+    # the site without coordinates is not sent and the results stay aligned
+    assert mock_request.call_args.kwargs["body"] == {
+        "coordinates": [
+            {"latitude": 0.3, "longitude": 32.5},
+            {"latitude": 1.0, "longitude": 33.0},
+        ]
+    }
+    assert nearest_weather_stations == [[{"code": "TA1"}], [], [{"code": "TA2"}]]
+
+
+@patch.object(AirQoApi, "_AirQoApi__request")
+def test_get_nearest_weather_stations_bulk_without_coordinates(mock_request):
+    assert AirQoApi().get_nearest_weather_stations_bulk(
+        [{"latitude": None, "longitude": None}]
+    ) == [[]]
+    mock_request.assert_not_called()
+
+    mock_request.return_value = None
+    assert AirQoApi().get_nearest_weather_stations_bulk(
+        [{"latitude": 0.3, "longitude": 32.5}]
+    ) == [[]]
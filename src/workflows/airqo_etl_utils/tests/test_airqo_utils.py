@@ -10,7 +10,9 @@ import pytest
 import airqo_etl_utils.tests.conftest as ct
 from airqo_etl_utils.airqo_utils import AirQoDataUtils
 from airqo_etl_utils.config import configuration
+from airqo_etl_utils.constants import DataSource, DeviceCategory, Frequency
 from airqo_etl_utils.date import date_to_str
+from airqo_etl_utils.utils import Utils
 
 
 class TestAirQoDataUtils(unittest.TestCase):
@@ -244,6 +246,131 @@ class TestAirQoDataUtils(unittest.TestCase):
 
         pd.testing.assert_frame_equal(result, expected_dataframe)
 
+    @patch("airqo_etl_utils.airqo_utils.ThingspeakApi")
+    @patch("airqo_etl_utils.airqo_utils.AirQoApi")
+    def test_extract_devices_data(self, MockAirQoApi, MockThingspeakApi):
+        mock_airqo_api = MockAirQoApi.return_value
+        mock_airqo_api.get_devices.return_value = [
+            {
+                "device_number": device_number,
+                "device_id": f"aq_{device_number}",
+                "site_id": f"site_{device_number}",
+                "latitude": 0.3,
+                "longitude": 32.5,
+                "readKey": f"encrypted_{device_number}",
+            }
+            for device_number in [1, 2, 3]
+        ]
+        mock_airqo_api.get_thingspeak_read_keys.return_value = iter(
+            [(1, "key_1"), (2, "key_2"), (3, None)]
+        )
+
+        def query_data(device_number, start_date_time, end_date_time, read_key):
+            return pd.DataFrame(
+                {
+                    "created_at": [start_date_time],
+                    "field1": [10.0 * device_number],
+                    "field2": [20.0 * device_number],
+                    "field3": [11.0 * device_number],
+                    "field4": [21.0 * device_number],
+                    "field7": [4.0],
+                    "field8": ["0.3,32.5,1200,0,5,1,25,60,24,70,1000"],
+                }
+            )
+
+        MockThingspeakApi.return_value.query_data.side_effect = query_data
+
+        data = AirQoDataUtils.extract_devices_data(
+            start_date_time="2024-07-10T00:00:00Z",
+            end_date_time="2024-07-10T23:59:59Z",
+            device_category=DeviceCategory.LOW_COST,
+            remove_outliers=False,
+        )
+
+        dates = Utils.query_dates_array(
+            data_source=DataSource.THINGSPEAK,
+            start_date_time="2024-07-10T00:00:00Z",
+            end_date_time="2024-07-10T23:59:59Z",
+        )
+        self.assertEqual(len(data), 2 * len(dates))
+        self.assertEqual(sorted(data["device_number"].unique().tolist()), [1, 2])
+        self.assertEqual(
+            MockThingspeakApi.return_value.query_data.call_count, 2 * len(dates)
+        )
+        device_2 = data[data["device_number"] == 2]
+        self.assertTrue((device_2["device_id"] == "aq_2").all())
+        self.assertTrue((device_2["s1_pm2_5"] == 20.0).all())
+
+    def test_aggregate_low_cost_sensors_data(self):
+        data = pd.DataFrame(
+            {
+                "device_number": [1, 1, 1, 2, 2],
+                "device_id": ["aq_1", "aq_1", "aq_1", "aq_2", "aq_2"],
+                "site_id": ["site_1", "site_1", "site_1", None, None],
+                "timestamp": [
+                    "2024-07-10T00:10:00Z",
+                    "2024-07-10T00:50:00Z",
+                    "2024-07-10T01:20:00Z",
+                    "2024-07-10T00:05:00Z",
+                    "2024-07-10T00:35:00Z",
+                ],
+                "s1_pm2_5": [10.0, 20.0, 30.0, 5.0, np.nan],
+                "battery": [4.0, 4.0, 4.0, 3.0, 3.0],
+            }
+        )
+
+        result = AirQoDataUtils.aggregate_low_cost_sensors_data(
+            data, include_counts=True
+        )
+
+        self.assertEqual(len(result), 3)
+        first_hour = result[
+            (result["device_number"] == 1)
+            & (result["timestamp"] == pd.Timestamp("2024-07-10T00:00:00Z"))
+        ].iloc[0]
+        self.assertEqual(first_hour["site_id"], "site_1")
+        self.assertEqual(first_hour["s1_pm2_5"], 15.0)
+        self.assertEqual(first_hour["s1_pm2_5_count"], 2)
+        device_2 = result[result["device_number"] == 2].iloc[0]
+        self.assertEqual(device_2["device_id"], "aq_2")
+        self.assertEqual(device_2["s1_pm2_5"], 5.0)
+        self.assertEqual(device_2["s1_pm2_5_count"], 1)
+        self.assertEqual(device_2["battery_count"], 2)
+
+    def test_process_data_for_api_in_batches(self):
+        devices = [
+            {"device_number": 1, "device_id": "aq_1", "_id": "mongo_1"},
+            {"device_number": 2, "device_id": "aq_2", "_id": "mongo_2"},
+        ]
+        data = pd.DataFrame(
+            {
+                "device_number": [1, 2, 3],
+                "device_id": ["aq_1", "aq_2", "aq_3"],
+                "site_id": ["site_1", None, "site_3"],
+                "timestamp": ["2024-07-10T00:00:00Z"] * 3,
+                "pm2_5": [10.0, np.nan, 30.0],
+                "pm2_5_calibrated_value": [12.0, 22.0, 32.0],
+            }
+        )
+
+        batches = list(
+            AirQoDataUtils.process_data_for_api_in_batches(
+                data, frequency=Frequency.HOURLY, batch_size=1, devices=devices
+            )
+        )
+
+        self.assertEqual([len(batch) for batch in batches], [1, 1])
+        first, second = batches[0][0], batches[1][0]
+        self.assertEqual(first["device"], "aq_1")
+        self.assertEqual(first["device_id"], "mongo_1")
+        self.assertEqual(first["site_id"], "site_1")
+        self.assertEqual(first["time"], "2024-07-10T00:00:00Z")
+        self.assertEqual(first["pm2_5"], {"value": 10.0, "calibratedValue": 12.0})
+        self.assertEqual(first["frequency"], str(Frequency.HOURLY))
+        self.assertIsNone(first["battery"]["value"])
+        self.assertNotIn("site_id", second)
+        self.assertIsNone(second["pm2_5"]["value"])
+
 
 class TestFaultDetector(ct.FaultDetectionFixtures):
     def test_input_output_type(self, df_valid):
@@ -1,7 +1,9 @@
 from unittest import mock
 
+import numpy as np
 import pandas as pd
 import pytest
+from google.cloud import bigquery
 
 from airqo_etl_utils.bigquery_api import BigQueryApi
 
@@ -121,3 +123,107 @@ def test_fetch_raw_readings_empty(mock_bigquery_client):
     with pytest.raises(Exception) as e:
         df = api.fetch_raw_readings()
         assert "No data found" in str(e.value)
+
+
+def test_compose_merge_query():
+    query = BigQueryApi.compose_merge_query(
+        table="project.dataset.sites",
+        staging_table="project.dataset.sites_staging",
+        columns=["id", "name"],
+        key_columns=["id"],
+    )
+
+    assert "MERGE `project.dataset.sites` target" in query
+    assert "USING `project.dataset.sites_staging` source" in query
+    assert (
+        "LOWER(CAST(target.`id` AS STRING)) IS NOT DISTINCT FROM "
+        "LOWER(CAST(source.`id` AS STRING))" in query
+    )
+    assert "UPDATE SET `name` = source.`name`" in query
+    assert "INSERT (`id`, `name`) VALUES (source.`id`, source.`name`)" in query
+
+
+@mock.patch("airqo_etl_utils.bigquery_api.bigquery.Client")
+def test_merge_data_stages_and_drops_incoming_rows(MockClient):
+    api = BigQueryApi()
+    api.client.get_table.return_value.schema = [
+        bigquery.SchemaField("id", "STRING"),
+        bigquery.SchemaField("name", "STRING"),
+        bigquery.SchemaField("created_at", "TIMESTAMP"),
+    ]
+    api.client.create_table.side_effect = lambda table: table
+    data = pd.DataFrame({"id": ["A", "a", "B"], "name": ["one", "two", "three"]})
+
+    api.merge_data(data, table="project.dataset.sites", key_columns=["id"])
+
+    staged, staging_table = api.client.load_table_from_dataframe.call_args.args
+    assert staged["name"].tolist() == ["one", "three"]
+    assert [field.name for field in staging_table.schema] == ["id", "name"]
+    query = api.client.query.call_args.kwargs["query"]
+    assert f"USING `{staging_table.project}.{staging_table.dataset_id}." in query
+    api.client.delete_table.assert_called_once_with(staging_table, not_found_ok=True)
+
+
+@mock.patch("airqo_etl_utils.bigquery_api.bigquery.Client")
+def test_merge_data_deduplicates_null_keys(MockClient):
+    api = BigQueryApi()
+    api.client.get_table.return_value.schema = [
+        bigquery.SchemaField("device_id", "STRING"),
+        bigquery.SchemaField("device_number", "INTEGER"),
+        bigquery.SchemaField("name", "STRING"),
+    ]
+    api.client.create_table.side_effect = lambda table: table
+    data = pd.DataFrame(
+        {
+            "device_id": ["aq_1", "AQ_1", "aq_2"],
+            "device_number": pd.Series([None, np.nan, 2], dtype=object),
+            "name": ["one", "two", "three"],
+        }
+    )
+
+    api.merge_data(
+        data,
+        table="project.dataset.devices",
+        key_columns=["device_id", "device_number"],
+    )
+
+    staged, _ = api.client.load_table_from_dataframe.call_args.args
+    assert staged["name"].tolist() == ["one", "three"]
+
+
+@mock.patch("airqo_etl_utils.bigquery_api.bigquery.Client")
+def test_schema_registry_loads_each_schema_once(MockClient):
+    BigQueryApi._schemas.clear()
+    BigQueryApi._columns.clear()
+    BigQueryApi._coercion_plans.clear()
+    api = BigQueryApi()
+    table = api.hourly_measurements_table
+    loads = BigQueryApi.get_schema_stats()["schema_loads"]
+
+    with mock.patch(
+        "airqo_etl_utils.bigquery_api.Utils.load_schema",
+        return_value=[
+            {"name": "timestamp", "type": "TIMESTAMP"},
+            {"name": "pm2_5", "type": "FLOAT"},
+            {"name": "device_number", "type": "INTEGER"},
+        ],
+    ) as load_schema:
+        plan = api.get_coercion_plan(table)
+        plan["floats"].append("mutated")
+        plan["integers"] = []
+        plan = api.get_coercion_plan(table)
+        columns = api.get_columns(table)
+        columns.append("mutated")
+
+        assert load_schema.call_count == 1
+        assert plan["floats"] == ["pm2_5"]
+        assert plan["integers"] == ["device_number"]
+        assert plan["timestamps"] == ["timestamp"]
+        assert "mutated" not in api.get_columns(table)
+
+    stats = BigQueryApi.get_schema_stats()
+    assert stats["schema_loads"] == loads + 1
+    assert stats["coercion_plan_hits"] >= 1
+    BigQueryApi._schemas.clear()
+    BigQueryApi._columns.clear()
+    BigQueryApi._coercion_plans.clear()
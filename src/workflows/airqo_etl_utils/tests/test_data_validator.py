@@ -0,0 +1,87 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from airqo_etl_utils.constants import ColumnDataType
+from airqo_etl_utils.data_validator import DataValidationUtils
+
+
+def get_columns(table="all", column_type=None):
+    columns = {
+        ColumnDataType.FLOAT: ["pm2_5", "s1_pm10", "humidity", "latitude"],
+        ColumnDataType.INTEGER: ["device_number"],
+        ColumnDataType.TIMESTAMP: ["timestamp"],
+    }
+    return columns[column_type[0]]
+
+
+@pytest.fixture
+def mock_bigquery_api():
+    DataValidationUtils._validation_plans.clear()
+    with patch("airqo_etl_utils.data_validator.BigQueryApi") as MockBigQueryApi:
+        MockBigQueryApi.return_value.get_columns.side_effect = get_columns
+        yield MockBigQueryApi
+    DataValidationUtils._validation_plans.clear()
+
+
+def test_remove_outliers(mock_bigquery_api):
+    data = pd.DataFrame(
+        {
+            "pm2_5": ["0.5", "12", "1001", None],
+            "s1_pm10": [5.0, 2000.0, 10.0, 1000.0],
+            "humidity": [50.0, 99.0, 120.0, np.nan],
+            "latitude": [0.3, 0.3, 0.3, 0.3],
+            "device_number": ["1", "2", "3", "4"],
+            "timestamp": ["2024-07-10T00:00:00Z"] * 4,
+        }
+    )
+
+    result = DataValidationUtils.remove_outliers(data)
+
+    assert result["pm2_5"].isna().tolist() == [True, False, True, True]
+    assert result["s1_pm10"].isna().tolist() == [False, True, False, False]
+    assert result["humidity"].isna().tolist() == [False, False, True, True]
+    assert result["latitude"].notna().all()
+    assert result["device_number"].tolist() == [1, 2, 3, 4]
+    assert pd.api.types.is_datetime64_any_dtype(result["timestamp"])
+    assert result.attrs["outliers"] == {"pm2_5": 2, "s1_pm10": 1, "humidity": 1}
+
+
+def test_validation_plan_is_cached(mock_bigquery_api):
+    data = pd.DataFrame({"pm2_5": [10.0], "timestamp": ["2024-07-10T00:00:00Z"]})
+
+    DataValidationUtils.remove_outliers(data.copy())
+    DataValidationUtils.remove_outliers(data.copy())
+
+    assert mock_bigquery_api.call_count == 1
+    assert DataValidationUtils.get_validation_plan()["ranges"] == {
+        "pm2_5": (1, 1000),
+        "s1_pm10": (1, 1000),
+        "humidity": (0, 99),
+    }
+
+
+def test_format_data_types_with_nullable_columns():
+    data = pd.DataFrame(
+        {
+            "pm2_5": pd.array([10.5, None], dtype="Float64"),
+            "device_number": pd.array([1, None], dtype="Int64"),
+            "site_number": np.array([3, 4], dtype=np.int32),
+            "timestamp": pd.to_datetime(["2024-07-10T00:00:00Z"] * 2),
+        }
+    )
+
+    result = DataValidationUtils.format_data_types(
+        data,
+        floats=["pm2_5"],
+        integers=["device_number", "site_number"],
+        timestamps=["timestamp"],
+    )
+
+    assert result["pm2_5"].dtype == np.float64
+    assert result["pm2_5"].isna().tolist() == [False, True]
+    assert result["device_number"].tolist() == [1, -1]
+    assert result["device_number"].dtype == np.int64
+    assert result["site_number"].dtype == np.int64
@@ -0,0 +1,162 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from airqo_etl_utils.message_broker_utils import MessageBrokerUtils
+
+
+@pytest.fixture
+def data():
+    return pd.DataFrame(
+        {
+            "device_id": ["aq_1", "aq_2", None],
+            "pm2_5": [10.5, np.nan, 30.0],
+            "timestamp": ["2024-07-10T00:00:00Z"] * 3,
+        }
+    )
+
+
+def test_encode_records_serializes_each_row_once(data):
+    broker = MessageBrokerUtils()
+    records = list(broker._encode_records(data, column_key="device_id"))
+
+    assert [key for key, _ in records] == ["aq_1", "aq_2", None]
+    assert json.loads(records[1][1]) == {
+        "device_id": "aq_2",
+        "pm2_5": None,
+        "timestamp": "2024-07-10T00:00:00Z",
+    }
+
+
+def test_generate_chunks_respects_max_message_size():
+    broker = MessageBrokerUtils()
+    broker.MAX_MESSAGE_SIZE = 50
+    records = [json.dumps({"value": i}).encode("utf-8") for i in range(10)]
+
+    chunks = list(broker._generate_chunks(records))
+
+    assert sum(len(chunk) for chunk in chunks) == 10
+    for chunk in chunks:
+        message = b'{"data":[' + b",".join(chunk) + b"]}"
+        assert len(message) <= broker.MAX_MESSAGE_SIZE
+        assert len(json.loads(message)["data"]) == len(chunk)
+
+
+@patch("airqo_etl_utils.message_broker_utils.Producer")
+def test_publish_to_topic_with_key(MockProducer, data):
+    producer = MockProducer.return_value
+    broker = MessageBrokerUtils()
+
+    metrics = broker.publish_to_topic("topic", data, column_key="device_id")
+
+    assert producer.produce.call_count == 2
+    assert [call.kwargs["key"] for call in producer.produce.call_args_list] == [
+        "aq_1",
+        "aq_2",
+    ]
+    producer.poll.assert_called_with(0)
+    producer.flush.assert_called_once()
+    assert metrics["messages"] == 2
+    assert metrics["records"] == 2
+    assert metrics["bytes"] > 0
+
+
+@patch("airqo_etl_utils.message_broker_utils.Producer")
+def test_publish_to_topic_in_chunks(MockProducer, data):
+    producer = MockProducer.return_value
+    broker = MessageBrokerUtils()
+
+    metrics = broker.publish_to_topic("topic", data)
+
+    assert producer.produce.call_count == 1
+    message = json.loads(producer.produce.call_args.kwargs["value"])
+    assert len(message["data"]) == 3
+    assert metrics["records"] == 3
+    assert metrics["messages"] == 1
+
+
+def mock_message(value, key=None):
+    message = MagicMock()
+    message.error.return_value = None
+    message.value.return_value = value
+    message.key.return_value = key
+    return message
+
+
+def test_decode_batch_expands_chunked_payloads():
+    values = [
+        b'{"device_id": "aq_1", "pm2_5": 10.5}',
+        b'{"data": [{"device_id": "aq_2"}, {"device_id": "aq_3"}]}',
+        b"not json",
+    ]
+
+    data = MessageBrokerUtils._decode_batch(values)
+
+    assert data["device_id"].tolist() == ["aq_1", "aq_2", "aq_3"]
+
+
+@patch("airqo_etl_utils.message_broker_utils.Consumer")
+def test_consume_batches_commits_after_sink(MockConsumer):
+    consumer = MockConsumer.return_value
+    consumer.consume.side_effect = [
+        [
+            mock_message(b'{"device_id": "aq_1"}'),
+            mock_message(b'{"device_id": "aq_2"}'),
+        ],
+        [mock_message(b'{"device_id": "aq_3"}')],
+        [],
+    ]
+    consumer.position.return_value = [MagicMock(offset=3)]
+    consumer.get_watermark_offsets.return_value = (0, 5)
+    batches = []
+
+    metrics = MessageBrokerUtils().consume_batches(
+        "topic", "group", sink=batches.append, batch_size=2
+    )
+
+    assert [batch["device_id"].tolist() for batch in batches] == [
+        ["aq_1", "aq_2"],
+        ["aq_3"],
+    ]
+    assert consumer.commit.call_count == 2
+    assert metrics["batches"] == 2
+    assert metrics["records"] == 3
+    assert metrics["lag"] == 2
+    consumer.close.assert_called_once()
+
+
+@patch("airqo_etl_utils.message_broker_utils.Consumer")
+def test_consume_batches_does_not_commit_failed_batch(MockConsumer):
+    consumer = MockConsumer.return_value
+    consumer.consume.return_value = [mock_message(b'{"device_id": "aq_1"}')]
+
+    def sink(data):
+        raise ValueError("sink failed")
+
+    with pytest.raises(ValueError):
+        MessageBrokerUtils().consume_batches("topic", "group", sink=sink)
+
+    consumer.commit.assert_not_called()
+    consumer.close.assert_called_once()
+
+
+@patch("airqo_etl_utils.message_broker_utils.Consumer")
+def test_consume_batches_skips_messages_without_keys(MockConsumer):
+    consumer = MockConsumer.return_value
+    consumer.consume.side_effect = [
+        [
+            mock_message(b'{"device_id": "aq_1"}', key=b"aq_1"),
+            mock_message(b'{"device_id": "aq_2"}'),
+        ],
+        [],
+    ]
+    batches = []
+
+    MessageBrokerUtils().consume_batches(
+        "topic", "group", sink=batches.append, keyed_only=True
+    )
+
+    assert [batch["device_id"].tolist() for batch in batches] == [["aq_1"]]
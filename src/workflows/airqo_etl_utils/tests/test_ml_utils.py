@@ -1,7 +1,15 @@
+import joblib
+import numpy as np
 import pandas as pd
 import pytest
 
 from airqo_etl_utils.ml_utils import BaseMlUtils as FUtils
+from airqo_etl_utils.ml_utils import (
+    FaultDetectionUtils,
+    ForecastUtils,
+    GCSUtils,
+    ModelRegistry,
+)
 from airqo_etl_utils.tests.conftest import ForecastFixtures
 
 
@@ -157,3 +165,210 @@ class TestsForecasts(ForecastFixtures):
             FUtils.save_forecasts_to_mongo(sample_dataframe_db, frequency)
             mock_collection = getattr(mock_db, collection_name)
             assert mock_collection.update_one.call_count == 0
+
+
+class TestModelRegistry:
+    @pytest.fixture
+    def local_registry(self, tmp_path, monkeypatch):
+        from airqo_etl_utils.config import configuration
+
+        monkeypatch.setattr(configuration, "MODEL_REGISTRY_BACKEND", "local")
+        monkeypatch.setattr(configuration, "MODEL_CACHE_DIR", str(tmp_path / "cache"))
+        monkeypatch.setattr(configuration, "MODEL_CACHE_SIZE", 1)
+        ModelRegistry.clear()
+        bucket = tmp_path / "bucket"
+        bucket.mkdir()
+        yield bucket
+        ModelRegistry.clear()
+
+    def test_model_is_cached_until_it_changes(self, local_registry, monkeypatch):
+        model_path = local_registry / "hourly_forecast_model.pkl"
+        joblib.dump({"version": 1}, model_path)
+
+        loads = []
+        load = joblib.load
+        monkeypatch.setattr(
+            "airqo_etl_utils.ml_utils.joblib.load",
+            lambda path: loads.append(path) or load(path),
+        )
+
+        first = GCSUtils.get_trained_model_from_gcs(
+            "project", str(local_registry), "hourly_forecast_model.pkl"
+        )
+        second = GCSUtils.get_trained_model_from_gcs(
+            "project", str(local_registry), "hourly_forecast_model.pkl"
+        )
+        assert first == {"version": 1}
+        assert second is first
+        assert len(loads) == 1
+
+        joblib.dump({"version": 2, "retrained": True}, model_path)
+        third = GCSUtils.get_trained_model_from_gcs(
+            "project", str(local_registry), "hourly_forecast_model.pkl"
+        )
+        assert third == {"version": 2, "retrained": True}
+        assert len(loads) == 2
+
+    def test_lru_evicts_least_recently_used(self, local_registry):
+        joblib.dump("a", local_registry / "a.pkl")
+        joblib.dump("b", local_registry / "b.pkl")
+
+        ModelRegistry.get_model("project", str(local_registry), "a.pkl")
+        ModelRegistry.get_model("project", str(local_registry), "b.pkl")
+
+        assert [key[1] for key in ModelRegistry._models] == ["b.pkl"]
+
+
+class TestGenerateForecasts:
+    class RecordingModel:
+        def __init__(self):
+            self.inputs = []
+
+        def predict(self, features):
+            self.inputs.append(features.copy())
+            return np.full(len(features), 10.0 * len(self.inputs))
+
+    def test_hourly_forecasts_are_batched_across_devices(self, monkeypatch):
+        from airqo_etl_utils.config import configuration
+
+        monkeypatch.setattr(configuration, "HOURLY_FORECAST_HORIZON", "3")
+        model = self.RecordingModel()
+        monkeypatch.setattr(GCSUtils, "get_trained_model_from_gcs", lambda *args: model)
+
+        data = pd.concat(
+            [
+                pd.DataFrame(
+                    {
+                        "device_id": device,
+                        "site_id": f"site_{device}",
+                        "timestamp": pd.date_range(
+                            "2024-01-01", periods=30, freq="H", tz="UTC"
+                        ),
+                        "pm2_5": np.arange(30, dtype=float) + offset,
+                        "latitude": 0.3,
+                        "longitude": 32.5,
+                    }
+                )
+                for device, offset in [("aq_1", 0), ("aq_2", 100)]
+            ],
+            ignore_index=True,
+        )
+        data = FUtils.get_lag_and_roll_features(data, "pm2_5", "hourly")
+        data = FUtils.get_cyclic_features(data, "hourly")
+
+        forecasts = ForecastUtils.generate_forecasts(
+            data, "project", "bucket", "hourly"
+        )
+
+        assert len(model.inputs) == 3
+        assert all(features.shape[0] == 2 for features in model.inputs)
+        assert forecasts["device_id"].tolist() == ["aq_1"] * 3 + ["aq_2"] * 3
+        assert forecasts["pm2_5"].tolist() == [10.0, 20.0, 30.0] * 2
+        assert forecasts["timestamp"].tolist() == 2 * [
+            pd.Timestamp("2024-01-02T06:00:00Z"),
+            pd.Timestamp("2024-01-02T07:00:00Z"),
+            pd.Timestamp("2024-01-02T08:00:00Z"),
+        ]
+
+        columns = [
+            col
+            for col in data.columns
+            if col
+            not in [
+                "device_id",
+                "site_id",
+                "pm2_5",
+                "timestamp",
+                "latitude",
+                "longitude",
+            ]
+        ]
+        lag_1 = columns.index("pm2_5_last_1_hour")
+        mean_3 = columns.index("pm2_5_mean_3_hour")
+        assert model.inputs[0][:, lag_1].tolist() == [29.0, 129.0]
+        assert model.inputs[1][:, lag_1].tolist() == [10.0, 10.0]
+        assert model.inputs[0][:, mean_3].tolist() == [28.0, 128.0]
+        assert model.inputs[2][:, mean_3].tolist() == [
+            (29.0 + 10.0 + 20.0) / 3,
+            (129.0 + 10.0 + 20.0) / 3,
+        ]
+
+    def test_daily_forecasts_advance_one_day_per_step(self, monkeypatch):
+        from airqo_etl_utils.config import configuration
+
+        monkeypatch.setattr(configuration, "DAILY_FORECAST_HORIZON", "3")
+        model = self.RecordingModel()
+        monkeypatch.setattr(GCSUtils, "get_trained_model_from_gcs", lambda *args: model)
+
+        data = pd.DataFrame(
+            {
+                "device_id": "aq_1",
+                "site_id": "site_aq_1",
+                "timestamp": pd.date_range("2024-01-01", periods=10, freq="D"),
+                "pm2_5": np.arange(10, dtype=float),
+                "latitude": 0.3,
+                "longitude": 32.5,
+            }
+        )
+        data = FUtils.get_lag_and_roll_features(data, "pm2_5", "daily")
+        data = FUtils.get_cyclic_features(data, "daily")
+
+        forecasts = ForecastUtils.generate_forecasts(data, "project", "bucket", "daily")
+
+        assert forecasts["timestamp"].tolist() == [
+            pd.Timestamp("2024-01-11"),
+            pd.Timestamp("2024-01-12"),
+            pd.Timestamp("2024-01-13"),
+        ]
+        assert forecasts["pm2_5"].tolist() == [10.0, 20.0, 30.0]
+
+
+class TestFaultDetection:
+    @pytest.fixture
+    def raw_readings(self):
+        s1_pm2_5 = np.arange(100, dtype=float)
+        noisy = np.where(np.arange(100) % 2 == 0, 5.0, 50.0)
+        missing = s1_pm2_5.copy()
+        missing[10:75] = np.nan
+        return pd.DataFrame(
+            {
+                "device_id": np.repeat(["aq_1", "aq_2", "aq_3"], 100),
+                "s1_pm2_5": np.concatenate([s1_pm2_5, s1_pm2_5, missing]),
+                "s2_pm2_5": np.concatenate([s1_pm2_5 + 1, noisy, s1_pm2_5]),
+            }
+        )
+
+    def test_flag_rule_based_faults(self, raw_readings):
+        result = FaultDetectionUtils.flag_rule_based_faults(raw_readings)
+
+        assert result["device_id"].tolist() == ["aq_2", "aq_3"]
+        assert result["correlation_fault"].tolist() == [1, 0]
+        assert result["missing_data_fault"].tolist() == [0, 1]
+        assert result["correlation_value"].iloc[1] == pytest.approx(1.0)
+
+    def test_max_run_length_restarts_per_device(self):
+        flags = pd.Series([True, True, False, True, True, True, False])
+        devices = pd.Series(["aq_1", "aq_1", "aq_1", "aq_1", "aq_2", "aq_2", "aq_2"])
+
+        result = FaultDetectionUtils.max_run_length(flags, devices)
+
+        assert result.to_dict() == {"aq_1": 2, "aq_2": 2}
+
+    def test_flag_pattern_based_faults_per_cluster(self):
+        rng = np.random.default_rng(0)
+        data = pd.DataFrame(
+            {
+                "device_id": np.repeat([f"aq_{i}" for i in range(6)], 50),
+                "timestamp": "2024-01-01T00:00:00Z",
+                "pm2_5": np.concatenate(
+                    [rng.normal(mean, 1, 50) for mean in [10, 11, 12, 80, 81, 82]]
+                ),
+            }
+        )
+
+        result = FaultDetectionUtils.flag_pattern_based_faults(
+            data, n_clusters=2, n_jobs=2
+        )
+
+        assert set(result["anomaly_value"].unique()) == {-1, 1}
+        assert len(result) == 300
@@ -1,7 +1,11 @@
 import json
+import threading
+import time
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .config import configuration
 import logging
@@ -12,6 +16,42 @@ logger = logging.getLogger(__name__)
 class ThingspeakApi:
     def __init__(self):
         self.THINGSPEAK_CHANNEL_URL = configuration.THINGSPEAK_CHANNEL_URL
+        self.MAX_REQUESTS_PER_SECOND = configuration.THINGSPEAK_MAX_REQUESTS_PER_SECOND
+
+        # A single pooled session is shared by all the threads querying thingspeak so that connections are reused.
+        retry_strategy = Retry(
+            total=5,
+            backoff_factor=2,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_connections=configuration.THINGSPEAK_MAX_WORKERS,
+            pool_maxsize=configuration.THINGSPEAK_MAX_WORKERS,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._rate_limit_lock = threading.Lock()
+        self._next_request_time = 0.0
+
+    def _wait_for_rate_limit(self) -> None:
+        """
+        Blocks the calling thread until the next request slot is available so that the thingspeak host is never queried faster than `THINGSPEAK_MAX_REQUESTS_PER_SECOND`.
+        """
+        if self.MAX_REQUESTS_PER_SECOND <= 0:
+            return
+
+        interval = 1.0 / self.MAX_REQUESTS_PER_SECOND
+        with self._rate_limit_lock:
+            now = time.monotonic()
+            wait_time = self._next_request_time - now
+            self._next_request_time = max(now, self._next_request_time) + interval
+
+        if wait_time > 0:
+            time.sleep(wait_time)
 
     def query_data(
         self,
@@ -26,8 +66,9 @@ class ThingspeakApi:
             url = f"{self.THINGSPEAK_CHANNEL_URL}{device_number}/feeds.json?start={start_date_time}&end={end_date_time}&api_key={read_key}"
             print(f"{url}")
 
+            self._wait_for_rate_limit()
             response = json.loads(
-                requests.get(url, timeout=100.0).content.decode("utf-8")
+                self.session.get(url, timeout=100.0).content.decode("utf-8")
             )
 
             if (response != -1) and ("feeds" in response):
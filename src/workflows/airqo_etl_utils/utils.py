@@ -2,6 +2,7 @@ import json
 import os
 from datetime import datetime, timedelta, timezone
 
+import numpy as np
 import pandas as pd
 import requests
 from requests import Response
@@ -105,6 +106,52 @@ class Utils:
                 data.loc[:, column] = None
         return data
 
+    @staticmethod
+    def aggregate_by_frequency(
+        data: pd.DataFrame,
+        group_by: List[str],
+        frequency: str = "1H",
+        sum_columns: List[str] = None,
+        include_counts: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Averages numeric columns per group and time bucket in a single groupby over (group_by..., floor(timestamp, frequency)).
+
+        Args:
+            data(pandas.DataFrame): Data with a `timestamp` column and the `group_by` columns.
+            group_by(list): Identifier columns kept as group keys e.g device_number, device_id, site_id.
+            frequency(str): Pandas offset alias of the time bucket e.g "1H" or "1D". Defaults to "1H".
+            sum_columns(list, optional): Numeric columns that are summed instead of averaged e.g precipitation.
+            include_counts(bool): If True, adds a `<column>_count` column with the number of non-null values used for each aggregate.
+
+        Returns:
+            A pandas DataFrame with one row per group and time bucket that has data.
+        """
+        sum_columns = [] if sum_columns is None else sum_columns
+        data = data.dropna(subset=["timestamp"]).copy()
+        if data.empty:
+            return data
+
+        data["timestamp"] = pd.to_datetime(data["timestamp"]).dt.floor(frequency)
+        keys = [*group_by, "timestamp"]
+        numeric_cols = [
+            col
+            for col in data.select_dtypes(include=[np.number]).columns
+            if col not in keys
+        ]
+
+        aggregations = {
+            col: "sum" if col in sum_columns else "mean" for col in numeric_cols
+        }
+        grouped = data.groupby(keys, dropna=False, sort=True)
+        aggregated_data = grouped.agg(aggregations)
+
+        if include_counts:
+            counts = grouped[numeric_cols].count().add_suffix("_count")
+            aggregated_data = aggregated_data.join(counts)
+
+        return aggregated_data.reset_index()
+
     @staticmethod
     def get_hourly_date_time_values():
         from airqo_etl_utils.date import date_to_str_hours
@@ -12,7 +12,6 @@ from .data_validator import DataValidationUtils
 from .openweather_api import OpenWeatherApi
 from .tahmo_api import TahmoApi
 from .utils import Utils
-import numpy as np
 
 
 class WeatherDataUtils:
@@ -32,13 +31,9 @@ class WeatherDataUtils:
     @staticmethod
     def get_nearest_weather_stations(records: list) -> list:
         data = []
-        airqo_api = AirQoApi()
+        nearest_weather_stations = AirQoApi().get_nearest_weather_stations_bulk(records)
 
-        for record in records:
-            weather_stations = airqo_api.get_nearest_weather_stations(
-                latitude=record.get("latitude"),
-                longitude=record.get("longitude"),
-            )
+        for record, weather_stations in zip(records, nearest_weather_stations):
             if len(weather_stations) > 0:
                 data.append(
                     {
@@ -52,13 +47,11 @@ class WeatherDataUtils:
     @staticmethod
     def get_weather_stations(meta_data: list) -> pd.DataFrame:
         data = []
-        airqo_api = AirQoApi()
+        nearest_weather_stations = AirQoApi().get_nearest_weather_stations_bulk(
+            meta_data
+        )
 
-        for record in meta_data:
-            weather_stations = airqo_api.get_nearest_weather_stations(
-                latitude=record.get("latitude"),
-                longitude=record.get("longitude"),
-            )
+        for record, weather_stations in zip(meta_data, nearest_weather_stations):
             for station in weather_stations:
                 station = dict(station)
                 data.append(
@@ -179,35 +172,12 @@ class WeatherDataUtils:
         if data.empty:
             return data
 
-        data = data.dropna(subset=["timestamp"])
-        data["timestamp"] = pd.to_datetime(data["timestamp"])
-        aggregated_data = pd.DataFrame()
-
-        station_groups = data.groupby("station_code")
-
-        for _, station_group in station_groups:
-            station_group.index = station_group["timestamp"]
-            station_group = station_group.sort_index(axis=0)
-
-            averaging_data = station_group.copy()
-            averaging_data.drop(columns=["precipitation"], inplace=True)
-            numeric_cols = averaging_data.select_dtypes(include=[np.number]).columns
-            averages = averaging_data.resample("H")[numeric_cols].mean()
-            averages.reset_index(drop=True, inplace=True)
-
-            summing_data = station_group.copy()[["precipitation"]]
-            sums = pd.DataFrame(summing_data.resample("H").sum())
-            sums["timestamp"] = sums.index
-            sums.reset_index(drop=True, inplace=True)
-
-            merged_data = pd.concat([averages, sums], axis=1)
-            merged_data["station_code"] = station_group.iloc[0]["station_code"]
-
-            aggregated_data = pd.concat(
-                [aggregated_data, merged_data], ignore_index=True, axis=0
-            )
-
-        return aggregated_data
+        return Utils.aggregate_by_frequency(
+            data,
+            group_by=["station_code"],
+            frequency="1H",
+            sum_columns=["precipitation"],
+        )
 
     @staticmethod
     def remove_duplicates(data: pd.DataFrame) -> pd.DataFrame:
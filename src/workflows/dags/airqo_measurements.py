@@ -78,14 +78,7 @@ def airqo_historical_hourly_measurements():
     def send_hourly_measurements_to_api(airqo_data: pd.DataFrame, **kwargs) -> None:
         send_to_api_param = kwargs.get("params", {}).get("send_to_api")
         if send_to_api_param:
-            from airqo_etl_utils.airqo_api import AirQoApi
-
-            data = AirQoDataUtils.process_data_for_api(
-                airqo_data, frequency=Frequency.HOURLY
-            )
-
-            airqo_api = AirQoApi()
-            airqo_api.save_events(measurements=data)
+            AirQoDataUtils.send_data_to_api(airqo_data, frequency=Frequency.HOURLY)
         else:
             print("The send to API parameter has been set to false")
 
@@ -354,15 +347,9 @@ def airqo_realtime_measurements():
 
     @task()
     def send_hourly_measurements_to_api(airqo_data: pd.DataFrame):
-        from airqo_etl_utils.airqo_api import AirQoApi
         from airqo_etl_utils.airqo_utils import AirQoDataUtils
 
-        data = AirQoDataUtils.process_data_for_api(
-            airqo_data, frequency=Frequency.HOURLY
-        )
-
-        airqo_api = AirQoApi()
-        airqo_api.save_events(measurements=data)
+        AirQoDataUtils.send_data_to_api(airqo_data, frequency=Frequency.HOURLY)
 
     @task()
     def send_hourly_measurements_to_message_broker(data: pd.DataFrame, **kwargs):